@@ -9,11 +9,13 @@ os.environ["TF_CPP_MIN_LOG_LEVEL"] = "2"
 
 from .io import *
 from .torch import *
-from .read_config import read_config
-from .load_system import load_system
+from .read_config import get_autotune_path, read_config
+from .load_system import load_system, load_model
 from .utils import *
 from .evaluation import *
 from .webknossos_utils import *
+from .blockwise import *
 from .predict import predict
+from .export import export
 from .segment import segment
 from .evaluation.validate_affinities import validate_affinities
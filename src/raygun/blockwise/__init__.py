@@ -0,0 +1,14 @@
+"""
+    Framework-agnostic helpers for blockwise processing with daisy
+"""
+from .occupancy import *
+from .ledger import *
+from .threads import *
+from .sampling import *
+from .pool import *
+from .chunk_cache import *
+from .ordering import *
+from .selection import *
+from .fragments import *
+from .pyramid import *
+from .write_planning import *
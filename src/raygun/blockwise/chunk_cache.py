@@ -0,0 +1,243 @@
+from glob import glob
+import hashlib
+import json
+import os
+import shutil
+import daisy
+import numpy as np
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+__all__ = [
+    "DEFAULT_CHUNK_CACHE_DIR",
+    "SharedChunkCache",
+    "reset_cache_stats",
+    "get_cache_stats",
+    "log_cache_stats",
+    "CachedArray",
+    "get_cache_key",
+    "open_cached_ds",
+    "clear_cached_ds",
+]
+
+DEFAULT_CHUNK_CACHE_DIR = "/dev/shm/raygun_chunk_cache"
+
+# Files whose modification marks a dataset as rewritten
+DATASET_METADATA_FILES = [".zarray", ".zattrs", "attributes.json"]
+
+
+class SharedChunkCache:
+    def __init__(
+        self,
+        max_gb=4,
+        cache_dir=DEFAULT_CHUNK_CACHE_DIR,
+        worker_name=None,
+        check_every=64,
+    ):
+        """Node-local cache of decompressed source chunks, shared by all processes using the same `cache_dir`.
+
+        Chunks are stored as .npy files (in /dev/shm by default, i.e. in memory) written atomically, so that any process on the node can map them. The least recently used chunks are evicted once the cache grows past `max_gb`. Hits and misses are written to "stats/<worker_name>.json" so that the orchestrator can report the hit rate of a whole run (see `get_cache_stats`).
+
+        Args:
+            max_gb (float, optional): Size of the cache, in GB. Defaults to 4.
+            cache_dir (str, optional): Directory of the cache. Defaults to "/dev/shm/raygun_chunk_cache".
+            worker_name (str, optional): Name of this process' statistics file. Defaults to the process ID.
+            check_every (int, optional): Number of chunks stored between checks of the cache size. Defaults to 64.
+        """
+        self.max_bytes = int(max_gb * 1024**3)
+        self.cache_dir = cache_dir
+        self.worker_name = worker_name
+        self.check_every = check_every
+        self.hits = 0
+        self.misses = 0
+        self.stored = 0
+        os.makedirs(os.path.join(cache_dir, "stats"), exist_ok=True)
+
+    def get_key_dir(self, key):
+        return os.path.join(
+            self.cache_dir, "chunks", hashlib.sha1(key.encode()).hexdigest()
+        )
+
+    def get_path(self, key, index):
+        return os.path.join(
+            self.get_key_dir(key), "_".join(str(int(i)) for i in index) + ".npy"
+        )
+
+    def get(self, key, index, read):
+        """Chunk `index` of the dataset `key`, from the cache or read with `read()` (and stored)."""
+        path = self.get_path(key, index)
+        try:
+            data = np.load(path, mmap_mode="r")
+            os.utime(path)  # mark as recently used
+            self.hits += 1
+        except (FileNotFoundError, ValueError):  # missing, or evicted while loading
+            data = read()
+            self.put(path, data)
+            self.misses += 1
+
+        if (self.hits + self.misses) % self.check_every == 0:
+            self.write_stats()
+        return data
+
+    def put(self, path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as f:
+            np.save(f, np.ascontiguousarray(data))
+        os.replace(temp_path, path)  # never expose a partial chunk to other processes
+
+        self.stored += 1
+        if self.stored % self.check_every == 0:
+            self.evict()
+
+    def evict(self):
+        """Remove the least recently used chunks until the cache fits its size."""
+        chunks = []
+        for path in glob(os.path.join(self.cache_dir, "chunks", "*", "*.npy")):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:  # evicted by another process
+                continue
+            chunks.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in chunks)
+        for _, size, path in sorted(chunks):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def write_stats(self):
+        # Resolved here so that processes forked with the cache keep separate statistics
+        worker_name = self.worker_name
+        if worker_name is None:
+            worker_name = str(os.getpid())
+        stats_file = os.path.join(self.cache_dir, "stats", f"{worker_name}.json")
+        with open(stats_file + ".tmp", "w") as f:
+            json.dump({"hits": self.hits, "misses": self.misses}, f)
+        os.replace(stats_file + ".tmp", stats_file)
+
+    def clear(self, key):
+        """Remove the cached chunks of the dataset `key`."""
+        shutil.rmtree(self.get_key_dir(key), ignore_errors=True)
+
+    def close(self):
+        self.write_stats()
+
+
+def reset_cache_stats(cache_dir=DEFAULT_CHUNK_CACHE_DIR):
+    """Forget the statistics of previous runs (cached chunks are kept)."""
+    for stats_file in glob(os.path.join(cache_dir, "stats", "*.json")):
+        os.remove(stats_file)
+
+
+def get_cache_stats(cache_dir=DEFAULT_CHUNK_CACHE_DIR):
+    """Hits and misses summed over all processes that used the cache since the last `reset_cache_stats`.
+
+    Returns:
+        tuple(int, int, float): Hits, misses and hit rate.
+    """
+    hits = misses = 0
+    for stats_file in glob(os.path.join(cache_dir, "stats", "*.json")):
+        with open(stats_file, "r") as f:
+            stats = json.load(f)
+        hits += stats["hits"]
+        misses += stats["misses"]
+    total = hits + misses
+    return hits, misses, hits / total if total > 0 else 0.0
+
+
+def log_cache_stats(cache_dir=DEFAULT_CHUNK_CACHE_DIR):
+    hits, misses, hit_rate = get_cache_stats(cache_dir)
+    logger.info(
+        f"Chunk cache: {hits} hits, {misses} misses ({100 * hit_rate:.1f}% hit rate)."
+    )
+
+
+class CachedArray:
+    def __init__(self, array, key, cache):
+        """Read a daisy array chunk by chunk through a `SharedChunkCache`, so that overlapping reads from any process on the node decompress each chunk once.
+
+        Other attributes are those of the wrapped array.
+
+        Args:
+            array (daisy.Array): Array opened with `daisy.open_ds`.
+            key (str): Unique name of the dataset (e.g. its container path and dataset name).
+            cache (SharedChunkCache): Cache to read through.
+        """
+        self.array = array
+        self.key = key
+        self.cache = cache
+        self.chunk_shape = daisy.Coordinate(
+            array.data.chunks[array.n_channel_dims :]
+        ) * array.voxel_size
+
+    def __getattr__(self, name):
+        if name == "array":  # not set yet (e.g. while unpickling)
+            raise AttributeError(name)
+        return getattr(self.array, name)
+
+    def to_ndarray(self, roi, fill_value=0):
+        """Same as `daisy.Array.to_ndarray`, filling the parts of `roi` outside the array with `fill_value`."""
+        voxel_size = self.array.voxel_size
+        data_roi = self.array.data_roi
+        origin = np.array(data_roi.get_begin())
+        chunk_shape = np.array(self.chunk_shape)
+
+        shape = self.array.data.shape[: self.array.n_channel_dims] + tuple(
+            roi.get_shape() / voxel_size
+        )
+        out = np.full(shape, fill_value, dtype=self.array.dtype)
+        channels = (slice(None),) * self.array.n_channel_dims
+
+        first = (np.array(roi.get_begin()) - origin) // chunk_shape
+        last = -((origin - np.array(roi.get_end())) // chunk_shape)  # ceil
+        for index in np.ndindex(*(last - first)):
+            index = first + np.array(index)
+            chunk_roi = daisy.Roi(
+                daisy.Coordinate(origin + index * chunk_shape), self.chunk_shape
+            )
+            if not chunk_roi.intersects(data_roi):  # outside the array
+                continue
+            chunk_roi = chunk_roi.intersect(data_roi)
+            overlap = chunk_roi.intersect(roi)
+
+            chunk = self.cache.get(
+                self.key, index, lambda: self.array.to_ndarray(chunk_roi)
+            )
+            src = (overlap.get_begin() - chunk_roi.get_begin()) / voxel_size
+            dst = (overlap.get_begin() - roi.get_begin()) / voxel_size
+            size = overlap.get_shape() / voxel_size
+            out[channels + tuple(slice(d, d + s) for d, s in zip(dst, size))] = chunk[
+                channels + tuple(slice(s, s + n) for s, n in zip(src, size))
+            ]
+
+        return out
+
+
+def get_cache_key(filename, ds_name):
+    """Key of a dataset in a `SharedChunkCache`: its path, and the modification times of its metadata and directory, so that a dataset rewritten in place is not read from stale chunks."""
+    path = os.path.join(os.path.realpath(filename), ds_name.strip("/"))
+    stamps = []
+    for file in [path] + [os.path.join(path, name) for name in DATASET_METADATA_FILES]:
+        if os.path.exists(file):
+            stamps.append(f"{os.path.basename(file)}@{os.stat(file).st_mtime_ns}")
+    return f"{path}:{','.join(stamps)}"
+
+
+def open_cached_ds(filename, ds_name, cache=None):
+    """Open a dataset with `daisy.open_ds`, reading through `cache` if given (and the dataset is chunked)."""
+    array = daisy.open_ds(filename, ds_name)
+    if cache is None or not hasattr(array.data, "chunks"):
+        return array
+    return CachedArray(array, get_cache_key(filename, ds_name), cache)
+
+
+def clear_cached_ds(filename, ds_name, cache_dir=DEFAULT_CHUNK_CACHE_DIR):
+    """Remove the cached chunks of a dataset, e.g. once a run reading it is complete."""
+    SharedChunkCache(cache_dir=cache_dir).clear(get_cache_key(filename, ds_name))
@@ -0,0 +1,307 @@
+from glob import glob
+import os
+import shutil
+import daisy
+import numpy as np
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+__all__ = [
+    "FRAGMENTS_DEFAULTS",
+    "get_fragments_config",
+    "get_edges_path",
+    "get_seg_datasets",
+    "aggregate_edges",
+    "get_pair_edges",
+    "get_fragment_edges",
+    "extract_fragments",
+    "save_block_edges",
+    "get_face_edges",
+    "relabel",
+    "agglomerate_fragments",
+    "reset_edges",
+]
+
+# Fragment extraction settings of a render config's "fragments"
+FRAGMENTS_DEFAULTS = {
+    "fragments_ds": "fragments",
+    "aff_ds": None,  # first output dataset
+    "write_affs": True,
+    "fragments_in_xy": False,
+    "min_seed_distance": 10,
+    "max_affinity_value": 1.0,
+    "thresholds": [round(t, 2) for t in np.arange(0.1, 0.9, 0.1)],
+    "seg_ds": "pred_seg",
+    "num_workers": 16,
+}
+
+
+def get_fragments_config(render_config):
+    """Fragment extraction settings of a render config with defaults filled in, or None if fragments are not extracted."""
+    if render_config.get("fragments") is None:
+        return None
+    fragments_config = FRAGMENTS_DEFAULTS.copy()
+    if isinstance(render_config["fragments"], dict):
+        fragments_config.update(render_config["fragments"])
+    return fragments_config
+
+
+def get_edges_path(dest_path, fragments_ds):
+    """Directory of the per-block fragment edges written next to a fragments dataset."""
+    name = fragments_ds.strip("/").replace("/", "-")
+    return os.path.join(dest_path, ".fragment_edges", name)
+
+
+def get_seg_datasets(fragments_config):
+    """Names of the segmentation datasets written by `agglomerate_fragments`, one per threshold."""
+    return [
+        f"{fragments_config['seg_ds']}_{'{:.2f}'.format(threshold)}"
+        for threshold in fragments_config["thresholds"]
+    ]
+
+
+def aggregate_edges(edges, sums, counts):
+    """Sum the affinities and counts of duplicate (undirected) edges.
+
+    Args:
+        edges (np.ndarray): Pairs of fragment IDs, shape (n, 2).
+        sums (np.ndarray): Sums of affinities along each edge.
+        counts (np.ndarray): Number of voxel pairs along each edge.
+
+    Returns:
+        tuple(np.ndarray, np.ndarray, np.ndarray): Unique edges, with their summed affinities and counts.
+    """
+    if len(edges) == 0:
+        return np.zeros((0, 2), dtype=np.uint64), np.zeros(0), np.zeros(0)
+    edges = np.sort(edges, axis=1)
+    edges, inverse = np.unique(edges, axis=0, return_inverse=True)
+    inverse = inverse.ravel()
+    return (
+        edges,
+        np.bincount(inverse, weights=sums, minlength=len(edges)),
+        np.bincount(inverse, weights=counts, minlength=len(edges)),
+    )
+
+
+def get_pair_edges(u, v, affs):
+    """Edges between the fragments of paired voxels `u` and `v`, scored by the affinities between them."""
+    u, v, affs = u.ravel(), v.ravel(), affs.ravel().astype(np.float64)
+    keep = (u != v) & (u != 0) & (v != 0)
+    return aggregate_edges(
+        np.stack([u[keep], v[keep]], axis=1), affs[keep], np.ones(keep.sum())
+    )
+
+
+def get_fragment_edges(fragments, affs):
+    """Edges between adjacent fragments of a block.
+
+    Affinities follow the usual [-1, 0, 0], [0, -1, 0], [0, 0, -1] neighborhood: channel `d` holds the affinity of each voxel to its neighbor one voxel before it along axis `d`.
+
+    Args:
+        fragments (np.ndarray): Fragment IDs, shape (z, y, x).
+        affs (np.ndarray): Affinities, shape (3, z, y, x).
+
+    Returns:
+        tuple(np.ndarray, np.ndarray, np.ndarray): Edges, with their summed affinities and counts.
+    """
+    results = []
+    for d in range(3):
+        after = [slice(None)] * 3
+        after[d] = slice(1, None)
+        before = [slice(None)] * 3
+        before[d] = slice(None, -1)
+        results.append(
+            get_pair_edges(
+                fragments[tuple(after)], fragments[tuple(before)], affs[d][tuple(after)]
+            )
+        )
+    return aggregate_edges(*[np.concatenate(r) for r in zip(*results)])
+
+
+def extract_fragments(
+    affs, write_roi, total_roi, voxel_size, fragments_config, block_shape=None
+):
+    """Watershed fragments of a block from its affinities, with IDs that are unique across blocks.
+
+    Args:
+        affs (np.ndarray): Affinities of the block in [0, max_affinity_value], shape (channels, z, y, x).
+        write_roi (daisy.Roi): ROI of the block.
+        total_roi (daisy.Roi): ROI of the whole render, to number the blocks.
+        voxel_size (daisy.Coordinate): Voxel size.
+        fragments_config (dict): See `get_fragments_config`.
+        block_shape (daisy.Coordinate, optional): Write shape of the task's blocks, of which blocks shrunk at the end of the volume are a part. Defaults to the shape of `write_roi`.
+
+    Returns:
+        np.ndarray: Fragments, as uint64.
+    """
+    from raygun.segment import watershed_from_affinities
+
+    fragments = watershed_from_affinities(
+        affs[:3],
+        max_affinity_value=fragments_config["max_affinity_value"],
+        fragments_in_xy=fragments_config["fragments_in_xy"],
+        min_seed_distance=fragments_config["min_seed_distance"],
+    )[0].astype(np.uint64)
+
+    # IDs of each block start after those of the blocks before it
+    if block_shape is None:
+        block_shape = write_roi.get_shape()
+    stride = np.array(block_shape)
+    block_shape = stride // np.array(voxel_size)
+    grid_shape = np.array(total_roi.get_shape()) // stride + 1
+    index = (np.array(write_roi.get_begin()) - np.array(total_roi.get_begin())) // stride
+    id_offset = np.uint64(np.ravel_multi_index(index, grid_shape)) * np.uint64(
+        np.prod(block_shape)
+    )
+    fragments[fragments > 0] += id_offset
+
+    return fragments
+
+
+def save_block_edges(path, write_roi, fragments, affs):
+    """Save the edges within a block, and the affinities of its lower faces to the blocks before it (see `agglomerate_fragments`)."""
+    edges, sums, counts = get_fragment_edges(fragments, affs)
+    faces = {
+        f"face_{d}": np.take(affs[d], 0, axis=d).astype(np.float32) for d in range(3)
+    }
+
+    os.makedirs(path, exist_ok=True)
+    name = "_".join(str(int(c)) for c in write_roi.get_begin())
+    file = os.path.join(path, f"{name}.npz")
+    with open(file + ".tmp", "wb") as f:
+        np.savez(
+            f,
+            begin=np.array(write_roi.get_begin()),
+            shape=np.array(write_roi.get_shape()),
+            edges=edges,
+            sums=sums,
+            counts=counts,
+            **faces,
+        )
+    os.replace(file + ".tmp", file)
+
+
+def get_face_edges(fragments, begin, shape, faces):
+    """Edges between a block's lower faces and the blocks before it, read from the fragments dataset."""
+    voxel_size = fragments.voxel_size
+    results = []
+    for d in range(3):
+        face_shape = list(shape)
+        face_shape[d] = voxel_size[d]
+        face = daisy.Roi(daisy.Coordinate(begin), daisy.Coordinate(face_shape))
+        shift = [0, 0, 0]
+        shift[d] = -voxel_size[d]
+        neighbor = face.shift(daisy.Coordinate(shift))
+        if not fragments.roi.contains(neighbor):
+            continue
+        results.append(
+            get_pair_edges(
+                fragments.to_ndarray(face),
+                fragments.to_ndarray(neighbor),
+                faces[f"face_{d}"],
+            )
+        )
+    if len(results) == 0:
+        return aggregate_edges(np.zeros((0, 2), dtype=np.uint64), [], [])
+    return aggregate_edges(*[np.concatenate(r) for r in zip(*results)])
+
+
+def relabel(fragments, ids, segment_ids, out):
+    """Write the segments of a block's fragments (fragments without edges keep their ID)."""
+    out[...] = fragments
+    if len(ids) == 0:
+        return out
+    lookup = np.searchsorted(ids, fragments)
+    lookup[lookup == len(ids)] = 0
+    found = ids[lookup] == fragments
+    out[found] = segment_ids[lookup[found]]
+    return out
+
+
+def agglomerate_fragments(dest_path, fragments_config, delete=True):
+    """Agglomerate the fragments extracted while rendering into one segmentation per threshold.
+
+    Edges are scored by their mean affinity, and fragments are merged wherever 1 - mean affinity falls below the threshold (the scale of `segment`'s thresholds).
+
+    Args:
+        dest_path (str): Container of the fragments.
+        fragments_config (dict): See `get_fragments_config`.
+        delete (bool, optional): Whether to delete existing segmentation datasets. Defaults to True.
+
+    Returns:
+        list(str): Names of the segmentation datasets.
+    """
+    fragments_ds = fragments_config["fragments_ds"]
+    fragments = daisy.open_ds(dest_path, fragments_ds)
+    edges_path = get_edges_path(dest_path, fragments_ds)
+
+    logger.info("Collecting fragment edges...")
+    results = []
+    for file in sorted(glob(os.path.join(edges_path, "*.npz"))):
+        block = np.load(file)
+        results.append((block["edges"], block["sums"], block["counts"]))
+        results.append(get_face_edges(fragments, block["begin"], block["shape"], block))
+    if len(results) == 0:
+        raise ValueError(f"No fragment edges found in {edges_path}.")
+    edges, sums, counts = aggregate_edges(*[np.concatenate(r) for r in zip(*results)])
+    scores = 1 - sums / np.maximum(counts, 1) / fragments_config["max_affinity_value"]
+    logger.info(f"Found {len(edges)} edges.")
+
+    ids, edges = np.unique(edges, return_inverse=True)
+    edges = edges.reshape(-1, 2)
+
+    seg_datasets = get_seg_datasets(fragments_config)
+    for threshold, seg_ds in zip(fragments_config["thresholds"], seg_datasets):
+        merge = scores < threshold
+        graph = coo_matrix(
+            (np.ones(merge.sum()), (edges[merge, 0], edges[merge, 1])),
+            shape=(len(ids), len(ids)),
+        )
+        num_components, components = connected_components(graph, directed=False)
+
+        # Segments are named after their smallest fragment, so they never collide with unmerged fragments
+        segment_ids = np.full(num_components, np.iinfo(np.uint64).max, np.uint64)
+        np.minimum.at(segment_ids, components, ids)
+        segment_ids = segment_ids[components]
+
+        write_size = daisy.Coordinate(fragments.data.chunks) * fragments.voxel_size
+        out = daisy.prepare_ds(
+            dest_path,
+            seg_ds,
+            fragments.roi,
+            fragments.voxel_size,
+            np.uint64,
+            write_size=write_size,
+            delete=delete,
+        )
+
+        def relabel_block(block):
+            data = fragments.to_ndarray(block.write_roi)
+            out[block.write_roi] = relabel(data, ids, segment_ids, np.empty_like(data))
+
+        block_roi = daisy.Roi((0,) * len(write_size), write_size)
+        task = daisy.Task(
+            f"relabel-{seg_ds}",
+            fragments.roi,
+            read_roi=block_roi,
+            write_roi=block_roi,
+            process_function=relabel_block,
+            read_write_conflict=False,
+            fit="shrink",
+            num_workers=fragments_config["num_workers"],
+            max_retries=2,
+        )
+        if not daisy.run_blockwise([task]):
+            raise ValueError(f"Failed to write {seg_ds}.")
+        logger.info(f"Wrote {dest_path}/{seg_ds}.")
+
+    return seg_datasets
+
+
+def reset_edges(dest_path, fragments_ds):
+    """Remove the fragment edges of a previous render."""
+    shutil.rmtree(get_edges_path(dest_path, fragments_ds), ignore_errors=True)
@@ -0,0 +1,100 @@
+from glob import glob
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+__all__ = ["get_block_key", "get_ledger_path", "get_fingerprint", "BlockLedger"]
+
+
+def get_block_key(block):
+    """Identify a block by the offset of its write ROI, which stays the same across restarts."""
+    return "_".join(str(int(c)) for c in block.write_roi.get_begin())
+
+
+def get_ledger_path(dest_path, output_ds):
+    """Location of the ledger for a render writing `output_ds` to `dest_path` (kept inside the destination container)."""
+    name = "+".join(ds.strip("/").replace("/", "-") for ds in output_ds)
+    return os.path.join(dest_path, ".ledgers", name)
+
+
+def get_fingerprint(*configs, files=[]):
+    """Hash configuration dictionaries together with the size and modification time of files (e.g. checkpoints), to detect when a render's inputs change.
+
+    Args:
+        *configs (dict): Configuration dictionaries to include.
+        files (list(str), optional): Paths of files to include. Missing files are ignored. Defaults to [].
+
+    Returns:
+        str: Hex digest of the fingerprint.
+    """
+    content = {"configs": configs, "files": {}}
+    for file in files:
+        if file is not None and os.path.exists(file):
+            stat = os.stat(file)
+            content["files"][os.path.realpath(file)] = [stat.st_size, stat.st_mtime]
+
+    return hashlib.sha1(
+        json.dumps(content, sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+
+class BlockLedger:
+    def __init__(self, path, worker_name=None):
+        """Durable record of finished blocks, used to resume interrupted blockwise tasks.
+
+        Each worker appends to its own log file (flushed and fsynced per block) inside the ledger directory, so concurrent workers never write to the same file.
+
+        Args:
+            path (str): Directory of the ledger.
+            worker_name (str, optional): Name of this worker's log file. Defaults to the process ID.
+        """
+        self.path = path
+        if worker_name is None:
+            worker_name = str(os.getpid())
+        self.log_file = os.path.join(path, f"{worker_name}.log")
+        self.fingerprint_file = os.path.join(path, "fingerprint.json")
+        self.lock = threading.Lock()
+        self.done = None
+        os.makedirs(path, exist_ok=True)
+
+    def load(self):
+        done = set()
+        for log_file in glob(os.path.join(self.path, "*.log")):
+            with open(log_file, "r") as f:
+                done.update(line.strip() for line in f if line.strip() != "")
+        return done
+
+    def is_done(self, block):
+        """Check function for daisy.Task. The ledger is read once, on the first call."""
+        if self.done is None:
+            self.done = self.load()
+            logger.info(f"Found {len(self.done)} finished blocks in {self.path}.")
+        return get_block_key(block) in self.done
+
+    def record(self, block):
+        with self.lock:
+            with open(self.log_file, "a") as f:
+                f.write(get_block_key(block) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+    def check_fingerprint(self, fingerprint):
+        """Check whether the ledger was made by a render with the same fingerprint."""
+        if not os.path.exists(self.fingerprint_file):
+            return False
+        with open(self.fingerprint_file, "r") as f:
+            return json.load(f)["fingerprint"] == fingerprint
+
+    def reset(self, fingerprint):
+        """Forget all finished blocks and start a new ledger for `fingerprint`."""
+        shutil.rmtree(self.path, ignore_errors=True)
+        os.makedirs(self.path, exist_ok=True)
+        with open(self.fingerprint_file, "w") as f:
+            json.dump({"fingerprint": fingerprint}, f)
+        self.done = set()
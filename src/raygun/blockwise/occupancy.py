@@ -0,0 +1,122 @@
+import daisy
+import numpy as np
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+__all__ = ["get_coefvar", "compute_occupancy", "check_occupancy", "is_empty"]
+
+
+def get_coefvar(data, factor):
+    """Coefficient of variation (std / mean) of each `factor`-sized cell of `data`, as used by gunpowder's RejectConstant.
+
+    Args:
+        data (np.ndarray): Array whose shape is divisible by `factor`.
+        factor (tuple(int)): Cell size along each axis.
+
+    Returns:
+        np.ndarray: Coefficient of variation per cell, 0 where the mean is 0.
+    """
+    shape = []
+    for s, f in zip(data.shape, factor):
+        shape += [s // f, f]
+    cells = data.reshape(shape).astype(np.float32)
+    axes = tuple(range(1, len(shape), 2))
+    mean = cells.mean(axis=axes)
+    std = cells.std(axis=axes)
+    return np.divide(std, mean, out=np.zeros_like(std), where=mean != 0)
+
+
+def compute_occupancy(
+    source,
+    dest_path,
+    ds_name,
+    factor,
+    num_workers=16,
+    block_shape=32,
+):
+    """Blockwise precompute a coarse coefficient of variation map of a source volume, used to skip empty (e.g. resin or outside-of-tissue) blocks during prediction.
+
+    Args:
+        source (daisy.Array): Source volume.
+        dest_path (str): Path of the zarr/n5 container to write the map to.
+        ds_name (str): Dataset name of the map.
+        factor (int or tuple(int)): Downsampling factor (in voxels) of the map relative to the source.
+        num_workers (int, optional): Number of daisy workers. Defaults to 16.
+        block_shape (int, optional): Side length of the blocks (in coarse voxels) to process at once. Defaults to 32.
+
+    Returns:
+        daisy.Array: The coarse coefficient of variation map.
+    """
+    if not isinstance(factor, (list, tuple)):
+        factor = (factor,) * len(source.voxel_size)
+    factor = daisy.Coordinate(factor)
+    voxel_size = source.voxel_size * factor
+    total_roi = source.data_roi.snap_to_grid(voxel_size, mode="grow")
+    block_roi = daisy.Roi((0,) * len(voxel_size), voxel_size * block_shape)
+
+    occupancy = daisy.prepare_ds(
+        dest_path,
+        ds_name,
+        total_roi,
+        voxel_size,
+        np.float32,
+        write_size=block_roi.get_shape(),
+        delete=True,
+    )
+
+    def process_block(block):
+        data = source.to_ndarray(block.write_roi, fill_value=0)
+        occupancy[block.write_roi] = get_coefvar(data, factor)
+
+    task = daisy.Task(
+        f"occupancy-{ds_name}",
+        total_roi,
+        read_roi=block_roi,
+        write_roi=block_roi,
+        process_function=process_block,
+        read_write_conflict=False,
+        fit="shrink",
+        num_workers=num_workers,
+        max_retries=2,
+    )
+
+    logger.info(f"Computing occupancy map {dest_path}/{ds_name}...")
+    if not daisy.run_blockwise([task]):
+        raise ValueError("Failed to compute occupancy map.")
+
+    # Only written once the map is complete, so that interrupted maps are recomputed
+    occupancy.data.attrs.update(get_occupancy_attrs(source, factor))
+
+    return occupancy
+
+
+def get_occupancy_attrs(source, factor):
+    """Attributes identifying the source and factor an occupancy map was computed from."""
+    if not isinstance(factor, (list, tuple)):
+        factor = (factor,) * len(source.voxel_size)
+    return {
+        "occupancy_factor": [int(f) for f in factor],
+        "source_roi": [
+            [int(c) for c in source.data_roi.get_offset()],
+            [int(c) for c in source.data_roi.get_shape()],
+        ],
+        "source_voxel_size": [int(c) for c in source.voxel_size],
+    }
+
+
+def check_occupancy(dest_path, ds_name, source, factor):
+    """Check whether an existing occupancy map was computed from `source` with `factor` (see `compute_occupancy`)."""
+    try:
+        attrs = daisy.open_ds(dest_path, ds_name).data.attrs
+    except (KeyError, RuntimeError, ValueError, FileNotFoundError):
+        return False
+    expected = get_occupancy_attrs(source, factor)
+    return all(attrs.get(key) == value for key, value in expected.items())
+
+
+def is_empty(occupancy, roi, min_coefvar):
+    """Check whether a region has no coarse voxel with a coefficient of variation of at least `min_coefvar`."""
+    roi = roi.snap_to_grid(occupancy.voxel_size, mode="grow")
+    return occupancy.to_ndarray(roi, fill_value=0).max() < min_coefvar
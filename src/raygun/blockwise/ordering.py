@@ -0,0 +1,188 @@
+import os
+import daisy
+from funlib.math import cantor_number
+import numpy as np
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+__all__ = ["BLOCK_ORDERS", "morton_key", "hilbert_key", "get_block_grid", "BlockOrder"]
+
+BLOCK_ORDERS = ["raster", "morton", "hilbert"]
+
+
+def morton_key(index, bits):
+    """Position of a grid index along the Morton (Z-order) curve."""
+    key = 0
+    for bit in reversed(range(bits)):
+        for i in index:
+            key = (key << 1) | ((int(i) >> bit) & 1)
+    return key
+
+
+def hilbert_key(index, bits):
+    """Position of a grid index along the Hilbert curve (J. Skilling, "Programming the Hilbert curve", 2004)."""
+    x = [int(i) for i in index]
+    n = len(x)
+
+    # Inverse undo of excess work
+    q = 1 << (bits - 1)
+    while q > 1:
+        p = q - 1
+        for i in range(n):
+            if x[i] & q:
+                x[0] ^= p
+            else:
+                t = (x[0] ^ x[i]) & p
+                x[0] ^= t
+                x[i] ^= t
+        q >>= 1
+
+    # Gray encode
+    for i in range(1, n):
+        x[i] ^= x[i - 1]
+    t = 0
+    q = 1 << (bits - 1)
+    while q > 1:
+        if x[n - 1] & q:
+            t ^= q - 1
+        q >>= 1
+    x = [c ^ t for c in x]
+
+    return morton_key(x, bits)
+
+
+def get_block_grid(total_roi, read_roi, write_roi, fit="valid"):
+    """Grid indices of the blocks daisy would process with fit="valid" (whose read ROI lies within `total_roi`) or fit="shrink" (also those overhanging its end, which get shrunk).
+
+    Returns:
+        np.ndarray: Block indices along each axis (one row per block), with the stride of the write ROI.
+    """
+    stride = np.array(write_roi.get_shape())
+    remaining = np.array(total_roi.get_shape()) - np.array(read_roi.get_end())
+    if fit == "shrink":
+        num_blocks = -(-remaining // stride) + 1
+    else:
+        num_blocks = remaining // stride + 1
+    if any(n <= 0 for n in num_blocks):
+        return np.zeros((0, len(stride)), dtype=int)
+    return np.array(list(np.ndindex(*num_blocks)), dtype=int)
+
+
+class BlockOrder:
+    def __init__(
+        self,
+        total_roi,
+        read_roi,
+        write_roi,
+        order="hilbert",
+        center_out=False,
+        select=None,
+        grid=None,
+        fit="valid",
+    ):
+        """Blocks of a daisy task sorted along a space-filling curve, so that blocks processed at the same time are neighbours and share source chunks.
+
+        Daisy hands out the blocks of a 1D task in index order, so running `get_task_rois` as the task and mapping each of its blocks to a real block with `get_block` processes them in this order.
+
+        Args:
+            total_roi (daisy.Roi): Total ROI of the task.
+            read_roi (daisy.Roi): Read ROI of a block.
+            write_roi (daisy.Roi): Write ROI of a block.
+            order (str, optional): "raster" (daisy's own order), "morton" or "hilbert". Defaults to "hilbert".
+            center_out (bool, optional): Whether to process blocks in shells of increasing distance to the center of the volume (each shell in curve order), e.g. to see the most relevant region first. Defaults to False.
+            select (callable, optional): Takes the write ROI of a block and returns whether to process it (e.g. a `BlockSelection`). Defaults to all blocks.
+            grid (np.ndarray, optional): Ordered block indices saved from a previous BlockOrder (see `save`), instead of computing them. Defaults to None.
+            fit (str, optional): Daisy's fit of the blocks to `total_roi`: "valid", or "shrink" to also process the blocks overhanging its end, shrunk to fit. Defaults to "valid".
+        """
+        if order not in BLOCK_ORDERS:
+            raise ValueError(
+                f"Unknown block order {order}, expected one of {BLOCK_ORDERS}."
+            )
+
+        self.total_roi = total_roi
+        self.read_roi = read_roi
+        self.write_roi = write_roi
+        self.fit = fit
+
+        if grid is not None:
+            self.grid = list(grid)
+            return
+
+        grid = get_block_grid(total_roi, read_roi, write_roi, fit)
+        if select is not None:
+            keep = np.array([select(self.get_write_roi(i)) for i in grid], dtype=bool)
+            grid = grid[keep]
+        bits = max(1, int(np.ceil(np.log2(grid.max(initial=0) + 1))))
+        if order == "morton":
+            keys = [morton_key(index, bits) for index in grid]
+        elif order == "hilbert":
+            keys = [hilbert_key(index, bits) for index in grid]
+        else:
+            keys = list(range(len(grid)))
+
+        if center_out and len(grid) > 0:
+            center = (grid.max(axis=0) + grid.min(axis=0)) / 2
+            shells = np.ceil(np.abs(grid - center).max(axis=1)).astype(int)
+            keys = list(zip(shells, keys))
+
+        self.grid = [grid[i] for i in sorted(range(len(grid)), key=lambda i: keys[i])]
+
+    def __len__(self):
+        return len(self.grid)
+
+    def save(self, path):
+        """Save the ordered block indices, e.g. for workers to load with `grid=np.load(path)`."""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".tmp", "wb") as f:
+            np.save(f, np.array(self.grid, dtype=int).reshape(len(self), -1))
+        os.replace(path + ".tmp", path)
+
+    def get_shift(self, index):
+        return daisy.Coordinate(
+            np.array(self.total_roi.get_begin())
+            + np.array(index) * np.array(self.write_roi.get_shape())
+        )
+
+    def get_rois(self, index):
+        """Read and write ROIs of the block at grid `index`, shrunk where they overhang the total ROI (with fit="shrink")."""
+        shift = self.get_shift(index)
+        read_roi = self.read_roi.shift(shift)
+        write_roi = self.write_roi.shift(shift)
+        if self.fit == "shrink":
+            excess = daisy.Coordinate(
+                tuple(
+                    max(0, e - t)
+                    for e, t in zip(read_roi.get_end(), self.total_roi.get_end())
+                )
+            )
+            read_roi = daisy.Roi(read_roi.get_begin(), read_roi.get_shape() - excess)
+            write_roi = daisy.Roi(write_roi.get_begin(), write_roi.get_shape() - excess)
+        return read_roi, write_roi
+
+    def get_write_roi(self, index):
+        return self.get_rois(index)[1]
+
+    def get_task_rois(self):
+        """Total, read and write ROIs of the 1D task with one block per position along the curve."""
+        return (
+            daisy.Roi((0,), (len(self),)),
+            daisy.Roi((0,), (1,)),
+            daisy.Roi((0,), (1,)),
+        )
+
+    def get_block(self, block):
+        """Real block at the position of a block of the 1D task (see `get_task_rois`).
+
+        Its ID is that of the full-size block at its grid index, as daisy would number it, so that blocks shrunk at the end of the total ROI keep distinct IDs.
+        """
+        index = self.grid[int(block.write_roi.get_begin()[0])]
+        read_roi, write_roi = self.get_rois(index)
+        return daisy.Block(
+            self.total_roi,
+            read_roi,
+            write_roi,
+            block_id=int(cantor_number([int(i) for i in index])),
+            task_id=block.task_id,
+        )
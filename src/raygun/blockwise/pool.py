@@ -0,0 +1,128 @@
+import multiprocessing.connection
+import os
+import secrets
+import tempfile
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+__all__ = [
+    "POOL_AUTHKEY_ENV",
+    "DAISY_CONTEXT_ENV",
+    "DEFAULT_POOL_ADDRESS",
+    "DEFAULT_POOL_AUTHKEY_FILE",
+    "LOCAL_HOSTS",
+    "get_pool_address",
+    "check_pool_address",
+    "get_pool_authkey",
+    "submit_job",
+]
+
+# Shared by the worker pool service and the jobs submitted to it
+POOL_AUTHKEY_ENV = "RAYGUN_POOL_AUTHKEY"
+DAISY_CONTEXT_ENV = "DAISY_CONTEXT"
+DEFAULT_POOL_ADDRESS = os.path.join(
+    tempfile.gettempdir(), f"raygun_worker_pool_{os.getuid()}.sock"
+)
+DEFAULT_POOL_AUTHKEY_FILE = os.path.join(
+    os.path.expanduser("~"), ".raygun", "pool_authkey"
+)
+LOCAL_HOSTS = ["localhost", "127.0.0.1", "::1"]
+
+
+def get_pool_address(address=None):
+    """Parse a worker pool address: "host:port" for TCP, or a path for a Unix socket (defaults to a socket in the temporary directory, private to this user)."""
+    if address is None or address is True:
+        return DEFAULT_POOL_ADDRESS
+    if isinstance(address, (list, tuple)):
+        return tuple(address)
+    host, sep, port = address.rpartition(":")
+    if sep and port.isdigit():
+        return (host, int(port))
+    return address
+
+
+def check_pool_address(address, allow_remote=False):
+    """Raise a ValueError if a pool would listen for TCP connections from other hosts, unless `allow_remote` is set."""
+    address = get_pool_address(address)
+    if isinstance(address, tuple) and address[0] not in LOCAL_HOSTS:
+        if not allow_remote:
+            raise ValueError(
+                f"Refusing to listen on {address[0]}: anyone who can reach it and knows the pool's key can run code on this node. Use a Unix socket or localhost, or allow remote connections explicitly."
+            )
+        logger.warning(f"Worker pool accepting connections on {address[0]}.")
+    return address
+
+
+def get_pool_authkey(create=False, authkey_file=DEFAULT_POOL_AUTHKEY_FILE):
+    """Key authenticating the jobs submitted to a worker pool: RAYGUN_POOL_AUTHKEY if set, or else a random key kept in a file only its owner can read.
+
+    Args:
+        create (bool, optional): Whether to generate the key file if it does not exist (done by the pool). Defaults to False.
+        authkey_file (str, optional): Path of the key file. Defaults to DEFAULT_POOL_AUTHKEY_FILE.
+
+    Returns:
+        bytes: The key.
+    """
+    if os.environ.get(POOL_AUTHKEY_ENV):
+        return os.environ[POOL_AUTHKEY_ENV].encode()
+
+    if not os.path.exists(authkey_file):
+        if not create:
+            raise RuntimeError(
+                f"No worker pool key found: set {POOL_AUTHKEY_ENV}, or start the pool with raygun-worker-pool to generate {authkey_file}."
+            )
+        os.makedirs(os.path.dirname(authkey_file), mode=0o700, exist_ok=True)
+        try:
+            fd = os.open(authkey_file, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        except FileExistsError:  # created by another pool in the meantime
+            pass
+        else:
+            with os.fdopen(fd, "w") as f:
+                f.write(secrets.token_hex(32))
+            logger.info(f"Wrote a new worker pool key to {authkey_file}.")
+
+    if os.stat(authkey_file).st_mode & 0o077:
+        raise RuntimeError(
+            f"Worker pool key {authkey_file} is readable by other users, refusing to use it (chmod 600 it)."
+        )
+    with open(authkey_file, "r") as f:
+        return f.read().strip().encode()
+
+
+def submit_job(address, render_config_path, timeout=None):
+    """Run a daisy worker on a warm worker pool instead of in this process, and wait for it to finish.
+
+    Meant to be used as a daisy process function: the pool's worker connects to the scheduler with this process' DAISY_CONTEXT. Raising (e.g. when the pool loses the job) lets daisy retry the worker's blocks. On timeout, the job is cancelled, so that the pool stops working for a worker daisy considers gone.
+
+    Args:
+        address (str or tuple): Address of the pool (see `get_pool_address`).
+        render_config_path (str): Path to the render configuration.
+        timeout (float, optional): Seconds to wait for the job before giving up on it. Defaults to None (wait as long as the pool is up).
+    """
+    connection = multiprocessing.connection.Client(
+        get_pool_address(address), authkey=get_pool_authkey()
+    )
+    try:
+        connection.send(
+            {
+                "render_config_path": render_config_path,
+                "daisy_context": os.environ[DAISY_CONTEXT_ENV],
+            }
+        )
+        if timeout is not None and not connection.poll(timeout):
+            try:
+                connection.send("cancel")  # the pool stops the job's process
+            except OSError:
+                pass
+            raise TimeoutError(f"Worker pool job timed out after {timeout} seconds.")
+        try:
+            status, message = connection.recv()
+        except EOFError:
+            raise RuntimeError("Worker pool closed the connection before finishing the job.")
+    finally:
+        connection.close()
+
+    if status != "done":
+        raise RuntimeError(f"Worker pool job failed:\n{message}")
@@ -0,0 +1,195 @@
+import daisy
+import numpy as np
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+__all__ = [
+    "PYRAMID_MODES",
+    "get_level_ds",
+    "get_pyramid_factor",
+    "get_pyramid_mode",
+    "downsample",
+    "check_pyramid",
+    "Pyramid",
+    "prepare_pyramid",
+    "open_pyramid",
+]
+
+PYRAMID_MODES = ["mean", "mode"]
+
+
+def get_level_ds(dataset, level):
+    """Name of the dataset holding `level` of the pyramid of `dataset` (level 0 being `dataset` itself)."""
+    return dataset if level == 0 else f"{dataset}_s{level}"
+
+
+def get_pyramid_factor(factor, ndims):
+    """Downsampling factor per axis (z, y, x): a single factor only applies to the spatial axes of `ndims`-dimensional networks."""
+    if isinstance(factor, int):
+        factor = (1,) * (3 - ndims) + (factor,) * ndims
+    return daisy.Coordinate(factor)
+
+
+def get_pyramid_mode(render_config, dataset):
+    """Downsampling mode of an output dataset: "pyramid_mode" of the render config, either a single mode or one per dataset (defaulting to "mean")."""
+    mode = render_config.get("pyramid_mode", "mean")
+    if isinstance(mode, dict):
+        return mode.get(dataset, "mean")
+    return mode
+
+
+def downsample(data, factor, mode="mean", n_channel_dims=0):
+    """Downsample an array by integer factors.
+
+    Args:
+        data (np.ndarray): Array, with spatial dimensions divisible by `factor`.
+        factor (tuple(int)): Factor per spatial dimension.
+        mode (str, optional): "mean" (e.g. for intensities or affinities), or "mode" (the most frequent value, e.g. for labels). Defaults to "mean".
+        n_channel_dims (int, optional): Number of leading channel dimensions, which are not downsampled. Defaults to 0.
+
+    Returns:
+        np.ndarray: Downsampled array of the same dtype.
+    """
+    channels = data.shape[:n_channel_dims]
+    spatial = data.shape[n_channel_dims:]
+    shape = tuple(s // f for s, f in zip(spatial, factor))
+
+    # Split each spatial dimension into (blocks, factor), and move the factors last
+    split = channels + tuple(x for s, f in zip(shape, factor) for x in (s, f))
+    data = data.reshape(split)
+    axes = list(range(n_channel_dims))
+    axes += [n_channel_dims + 2 * i for i in range(len(factor))]
+    axes += [n_channel_dims + 2 * i + 1 for i in range(len(factor))]
+    windows = data.transpose(axes).reshape(channels + shape + (-1,))
+
+    if mode == "mean":
+        out = windows.mean(axis=-1)
+        if np.issubdtype(windows.dtype, np.integer):
+            out = np.rint(out)
+        return out.astype(windows.dtype)
+
+    elif mode == "mode":
+        windows = np.sort(windows, axis=-1)
+        counts = np.stack(
+            [
+                (windows == windows[..., i : i + 1]).sum(axis=-1)
+                for i in range(windows.shape[-1])
+            ],
+            axis=-1,
+        )
+        return np.take_along_axis(
+            windows, counts.argmax(axis=-1)[..., None], axis=-1
+        )[..., 0]
+
+    else:
+        raise ValueError(
+            f"Unknown downsampling mode {mode}, expected one of {PYRAMID_MODES}."
+        )
+
+
+def check_pyramid(write_roi, total_roi, voxel_size, factor, levels):
+    """Raise a ValueError unless every block writes whole voxels (and chunks) at each level of a pyramid."""
+    coarsest = voxel_size * daisy.Coordinate(tuple(f**levels for f in factor))
+    if any(s % c != 0 for s, c in zip(write_roi.get_shape(), coarsest)):
+        raise ValueError(
+            f"Write size {write_roi.get_shape()} is not divisible by the coarsest voxel size {coarsest} of the pyramid."
+        )
+    begin = total_roi.get_begin() + write_roi.get_begin()
+    if any(b % c != 0 for b, c in zip(begin, coarsest)):
+        raise ValueError(
+            f"Blocks start at {begin}, which is not aligned to the coarsest voxel size {coarsest} of the pyramid."
+        )
+
+
+class Pyramid:
+    def __init__(self, levels, factor, mode="mean"):
+        """Coarser scales of an output dataset, written from each block's output in memory.
+
+        Each block writes exactly one chunk of each level, so blocks never read or modify each other's chunks (see `prepare_pyramid`).
+
+        Args:
+            levels (list(daisy.Array)): Levels 1, 2, ... of the pyramid.
+            factor (daisy.Coordinate): Downsampling factor between levels.
+            mode (str, optional): See `downsample`. Defaults to "mean".
+        """
+        self.levels = levels
+        self.factor = factor
+        self.mode = mode
+
+    def write(self, write_roi, data):
+        """Downsample a block's output (in the layout written to level 0) and write it to every level."""
+        for level in self.levels:
+            data = downsample(data, self.factor, self.mode, level.n_channel_dims)
+            level[write_roi] = data
+
+
+def prepare_pyramid(
+    dest_path,
+    dataset,
+    levels,
+    factor,
+    write_roi,
+    total_roi,
+    mode="mean",
+    delete=True,
+):
+    """Prepare the levels of a pyramid of an output dataset, with one chunk per block (see `Pyramid`).
+
+    Args:
+        dest_path (str): Container of the dataset.
+        dataset (str): Name of the output dataset (level 0), already prepared.
+        levels (int): Number of coarser levels.
+        factor (daisy.Coordinate): Downsampling factor between levels.
+        write_roi (daisy.Roi): Write ROI of a block.
+        total_roi (daisy.Roi): Total ROI of the task.
+        mode (str, optional): See `downsample`. Defaults to "mean".
+        delete (bool, optional): Whether to delete existing levels. Defaults to True.
+
+    Returns:
+        Pyramid: The prepared levels.
+    """
+    base = daisy.open_ds(dest_path, dataset)
+    check_pyramid(write_roi, total_roi, base.voxel_size, factor, levels)
+    num_channels = base.data.shape[0] if base.n_channel_dims > 0 else None
+    # Chunks start where the blocks do, and levels cover whole voxels of the coarsest one
+    begin = total_roi.get_begin() + write_roi.get_begin()
+    coarsest = base.voxel_size * daisy.Coordinate(tuple(f**levels for f in factor))
+    level_roi = daisy.Roi(
+        begin,
+        daisy.Coordinate(
+            tuple(
+                (e - b) // c * c
+                for e, b, c in zip(base.roi.get_end(), begin, coarsest)
+            )
+        ),
+    )
+
+    arrays = []
+    voxel_size = base.voxel_size
+    for level in range(1, levels + 1):
+        voxel_size = voxel_size * factor
+        arrays.append(
+            daisy.prepare_ds(
+                dest_path,
+                get_level_ds(dataset, level),
+                level_roi,
+                voxel_size,
+                base.dtype,
+                write_size=write_roi.get_shape(),
+                num_channels=num_channels,
+                delete=delete,
+            )
+        )
+
+    return Pyramid(arrays, factor, mode)
+
+
+def open_pyramid(dest_path, dataset, levels, factor, mode="mean"):
+    """Open the levels of a pyramid prepared with `prepare_pyramid` for writing."""
+    arrays = [
+        daisy.open_ds(dest_path, get_level_ds(dataset, level), "a")
+        for level in range(1, levels + 1)
+    ]
+    return Pyramid(arrays, factor, mode)
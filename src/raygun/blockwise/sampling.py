@@ -0,0 +1,37 @@
+import daisy
+import numpy as np
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+__all__ = ["sample_blocks"]
+
+
+def sample_blocks(source, read_shape, num_blocks, seed=42):
+    """Read randomly placed blocks of the source.
+
+    Args:
+        source (daisy.Array): Source dataset.
+        read_shape (tuple(int)): Shape of each block, in voxels.
+        num_blocks (int): Number of blocks.
+        seed (int, optional): Random seed, so that the same blocks are used each time. Defaults to 42.
+
+    Returns:
+        list(np.ndarray): Raw blocks.
+    """
+    rng = np.random.default_rng(seed)
+    roi_shape = daisy.Coordinate(read_shape) * source.voxel_size
+    max_offset = (source.roi.get_shape() - roi_shape) / source.voxel_size
+    if any(m < 0 for m in max_offset):
+        raise ValueError(f"Source {source.roi} is smaller than a block {roi_shape}.")
+
+    datas = []
+    for _ in range(num_blocks):
+        offset = daisy.Coordinate(
+            int(o) for o in rng.integers(0, np.array(max_offset) + 1)
+        )
+        roi = daisy.Roi(source.roi.get_begin() + offset * source.voxel_size, roi_shape)
+        datas.append(source.to_ndarray(roi))
+
+    return datas
@@ -0,0 +1,79 @@
+import daisy
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+__all__ = [
+    "parse_rois",
+    "BlockSelection",
+    "get_roi_mask_source",
+    "get_block_selection",
+]
+
+
+def parse_rois(rois):
+    """Parse ROIs given as [offset, shape] pairs in world units (e.g. from a render config)."""
+    return [
+        daisy.Roi(daisy.Coordinate(offset), daisy.Coordinate(shape))
+        for offset, shape in rois
+    ]
+
+
+class BlockSelection:
+    def __init__(self, rois=None, mask=None):
+        """Select the blocks that intersect a list of ROIs, or the non-zero voxels of a mask dataset.
+
+        Args:
+            rois (list(daisy.Roi), optional): ROIs to keep. Defaults to None.
+            mask (daisy.Array, optional): Mask of the voxels to keep. Defaults to None.
+        """
+        if rois is None and mask is None:
+            raise ValueError("Select blocks with ROIs, a mask, or both.")
+        self.rois = rois
+        self.mask = mask
+
+    def __call__(self, write_roi):
+        """Whether to keep the block writing `write_roi`."""
+        if self.rois is not None:
+            if any(roi.intersects(write_roi) for roi in self.rois):
+                return True
+
+        if self.mask is not None and self.mask.roi.intersects(write_roi):
+            # Snap to the mask's voxels, which may be coarser than the block's
+            roi = write_roi.intersect(self.mask.roi).snap_to_grid(
+                self.mask.voxel_size, mode="grow"
+            )
+            roi = roi.intersect(self.mask.roi)
+            return bool(self.mask.to_ndarray(roi).any())
+
+        return False
+
+
+def get_roi_mask_source(render_config):
+    """Container path and dataset of the "roi_mask" of a render config, or None."""
+    roi_mask = render_config.get("roi_mask")
+    if roi_mask is None:
+        return None
+    if isinstance(roi_mask, str):
+        return render_config["source_path"], roi_mask
+    return roi_mask["path"], roi_mask["dataset"]
+
+
+def get_block_selection(render_config):
+    """Selection of the blocks to render from "rois" and "roi_mask" in a render config, or None to render all blocks.
+
+    "rois" is a list of [offset, shape] pairs in world units, and "roi_mask" a dictionary with the "path" and "dataset" of a mask (or just the name of a dataset in the source container).
+    """
+    rois = render_config.get("rois")
+    roi_mask = render_config.get("roi_mask")
+    if rois is None and roi_mask is None:
+        return None
+
+    if rois is not None:
+        rois = parse_rois(rois)
+    mask = None
+    if roi_mask is not None:
+        mask = daisy.open_ds(*get_roi_mask_source(render_config))
+
+    return BlockSelection(rois, mask)
@@ -0,0 +1,79 @@
+import os
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+__all__ = [
+    "THREADS_ENV",
+    "WORKERS_ENV",
+    "get_available_cpus",
+    "get_thread_budget",
+    "get_worker_cpus",
+    "get_thread_splits",
+]
+
+# Set by the orchestrator (e.g. after calibration) and inherited by worker processes
+THREADS_ENV = "RAYGUN_THREADS_PER_WORKER"
+WORKERS_ENV = "RAYGUN_WORKERS_PER_NODE"
+
+
+def get_available_cpus():
+    """CPUs this process may run on (respecting affinity masks set by cluster schedulers)."""
+    try:
+        return sorted(os.sched_getaffinity(0))
+    except AttributeError:  # not available on all platforms
+        return list(range(os.cpu_count()))
+
+
+def get_thread_budget(threads_per_worker="auto", workers_per_node=1, cpus=None):
+    """Split the available CPUs between the workers on a node.
+
+    Values exported by the orchestrator through RAYGUN_THREADS_PER_WORKER and RAYGUN_WORKERS_PER_NODE take precedence.
+
+    Args:
+        threads_per_worker (int, str or None, optional): Number of threads per worker, "auto" to split the CPUs evenly, or None to leave the framework default. Defaults to "auto".
+        workers_per_node (int, optional): Number of workers sharing the node. Defaults to 1.
+        cpus (list(int), optional): CPUs to split. Defaults to all available CPUs.
+
+    Returns:
+        tuple(int, int or None): Workers per node and threads per worker.
+    """
+    if WORKERS_ENV in os.environ:
+        workers_per_node = int(os.environ[WORKERS_ENV])
+    if THREADS_ENV in os.environ:
+        threads_per_worker = int(os.environ[THREADS_ENV])
+
+    if threads_per_worker == "auto":
+        if cpus is None:
+            cpus = get_available_cpus()
+        threads_per_worker = max(1, len(cpus) // max(1, workers_per_node))
+        if workers_per_node > len(cpus):
+            logger.warning(
+                f"{workers_per_node} workers oversubscribe the {len(cpus)} available CPUs."
+            )
+
+    return workers_per_node, threads_per_worker
+
+
+def get_worker_cpus(worker_index, threads_per_worker, workers_per_node, cpus=None):
+    """Disjoint set of CPUs to pin a worker to (wrapping around if there are more workers than fit)."""
+    if cpus is None:
+        cpus = get_available_cpus()
+    start = (worker_index % max(1, workers_per_node)) * threads_per_worker
+    return [cpus[(start + i) % len(cpus)] for i in range(threads_per_worker)]
+
+
+def get_thread_splits(cpus=None, max_workers=None):
+    """Candidate (workers, threads per worker) splits of the CPUs for calibration, with threads in powers of two."""
+    if cpus is None:
+        cpus = get_available_cpus()
+    splits = []
+    threads = 1
+    while threads <= len(cpus):
+        workers = len(cpus) // threads
+        if max_workers is not None:
+            workers = min(workers, max_workers)
+        splits.append((workers, threads))
+        threads *= 2
+    return splits
@@ -0,0 +1,126 @@
+from math import gcd
+import daisy
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+__all__ = [
+    "get_chunk_shape",
+    "plan_output_roi",
+    "plan_chunk_shape",
+    "plan_write_size",
+    "check_write_alignment",
+]
+
+
+def get_chunk_shape(array):
+    """Spatial chunk shape of a daisy array in world units, or None if it is not chunked."""
+    chunks = getattr(array.data, "chunks", None)
+    if chunks is None:
+        return None
+    return daisy.Coordinate(chunks[array.n_channel_dims :]) * array.voxel_size
+
+
+def plan_output_roi(total_roi, read_roi, write_roi):
+    """ROI written by the blocks of a daisy task with fit="valid", which starts at the first block's write ROI.
+
+    Preparing outputs over this ROI anchors their chunk grid on the block grid, so blocks whose write size is a multiple of the chunk shape never share chunks.
+
+    Args:
+        total_roi (daisy.Roi): Total ROI of the task.
+        read_roi (daisy.Roi): Read ROI of a block.
+        write_roi (daisy.Roi): Write ROI of a block.
+
+    Returns:
+        daisy.Roi: Union of the blocks' write ROIs.
+    """
+    stride = write_roi.get_shape()
+    num_blocks = [
+        (t - r) // s + 1
+        for t, r, s in zip(total_roi.get_shape(), read_roi.get_end(), stride)
+    ]
+    if any(n <= 0 for n in num_blocks):
+        raise ValueError(f"{total_roi} is smaller than a block {read_roi}.")
+    return daisy.Roi(
+        total_roi.get_begin() + write_roi.get_begin(),
+        daisy.Coordinate(tuple(n * s for n, s in zip(num_blocks, stride))),
+    )
+
+
+def plan_chunk_shape(write_shape, voxel_size, chunk_shape=None, name=None, offset=None):
+    """Chunk shape of an output written in blocks of `write_shape`: the requested `chunk_shape` if it tiles a block, or else the largest shape that tiles both (with a warning).
+
+    Args:
+        write_shape (daisy.Coordinate): Write shape of a block, in world units.
+        voxel_size (daisy.Coordinate): Voxel size of the output.
+        chunk_shape (daisy.Coordinate, optional): Requested chunk shape, in world units. Defaults to `write_shape`.
+        name (str, optional): Name of the output, for the warning. Defaults to None.
+        offset (daisy.Coordinate, optional): Offset of the first block's write ROI from the start of the output (e.g. the context of blocks written into an output prepared over the whole source), which chunks must divide too. Defaults to None.
+
+    Returns:
+        daisy.Coordinate: Chunk shape, in world units.
+    """
+    write_shape = daisy.Coordinate(write_shape)
+    if offset is None:
+        offset = daisy.Coordinate((0,) * len(write_shape))
+    if chunk_shape is None:
+        chunk_shape = write_shape
+    chunk_shape = daisy.Coordinate(chunk_shape)
+    if all(
+        w % c == 0 and o % c == 0
+        for w, o, c in zip(write_shape, offset, chunk_shape)
+    ):
+        return chunk_shape
+
+    planned = daisy.Coordinate(
+        tuple(
+            gcd(gcd(int(w // v), int(c // v)), int(o // v)) * v
+            for w, o, c, v in zip(write_shape, offset, chunk_shape, voxel_size)
+        )
+    )
+    logger.warning(
+        f"Chunks {chunk_shape} of {name} do not tile blocks of {write_shape} starting {offset} into it, using {planned} instead so that blocks never share chunks."
+    )
+    return planned
+
+
+def plan_write_size(chunk_shape, min_shape=None):
+    """Smallest multiple of `chunk_shape` (in world units) that is at least `min_shape` along each axis."""
+    chunk_shape = daisy.Coordinate(chunk_shape)
+    if min_shape is None:
+        return chunk_shape
+    return daisy.Coordinate(
+        tuple(max(1, -(-m // c)) * c for m, c in zip(min_shape, chunk_shape))
+    )
+
+
+def check_write_alignment(array, write_roi, total_roi, name=None):
+    """Check that the blocks of a task write whole chunks of `array`, warning about any misalignment.
+
+    Args:
+        array (daisy.Array): Destination.
+        write_roi (daisy.Roi): Write ROI of a block.
+        total_roi (daisy.Roi): Total ROI of the task.
+        name (str, optional): Name of the destination, for the warning. Defaults to None.
+
+    Returns:
+        bool: Whether blocks are aligned to chunks (always True if the destination is not chunked).
+    """
+    chunk_shape = get_chunk_shape(array)
+    if chunk_shape is None:
+        return True
+
+    problems = []
+    if any(w % c != 0 for w, c in zip(write_roi.get_shape(), chunk_shape)):
+        problems.append(f"write size {write_roi.get_shape()} is not a multiple of it")
+    offset = total_roi.get_begin() + write_roi.get_begin() - array.data_roi.get_begin()
+    if any(o % c != 0 for o, c in zip(offset, chunk_shape)):
+        problems.append(f"blocks start {offset} from the chunk grid")
+
+    if len(problems) > 0:
+        logger.warning(
+            f"Blocks are not aligned to the chunks {chunk_shape} of {name} ({', and '.join(problems)}): workers will read-modify-write shared chunks."
+        )
+        return False
+    return True
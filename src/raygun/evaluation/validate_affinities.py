@@ -11,6 +11,8 @@ import numpy as np
 from funlib.evaluate import rand_voi
 from raygun.evaluation.skeleton import rasterize_skeleton
 from raygun import predict, read_config, segment
+from raygun.blockwise import get_fragments_config, get_seg_datasets
+from raygun.predict import get_dest_path
 
 import logging
 
@@ -113,10 +115,19 @@ def validate_segmentation(config=None):
     else:
         crop = None
 
-    try:  # TODO: Figure out why this is necessary and fix
-        seg = segment(config["segment_config"])
-    except:
-        seg = segment.segment(config["segment_config"])
+    # Segmentations agglomerated while predicting (see "fragments" in the render config)
+    prediction_config = read_config(config["prediction_config_path"])
+    fragments_config = get_fragments_config(prediction_config)
+    if fragments_config is not None:
+        seg_ds = get_seg_datasets(fragments_config)[0]
+        logger.info(f"Loading {seg_ds}...")
+        seg = daisy.open_ds(get_dest_path(prediction_config), seg_ds)
+        seg = seg.to_ndarray(seg.roi)
+    else:
+        try:  # TODO: Figure out why this is necessary and fix
+            seg = segment(config["segment_config"])
+        except:
+            seg = segment.segment(config["segment_config"])
     image = rasterize_skeleton(config["skeleton_config"])
     logger.info("Evaluating...")
     evaluation = pad_eval(seg, image, crop=crop)
@@ -0,0 +1,33 @@
+from importlib import import_module
+import sys
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+from raygun import read_config
+from raygun.predict import get_render_targets
+
+
+def export(render_config_path=None):
+    """Export the networks of a render configuration for graph-optimised runtimes (available through CLI as raygun-export)
+
+    Args:
+        render_config_path (str, optional): Path to json file for predicting configuration. Defaults to command line argument.
+    """
+    if render_config_path is None:
+        render_config_path = sys.argv[1]
+
+    render_config = {"net_name": None, "output_ds": None, "ensemble": None}
+    render_config.update(read_config(render_config_path))
+    config_path = get_render_targets(render_config)[0]["config_path"]
+    framework = read_config(config_path)["framework"]
+
+    getattr(
+        import_module(".".join(["raygun", framework, "predict", "export"])),
+        "export",
+    )(render_config_path)
+
+
+if __name__ == "__main__":
+    export()
@@ -19,3 +19,29 @@ def load_system(config_path, checkpoint=None):
     # system.load_saved_model(checkpoint=checkpoint)
 
     return system
+
+
+def load_model(
+    config_path, checkpoint=None, net_name=None, frozen=False, weights_only=False
+):
+    """Build only the network to predict with from its training configuration and load its weights, skipping the rest of the system (see `BaseSystem.load_model`).
+
+    Args:
+        config_path (str): Path to the training configuration.
+        checkpoint (str, optional): Path to a checkpoint file. Defaults to None.
+        net_name (str, optional): Name of the network in the system's model (e.g. "netG1"). Defaults to the whole model.
+        frozen (bool, optional): Whether the checkpoint holds weights frozen for inference. Defaults to False.
+        weights_only (bool, optional): Whether to only unpickle tensors and plain containers from the checkpoint. Defaults to False.
+
+    Returns:
+        The network, in eval mode.
+    """
+    config = read_config(config_path)
+    System = getattr(
+        import_module(
+            ".".join(["raygun", config["framework"], "systems", config["system"]])
+        ),
+        config["system"],
+    )
+
+    return System.load_model(config_path, checkpoint, net_name, frozen, weights_only)
@@ -6,69 +6,135 @@ from subprocess import Popen
 import sys
 import tempfile
 import daisy
+import numpy as np
 import logging
 
 logging.basicConfig(level=logging.INFO)
 
 from raygun import load_system, read_config
+from raygun.blockwise import (
+    BlockLedger,
+    BlockOrder,
+    compute_occupancy,
+    agglomerate_fragments,
+    check_occupancy,
+    check_pyramid,
+    check_write_alignment,
+    clear_cached_ds,
+    DEFAULT_CHUNK_CACHE_DIR,
+    get_block_selection,
+    get_roi_mask_source,
+    get_fingerprint,
+    get_fragments_config,
+    get_pool_address,
+    get_pyramid_factor,
+    get_pyramid_mode,
+    get_ledger_path,
+    log_cache_stats,
+    plan_chunk_shape,
+    plan_output_roi,
+    prepare_pyramid,
+    reset_cache_stats,
+    reset_edges,
+    submit_job,
+    THREADS_ENV,
+    WORKERS_ENV,
+)
 
 #%%
-def predict(render_config_path=None):  # Use absolute path
-    """Predict system (available through CLI as raygun-predict)
+def get_render_targets(render_config):
+    """Expand a render config into one entry per model to render with.
+
+    "checkpoint", "net_name" and "config_path" may each be given as a list (one per model) or a single value shared by all models. With several models, "output_ds" must be a list of output dataset lists, one per model, unless the models form an ensemble (i.e. "ensemble" is "mean" or "median"), whose reduced outputs share a single list of output datasets.
 
     Args:
-        config_path (str, optional): Path to json file for predicting configuration. Defaults to command line argument.
+        render_config (dict): Render configuration.
+
+    Returns:
+        list(dict): "config_path", "checkpoint", "net_name" and "output_ds" of each model.
     """
-    if render_config_path is None:
-        render_config_path = sys.argv[1]
+    keys = ["config_path", "checkpoint", "net_name"]
+    values = {
+        key: render_config[key] if isinstance(render_config[key], list) else None
+        for key in keys
+    }
+    num_models = max([1] + [len(v) for v in values.values() if v is not None])
+    for key in keys:
+        if values[key] is None:
+            values[key] = [render_config[key]] * num_models
+        elif len(values[key]) != num_models:
+            raise ValueError(
+                f"Expected {num_models} values for '{key}', got {len(values[key])}."
+            )
 
-    logger = logging.getLogger(__name__)
-    logger.info("Loading prediction config...")
+    output_ds = render_config["output_ds"]
+    ensemble = render_config.get("ensemble", None)
+    if ensemble in ["mean", "median"]:
+        if output_ds is None:
+            net_name = values["net_name"][0]
+            prefix = render_config["source_dataset"]
+            if net_name is not None:
+                prefix += f"_{net_name}"
+            output_ds = [f"{prefix}_ensemble_{ensemble}"]
+        output_ds = [output_ds] * num_models
+    elif output_ds is not None and num_models == 1:
+        output_ds = [output_ds]
+    elif output_ds is not None and (
+        len(output_ds) != num_models
+        or not all(isinstance(ds, list) for ds in output_ds)
+    ):
+        raise ValueError(
+            f"Expected a list of output datasets for each of the {num_models} models, got {output_ds}."
+        )
 
-    render_config = {  # Defaults
-        "crop": 0,
-        "read_size": None,
-        "max_retries": 2,
-        "num_workers": 16,
-        "ndims": None,
-        "net_name": None,
-        "output_ds": None,
-        "out_specs": None,
-    }
+    targets = []
+    for i in range(num_models):
+        target = {key: values[key][i] for key in keys}
+        if output_ds is not None:
+            target["output_ds"] = output_ds[i]
+        elif target["net_name"] is not None:
+            target["output_ds"] = [
+                f"{render_config['source_dataset']}_{target['net_name']}_{target['checkpoint']}"
+            ]
+        else:
+            target["output_ds"] = [
+                f"{render_config['source_dataset']}_{target['checkpoint']}"
+            ]
+        targets.append(target)
 
-    temp = read_config(render_config_path)
-    render_config.update(temp)
+    return targets
+
+
+def get_output_datasets(targets):
+    """All output datasets of the targets from `get_render_targets`, in order and without repeats."""
+    return list(dict.fromkeys(ds for target in targets for ds in target["output_ds"]))
 
-    config_path = render_config["config_path"]
-    train_config = read_config(config_path)
-    source_path = render_config["source_path"]
-    source_dataset = render_config["source_dataset"]
-    net_name = render_config["net_name"]
-    checkpoint = render_config["checkpoint"]
-    # compressor = render_config['compressor']
-    num_workers = render_config["num_workers"]
-    max_retries = render_config["max_retries"]
-    output_ds = render_config["output_ds"]
-    out_specs = render_config["out_specs"]
-    ndims = render_config["ndims"]
-    if ndims is None:
-        ndims = train_config["ndims"]
 
+def get_dest_path(render_config):
+    """Container of a render's outputs: "dest_path", or the source's name next to the (first) training configuration."""
     if "dest_path" in render_config.keys():
-        dest_path = render_config["dest_path"]
-    else:
-        dest_path = os.path.join(
-            os.path.dirname(config_path), os.path.basename(source_path)
-        )
-        
-    if output_ds is None:
-        if net_name is not None:
-            output_ds = [f"{source_dataset}_{net_name}_{checkpoint}"]
-        else:
-            output_ds = [f"{source_dataset}_{checkpoint}"]
+        return render_config["dest_path"]
+    config_path = render_config["config_path"]
+    if isinstance(config_path, list):
+        config_path = config_path[0]
+    return os.path.join(
+        os.path.dirname(config_path), os.path.basename(render_config["source_path"])
+    )
 
-    source = daisy.open_ds(source_path, source_dataset)
 
+def get_block_rois(render_config, train_config, source, ndims, slab=True):
+    """Read and write ROIs of a block, from the input/output shapes (or read size and crop) in the render or training configuration.
+
+    Args:
+        render_config (dict): Render configuration.
+        train_config (dict): Training configuration of the rendered system.
+        source (daisy.Array): Source dataset.
+        ndims (int): Number of spatial dimensions of the network.
+        slab (bool, optional): Whether blocks of 2D networks span "z_slab" sections, rather than a single one. Defaults to True.
+
+    Returns:
+        tuple(daisy.Roi, daisy.Roi): Read and write ROI of the block at the origin.
+    """
     # Get input/output sizes #TODO: Clean this up with refactor prior to 0.3.0 (will break old CGAN configs...)
     if "input_shape" in render_config.keys() or "input_shape" in train_config.keys():
         try:
@@ -107,8 +173,337 @@ def predict(render_config_path=None):  # Use absolute path
         write_size = read_size - crop * 2
         write_roi = daisy.Roi(source.voxel_size * crop, source.voxel_size * write_size)
 
-    # Prepare output datasets
-    for dest_dataset in output_ds:
+    z_slab = render_config.get("z_slab", 1)
+    if ndims == 2 and z_slab > 1 and slab:
+        # Blocks span several sections, each rendered as one entry of a batch
+        depth = daisy.Coordinate((z_slab * source.voxel_size[0], 0, 0))
+        shape = daisy.Coordinate((0,) + tuple(read_roi.get_shape()[1:]))
+        read_roi = daisy.Roi(read_roi.get_begin(), depth + shape)
+        shape = daisy.Coordinate((0,) + tuple(write_roi.get_shape()[1:]))
+        write_roi = daisy.Roi(write_roi.get_begin(), depth + shape)
+
+    return read_roi, write_roi
+
+
+def get_task_rois(render_config, read_roi, write_roi, ndims):
+    """Read and write ROIs of the daisy blocks of a render: rows of "halo_blocks" network blocks along "halo_axis", so that the context they share is read once.
+
+    Args:
+        render_config (dict): Render configuration, with defaults filled in.
+        read_roi (daisy.Roi): Read ROI of a network block (see `get_block_rois`).
+        write_roi (daisy.Roi): Write ROI of a network block.
+        ndims (int): Number of spatial dimensions of the networks.
+
+    Returns:
+        tuple(daisy.Roi, daisy.Roi): Read and write ROIs of a daisy block.
+    """
+    halo_blocks = max(1, int(render_config["halo_blocks"]))
+    halo_axis = render_config["halo_axis"] % 3
+    if halo_blocks <= 1:
+        return read_roi, write_roi
+    if halo_axis < 3 - ndims:
+        raise ValueError(
+            f"Halo axis {render_config['halo_axis']} is not a spatial axis of {ndims}D networks."
+        )
+
+    extension = [0, 0, 0]
+    extension[halo_axis] = (halo_blocks - 1) * write_roi.get_shape()[halo_axis]
+    extension = daisy.Coordinate(extension)
+    return (
+        daisy.Roi(read_roi.get_begin(), read_roi.get_shape() + extension),
+        daisy.Roi(write_roi.get_begin(), write_roi.get_shape() + extension),
+    )
+
+
+def get_task_total_roi(total_roi, read_roi, write_roi):
+    """Total ROI of the daisy task of a render: the part of `total_roi` read by whole network blocks.
+
+    Daisy blocks spanning several network blocks (rows of them, see `get_task_rois`, or slabs of sections of 2D networks) are run with fit="shrink", so that those overhanging the end of this ROI are shortened to the network blocks left, rather than dropped.
+
+    Args:
+        total_roi (daisy.Roi): ROI of the source.
+        read_roi (daisy.Roi): Read ROI of a network block, i.e. of a single section for 2D networks (see `get_block_rois` with `slab=False`).
+        write_roi (daisy.Roi): Write ROI of a network block.
+
+    Returns:
+        daisy.Roi: Total ROI of the task.
+    """
+    output_roi = plan_output_roi(total_roi, read_roi, write_roi)
+    return daisy.Roi(
+        output_roi.get_begin() - write_roi.get_begin() + read_roi.get_begin(),
+        output_roi.get_shape() + read_roi.get_shape() - write_roi.get_shape(),
+    )
+
+
+def get_block_order(render_config, train_config, source, ndims, dest_path=None):
+    """Blocks to render and their order (see "block_order", "center_out", "rois" and "roi_mask"), or None to render all blocks in daisy's own order.
+
+    With `dest_path`, the order is saved in the destination (or loaded, if already saved by the orchestrator), so that workers do not have to select the blocks again.
+    """
+    selection_keys = ["rois", "roi_mask"]
+    if render_config["block_order"] is None and all(
+        render_config[key] is None for key in selection_keys
+    ):
+        return None
+
+    read_roi, write_roi = get_task_rois(
+        render_config, *get_block_rois(render_config, train_config, source, ndims), ndims
+    )
+    total_roi = get_task_total_roi(
+        source.data_roi,
+        *get_block_rois(render_config, train_config, source, ndims, slab=False),
+    )
+    order = render_config["block_order"]
+    if order is None:
+        order = "raster"
+
+    path = None
+    if dest_path is not None:
+        # A mask rewritten under the same name selects other blocks
+        mask_version = None
+        mask_files = []
+        mask_source = get_roi_mask_source(render_config)
+        if mask_source is not None:
+            mask_version = daisy.open_ds(*mask_source).roi
+            mask_path = os.path.join(mask_source[0], mask_source[1].strip("/"))
+            mask_files = [mask_path] + [
+                os.path.join(mask_path, name) for name in [".zarray", "attributes.json"]
+            ]
+        fingerprint = get_fingerprint(
+            {
+                key: render_config[key]
+                for key in selection_keys
+                + ["block_order", "center_out", "source_path", "source_dataset"]
+            },
+            [total_roi, read_roi, write_roi, mask_version],
+            files=mask_files,
+        )
+        path = os.path.join(dest_path, ".block_orders", f"{fingerprint}.npy")
+        if os.path.exists(path):
+            return BlockOrder(
+                total_roi, read_roi, write_roi, order, grid=np.load(path), fit="shrink"
+            )
+
+    block_order = BlockOrder(
+        total_roi,
+        read_roi,
+        write_roi,
+        order,
+        render_config["center_out"],
+        select=get_block_selection(render_config),
+        fit="shrink",
+    )
+    if path is not None:
+        block_order.save(path)
+    return block_order
+
+
+def predict(render_config_path=None, autotune=False):  # Use absolute path
+    """Predict system (available through CLI as raygun-predict)
+
+    Args:
+        config_path (str, optional): Path to json file for predicting configuration. Defaults to command line argument.
+        autotune (bool, optional): Whether to first pick the fastest input size that fits in memory and save it next to the config (through CLI with --autotune, see `raygun.read_config.get_autotune_path`). Defaults to False.
+    """
+    if render_config_path is None:
+        args = [arg for arg in sys.argv[1:] if arg != "--autotune"]
+        render_config_path = args[0]
+        autotune = "--autotune" in sys.argv[1:]
+
+    logger = logging.getLogger(__name__)
+    logger.info("Loading prediction config...")
+
+    render_config = {  # Defaults
+        "crop": 0,
+        "read_size": None,
+        "max_retries": 2,
+        "num_workers": 16,
+        "ndims": None,
+        "net_name": None,
+        "output_ds": None,
+        "out_specs": None,
+        "inference_batch_size": 1,
+        "pipeline": False,
+        "min_coefvar": None,
+        "occupancy_factor": 8,
+        "occupancy_ds": None,
+        "resume": False,
+        "calibrate_threads": False,
+        "ensemble": None,
+        "precision": "fp32",
+        "float_output_dtype": None,
+        "mmap_checkpoints": False,
+        "worker_pool": None,
+        "worker_pool_timeout": None,
+        "halo_blocks": 1,
+        "halo_axis": -1,
+        "chunk_cache_gb": None,
+        "chunk_cache_dir": DEFAULT_CHUNK_CACHE_DIR,
+        "block_order": None,
+        "center_out": False,
+        "z_slab": 1,
+        "rois": None,
+        "roi_mask": None,
+        "fragments": None,
+        "pyramid_levels": 0,
+        "pyramid_factor": 2,
+        "pyramid_mode": "mean",
+    }
+
+    temp = read_config(render_config_path)
+    render_config.update(temp)
+
+    if autotune:
+        logger.info("Autotuning block size...")
+        framework = read_config(get_render_targets(render_config)[0]["config_path"])[
+            "framework"
+        ]
+        getattr(
+            import_module(".".join(["raygun", framework, "predict", "autotune"])),
+            "autotune",
+        )(render_config_path)
+        render_config.update(read_config(render_config_path))
+
+    if render_config["precision"] == "int8":
+        logger.info("Preparing int8 networks...")
+        framework = read_config(get_render_targets(render_config)[0]["config_path"])[
+            "framework"
+        ]
+        getattr(
+            import_module(".".join(["raygun", framework, "predict", "quantize"])),
+            "quantize",
+        )(render_config_path)
+
+    # Write inference-only checkpoints for workers to map into memory
+    if render_config["mmap_checkpoints"]:
+        framework = read_config(get_render_targets(render_config)[0]["config_path"])[
+            "framework"
+        ]
+        getattr(
+            import_module(".".join(["raygun", framework, "predict", "checkpoint"])),
+            "convert_checkpoints",
+        )(render_config_path)
+
+    # Read each source block once for all models (e.g. when sweeping checkpoints)
+    targets = get_render_targets(render_config)
+    config_path = targets[0]["config_path"]
+    train_config = read_config(config_path)
+    source_path = render_config["source_path"]
+    source_dataset = render_config["source_dataset"]
+    # compressor = render_config['compressor']
+    num_workers = render_config["num_workers"]
+    max_retries = render_config["max_retries"]
+    output_ds = get_output_datasets(targets)
+    out_specs = render_config["out_specs"]
+    ndims = render_config["ndims"]
+    if ndims is None:
+        ndims = train_config["ndims"]
+
+    # Extract watershed fragments from the predicted affinities while rendering
+    fragments_config = get_fragments_config(render_config)
+    written_ds = list(output_ds)
+    if fragments_config is not None:
+        if ndims != 3:
+            raise ValueError("Fragments can only be extracted by 3D networks.")
+        aff_ds = fragments_config["aff_ds"] or output_ds[0]
+        if not fragments_config["write_affs"]:
+            written_ds.remove(aff_ds)
+
+    # Workers holding several blocks at once must not wait on each other's blocks
+    read_write_conflict = (
+        render_config["inference_batch_size"] <= 1 and not render_config["pipeline"]
+    )
+
+    dest_path = get_dest_path(render_config)
+
+    source = daisy.open_ds(source_path, source_dataset)
+
+    # Precompute coarse occupancy map for skipping empty blocks
+    if render_config["min_coefvar"] is not None:
+        occupancy_ds = render_config["occupancy_ds"]
+        if occupancy_ds is None:
+            occupancy_ds = f"{source_dataset}_coefvar"
+        occupancy_factor = (1,) * (3 - ndims) + (
+            render_config["occupancy_factor"],
+        ) * ndims
+        if not check_occupancy(dest_path, occupancy_ds, source, occupancy_factor):
+            compute_occupancy(
+                source, dest_path, occupancy_ds, occupancy_factor, num_workers
+            )
+        else:
+            logger.info(f"Using existing occupancy map {dest_path}/{occupancy_ds}...")
+
+    read_roi, write_roi = get_block_rois(render_config, train_config, source, ndims)
+    # Single sections of 2D networks, of which the last slab may hold fewer than z_slab
+    unit_read_roi, unit_write_roi = get_block_rois(
+        render_config, train_config, source, ndims, slab=False
+    )
+
+    task_read_roi, task_write_roi = get_task_rois(
+        render_config, read_roi, write_roi, ndims
+    )
+    if task_read_roi != read_roi:
+        logger.info(
+            f"Rendering rows of {render_config['halo_blocks']} blocks along axis {render_config['halo_axis'] % 3}..."
+        )
+    task_total_roi = get_task_total_roi(
+        source.data_roi, unit_read_roi, unit_write_roi
+    )
+
+    # Keep finished blocks of an interrupted render, unless its inputs changed
+    ledger = None
+    delete = True
+    if render_config["resume"]:
+        ledger = BlockLedger(get_ledger_path(dest_path, output_ds))
+        volatile = [
+            "num_workers",
+            "max_retries",
+            "launch_command",
+            "resume",
+            "inference_batch_size",
+            "pipeline",
+            "queue_depth",
+            "calibrate_threads",
+            "threads_per_worker",
+            "interop_threads",
+            "pin_workers",
+            "mmap_checkpoints",
+            "worker_pool",
+            "worker_pool_timeout",
+            "chunk_cache_gb",
+            "chunk_cache_dir",
+            "block_order",
+            "center_out",
+            "rois",
+            "roi_mask",
+        ]
+        # The checkpoints actually rendered (e.g. the latest one, for a checkpoint of None)
+        get_checkpoint_path = getattr(
+            import_module(
+                ".".join(["raygun", train_config["framework"], "predict", "worker"])
+            ),
+            "get_checkpoint_path",
+        )
+        checkpoint_files = [
+            str(get_checkpoint_path(target["config_path"], target["checkpoint"]))
+            for target in targets
+        ]
+        fingerprint = get_fingerprint(
+            {k: v for k, v in render_config.items() if k not in volatile},
+            *[read_config(target["config_path"]) for target in targets],
+            files=checkpoint_files,
+        )
+        if ledger.check_fingerprint(fingerprint):
+            logger.info("Resuming prediction...")
+            delete = False
+        else:
+            logger.warning(
+                "Checkpoint or configuration changed since the last run (or no previous run found), rendering from scratch..."
+            )
+            ledger.reset(fingerprint)
+
+    # Prepare output datasets over the whole source, with chunks that blocks starting past their context never share
+    for dest_dataset in written_ds:
         these_specs = {
             "filename": dest_path,
             "ds_name": dest_dataset,
@@ -117,12 +512,107 @@ def predict(render_config_path=None):  # Use absolute path
             "dtype": source.dtype,
             "write_size": write_roi.get_shape(),
             "num_channels": None,
-            "delete": True,
+            "delete": delete,
         }
         if out_specs is not None and dest_dataset in out_specs.keys():
             these_specs.update(out_specs[dest_dataset])
+        if (
+            render_config["float_output_dtype"] is not None
+            and np.dtype(these_specs["dtype"]).kind == "f"
+        ):  # e.g. store float affinities as float16
+            these_specs["dtype"] = render_config["float_output_dtype"]
+        these_specs["write_size"] = plan_chunk_shape(
+            task_write_roi.get_shape(),
+            source.voxel_size,
+            these_specs["write_size"],
+            dest_dataset,
+            task_write_roi.get_begin(),
+        )
 
         destination = daisy.prepare_ds(**these_specs)
+        check_write_alignment(destination, task_write_roi, source.data_roi, dest_dataset)
+
+    if fragments_config is not None:
+        daisy.prepare_ds(
+            dest_path,
+            fragments_config["fragments_ds"],
+            source.data_roi,
+            source.voxel_size,
+            np.uint64,
+            write_size=plan_chunk_shape(
+                task_write_roi.get_shape(),
+                source.voxel_size,
+                write_roi.get_shape(),
+                fragments_config["fragments_ds"],
+                task_write_roi.get_begin(),
+            ),
+            delete=delete,
+        )
+        if delete:
+            reset_edges(dest_path, fragments_config["fragments_ds"])
+
+    # Downsampled scales written from each block's output, one chunk per block and level
+    if render_config["pyramid_levels"] > 0:
+        factor = get_pyramid_factor(render_config["pyramid_factor"], ndims)
+        # Shortened rows of network blocks (or slabs of sections) must downsample to whole voxels too
+        check_pyramid(
+            unit_write_roi,
+            source.data_roi,
+            source.voxel_size,
+            factor,
+            render_config["pyramid_levels"],
+        )
+        for dest_dataset in written_ds:
+            prepare_pyramid(
+                dest_path,
+                dest_dataset,
+                render_config["pyramid_levels"],
+                factor,
+                task_write_roi,
+                source.data_roi,
+                get_pyramid_mode(render_config, dest_dataset),
+                delete,
+            )
+
+    # Make sure reduced precision is accurate enough before rendering with it
+    if render_config["precision"] in ["bf16", "fp16"] or (
+        render_config["float_output_dtype"] is not None
+    ):
+        check_precision = getattr(
+            import_module(
+                ".".join(["raygun", train_config["framework"], "predict", "precision"])
+            ),
+            "check_precision",
+        )
+        read_shape = tuple(read_roi.get_shape() / source.voxel_size)
+        if ndims == 2:  # a single section
+            read_shape = (1,) + read_shape[1:]
+        check_precision(render_config_path, read_shape)
+
+    # Pick how to split this node's CPUs between local workers
+    if render_config["calibrate_threads"]:
+        if "launch_command" in render_config.keys():
+            logger.warning("Thread calibration only applies to local workers, skipping.")
+        else:
+            calibrate_threads = getattr(
+                import_module(
+                    ".".join(
+                        ["raygun", train_config["framework"], "predict", "calibrate"]
+                    )
+                ),
+                "calibrate_threads",
+            )
+            input_shape = tuple(read_roi.get_shape() / source.voxel_size)
+            if ndims == 2:  # one batch entry per section
+                input_shape = input_shape[:1] + (1,) + input_shape[1:]
+            else:
+                input_shape = (1, 1) + input_shape
+            output_voxels = int(np.prod(write_roi.get_shape() / source.voxel_size))
+            num_workers, threads_per_worker = calibrate_threads(
+                render_config_path, input_shape, output_voxels, max_workers=num_workers
+            )
+            os.environ[WORKERS_ENV] = str(num_workers)
+            os.environ[THREADS_ENV] = str(threads_per_worker)
 
     # Make temporary directory for storing log files
     with tempfile.TemporaryDirectory() as temp_dir:
@@ -142,6 +632,13 @@ def predict(render_config_path=None):  # Use absolute path
             process_function = lambda: Popen(launch_command)
             logger.info(f"Launch command: {' '.join(launch_command)}")
 
+        elif render_config["worker_pool"] is not None:
+            # Run workers on a warm pool started with raygun-worker-pool
+            address = get_pool_address(render_config["worker_pool"])
+            timeout = render_config["worker_pool_timeout"]
+            process_function = lambda: submit_job(address, render_config_path, timeout)
+            logger.info(f"Submitting workers to pool at {address}")
+
         else:
             worker = getattr(
                 import_module(
@@ -151,24 +648,56 @@ def predict(render_config_path=None):  # Use absolute path
             )
             process_function = lambda: worker(render_config_path)
 
+        # Hand out selected blocks (along a space-filling curve) through a 1D task, which daisy processes in index order
+        block_order = get_block_order(
+            render_config, train_config, source, ndims, dest_path
+        )
+        check_function = None if ledger is None else ledger.is_done
+        if block_order is None:
+            total_roi = task_total_roi
+        else:
+            if len(block_order) == 0:
+                raise ValueError("No blocks to render in the selected ROIs.")
+            total_roi, task_read_roi, task_write_roi = block_order.get_task_rois()
+            if ledger is not None:
+                check_function = lambda b: ledger.is_done(block_order.get_block(b))
+            logger.info(f"Rendering {len(block_order)} blocks...")
+
         task = daisy.Task(
             os.path.basename(render_config_path).rstrip(".json"),
-            total_roi=source.data_roi,
-            read_roi=read_roi,
-            write_roi=write_roi,
-            read_write_conflict=True,
-            # fit="shrink",
+            total_roi=total_roi,
+            read_roi=task_read_roi,
+            write_roi=task_write_roi,
+            read_write_conflict=read_write_conflict,
+            fit="shrink",  # shorten the last rows of network blocks and slabs of sections (see get_task_total_roi)
             num_workers=num_workers,
             max_retries=max_retries,
             process_function=process_function,
+            check_function=check_function,
         )
 
+        chunk_cache_dir = render_config["chunk_cache_dir"]
+        if render_config["chunk_cache_gb"] is not None:
+            reset_cache_stats(chunk_cache_dir)
+
         logger.info("Running blockwise prediction...")
-        if daisy.run_blockwise([task]):
+        try:
+            success = daisy.run_blockwise([task])
+        finally:
+            if render_config["chunk_cache_gb"] is not None:
+                log_cache_stats(chunk_cache_dir)
+                clear_cached_ds(source_path, source_dataset, chunk_cache_dir)
+        if success:
             logger.info("Daisy done.")
         else:
             raise ValueError("Daisy failed.")
 
+        if fragments_config is not None:
+            logger.info("Agglomerating fragments...")
+            written_ds += [fragments_config["fragments_ds"]] + agglomerate_fragments(
+                dest_path, fragments_config
+            )
+
         logger.info("Saving viewer script...")
         view_script = os.path.join(
             dest_path,
@@ -176,7 +705,7 @@ def predict(render_config_path=None):  # Use absolute path
         )
 
         # Add each datasets to viewing file
-        for dest_dataset in output_ds:
+        for dest_dataset in written_ds:
             if not os.path.exists(view_script):
                 with open(view_script, "w") as f:
                     f.write(
@@ -255,4 +784,4 @@ def batch_predict(base_folder=None):
 
 # %%
 if __name__ == "__main__":
-    predict(sys.argv[1])
+    predict()
@@ -61,9 +61,16 @@ def eval_args(config, file):
     return config
 
 
+def get_autotune_path(file):
+    """Path of the settings tuned for a configuration file (e.g. by raygun-predict --autotune), kept next to it so that the file itself is never rewritten."""
+    return os.path.splitext(file)[0] + ".autotune.json"
+
+
 def read_config(file):
     """Read configuration json files into dictionary format
 
+    Settings tuned for the file (see `get_autotune_path`) take precedence over its own.
+
     Args:
         file (str or dict): Path to configuration file or, for convenience, a dictionary of the config
 
@@ -90,6 +97,11 @@ def read_config(file):
     for c in configs[-1::-1]:
         config.update(**c)
 
+    autotune_path = get_autotune_path(file)
+    if os.path.exists(autotune_path):
+        logger.debug(f"Using tuned settings from {autotune_path}.")
+        config.update(**load_json_file(autotune_path))
+
     config = eval_args(config, file)
 
     return config
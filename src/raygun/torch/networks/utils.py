@@ -42,6 +42,85 @@ def set_norm_mode(net, mode="train"):
         net.eval()
 
 
+def has_fixed_stats(norm):
+    """Whether a normalization layer applies fixed statistics (BatchNorm, or InstanceNorm tracking running stats, in eval mode), i.e. is an affine transform."""
+    return (
+        isinstance(norm, torch.nn.modules.batchnorm._NormBase)
+        and not norm.training
+        and norm.track_running_stats
+        and norm.running_mean is not None
+    )
+
+
+def fold_norm_into_conv(conv, norm):
+    """Fold a normalization layer with fixed statistics into the weights and bias of the preceding convolution."""
+    scale = torch.rsqrt(norm.running_var + norm.eps)
+    shift = -norm.running_mean * scale
+    if norm.affine:
+        scale = scale * norm.weight
+        shift = shift * norm.weight + norm.bias
+
+    with torch.no_grad():
+        if conv.transposed:  # weight is (in, out, ...)
+            conv.weight.mul_(scale.reshape([1, -1] + [1] * (conv.weight.dim() - 2)))
+        else:
+            conv.weight.mul_(scale.reshape([-1] + [1] * (conv.weight.dim() - 1)))
+
+        if conv.bias is None:
+            conv.bias = torch.nn.Parameter(shift.clone())
+        else:
+            conv.bias.mul_(scale).add_(shift)
+
+
+def freeze_for_inference(net):
+    """Simplify a network in eval mode for rendering: fold normalization layers with fixed statistics into their preceding convolutions, drop identity (and inactive dropout) layers, and make activations following convolutions work in place.
+
+    Args:
+        net (torch.nn.Module): Network, in eval mode.
+
+    Returns:
+        torch.nn.Module: The same network, modified in place.
+    """
+    for module in list(net.modules()):
+        if not isinstance(module, torch.nn.Sequential):
+            continue
+
+        layers = list(module)
+        folded = set()
+        for i, (conv, norm) in enumerate(zip(layers[:-1], layers[1:])):
+            if (
+                isinstance(conv, torch.nn.modules.conv._ConvNd)
+                and (not conv.transposed or conv.groups == 1)
+                and has_fixed_stats(norm)
+                and norm.num_features == conv.out_channels
+            ):
+                fold_norm_into_conv(conv, norm)
+                folded.add(i + 1)
+
+        kept = [
+            layer
+            for i, layer in enumerate(layers)
+            if i not in folded
+            and not isinstance(layer, torch.nn.Identity)
+            and not (
+                isinstance(layer, torch.nn.modules.dropout._DropoutNd)
+                and not layer.training
+            )
+        ]
+        for prev, layer in zip(kept[:-1], kept[1:]):
+            if isinstance(prev, torch.nn.modules.conv._ConvNd) and hasattr(
+                layer, "inplace"
+            ):
+                layer.inplace = True  # conv output is not used elsewhere
+
+        if len(kept) < len(layers):
+            module._modules.clear()
+            for i, layer in enumerate(kept):
+                module.add_module(str(i), layer)
+
+    return net
+
+
 def init_weights(net, init_type="normal", init_gain=0.02, nonlinearity="relu"):
     """Initialize network weights.
     Parameters:
@@ -0,0 +1,252 @@
+import copy
+import os
+import tempfile
+import time
+import numpy as np
+import torch
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+from raygun import get_autotune_path, read_config
+from raygun.predict import get_render_targets
+from raygun.utils import to_json
+from raygun.torch.networks.UNet import Upsample
+from raygun.torch.predict.ensemble import EnsembleModel
+from raygun.torch.predict.worker import get_device, get_models, run_models
+
+
+def estimate_memory(models, data, precision="fp32"):
+    """Estimate the memory (in bytes) a forward pass needs.
+
+    On the GPU this is the measured peak allocation. On the CPU it is the summed size of every layer's output, which is an upper bound because intermediate activations are freed during inference.
+    """
+    if data.is_cuda:
+        torch.cuda.reset_peak_memory_stats()
+        run_models(models, data, precision)
+        return torch.cuda.max_memory_allocated()
+
+    total = data.element_size() * data.nelement()
+
+    def add_output(module, inputs, output):
+        nonlocal total
+        outputs = output if isinstance(output, tuple) else (output,)
+        for out in outputs:
+            if torch.is_tensor(out):
+                total += out.element_size() * out.nelement()
+
+    handles = []
+    for model, _ in models:
+        for module in model.modules():
+            if len(list(module.children())) == 0:
+                handles.append(module.register_forward_hook(add_output))
+    try:
+        run_models(models, data, precision)
+    finally:
+        for handle in handles:
+            handle.remove()
+
+    return total
+
+
+def get_size_period(models):
+    """Period of the input sizes valid-padded UNets can process: the least common multiple of their total downsampling factors (1 without any)."""
+    period = 1
+    for model, _ in models:
+        for module in model.modules():
+            if isinstance(module, Upsample) and module.crop_factor is not None:
+                period = int(np.lcm.reduce([period] + [int(f) for f in module.crop_factor]))
+    return period
+
+
+def get_output_size(models, side_length, ndims, device):
+    """Output size of the models for an input of `side_length` (in voxels), or None if they cannot process it or its context is not an even number of voxels (which would shift the output by half a voxel)."""
+    data = torch.zeros((1, 1) + (side_length,) * ndims, device=device)
+    try:
+        outs = run_models(models, data)
+    except (RuntimeError, AssertionError) as e:
+        if "out of memory" in str(e):
+            raise
+        return None
+    output_shape = np.array(outs[0].shape[-ndims:])
+    if np.any(output_shape <= 0) or np.any((side_length - output_shape) % 2 != 0):
+        return None
+    return output_shape
+
+
+def get_candidate_sizes(models, smallest, largest, step, ndims, device):
+    """Input sizes to try: the first size from `smallest` the models can process, then every `step` (rounded up to a multiple of `get_size_period`) up to `largest`."""
+    period = get_size_period(models)
+    step = period * max(1, -(-step // period))
+    for start in range(smallest, min(smallest + period, largest + 1)):
+        if get_output_size(models, start, ndims, device) is not None:
+            return list(range(start, largest + 1, step))
+    return []
+
+
+def get_timed_models(render_config, models, side_length, ndims, temp_dir):
+    """Models to time an input size with on the render's backend: `models` themselves with PyTorch, or else their ONNX exports for this size (quantized to int8 for "precision": "int8"), as ONNX exports take a single input shape.
+
+    Args:
+        render_config (dict): Render configuration.
+        models (list(tuple(torch.nn.Module, int))): PyTorch models from `get_models`.
+        side_length (int): Input size, in voxels.
+        ndims (int): Number of spatial dimensions of the networks.
+        temp_dir (str): Directory to write the exports to.
+
+    Returns:
+        list(tuple(torch.nn.Module, int)): Models to time, with the number of their outputs.
+    """
+    int8 = render_config["precision"] == "int8"
+    if render_config["backend"] != "onnx" and not int8:
+        return models
+
+    from raygun.torch.predict.export import export_onnx
+    from raygun.torch.predict.onnx_model import OnnxModel
+
+    sample = torch.rand((1, 1) + (side_length,) * ndims)
+
+    def export(model):
+        onnx_path = os.path.join(temp_dir, f"model_{id(model)}_{side_length}.onnx")
+        model = copy.deepcopy(model).to("cpu")
+        export_onnx(model, onnx_path, sample, render_config["onnx_opset"])
+        if int8:  # calibration only affects accuracy, not speed
+            from raygun.torch.predict.quantize import get_quantized_path, quantize_onnx
+
+            quantized_path = get_quantized_path(onnx_path)
+            quantize_onnx(onnx_path, quantized_path, [sample.numpy()])
+            onnx_path = quantized_path
+        return OnnxModel(onnx_path, logger=logger)
+
+    timed = []
+    for model, num_outputs in models:
+        if isinstance(model, EnsembleModel):  # run as an ensemble of ONNX members
+            model = EnsembleModel(
+                [export(member) for member in model.members],
+                model.reduction,
+                model.num_outputs,
+            )
+        else:
+            model = export(model)
+        timed.append((model, num_outputs))
+    return timed
+
+
+def get_memory_budget(render_config):
+    """Default memory budget per worker: 80% of the GPU's memory, or of the node's memory split between its workers."""
+    if torch.cuda.is_available():
+        return 0.8 * torch.cuda.get_device_properties(0).total_memory
+
+    workers_per_node = (
+        1 if "launch_command" in render_config.keys() else render_config["num_workers"]
+    )
+    node_memory = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    return 0.8 * node_memory / workers_per_node
+
+
+def autotune(render_config_path, repeats=2):
+    """Find the network input size with the most useful output voxels per second that fits in memory, and save it for the render config (available through CLI as raygun-predict --autotune).
+
+    Candidate sizes come from "autotune_sizes" ([smallest, largest, step] side length, in voxels), with the step rounded up to the period of valid-padded UNets' input sizes (see `get_candidate_sizes`). Sizes that the network cannot process, or whose context is an odd number of voxels, are skipped. The search stops at the first size over "autotune_memory_gb" (defaults to `get_memory_budget`). Each size is timed with the render's "precision" and "backend" (see `get_timed_models`).
+
+    Args:
+        render_config_path (str): Path to the render configuration. The tuned "input_shape" and "output_shape" are written next to it (see `raygun.read_config.get_autotune_path`), where they override its own.
+        repeats (int, optional): Number of timed forward passes per size. Defaults to 2.
+
+    Returns:
+        tuple: Best input and output shapes.
+    """
+    render_config = {  # Defaults
+        "crop": 0,
+        "num_workers": 16,
+        "ndims": None,
+        "net_name": None,
+        "output_ds": None,
+        "ensemble": None,
+        "backend": "torch",
+        "precision": "fp32",
+        "onnx_opset": 17,
+        "autotune_sizes": [32, 512, 16],
+        "autotune_memory_gb": None,
+    }
+    render_config.update(read_config(render_config_path))
+    precision = render_config["precision"]
+
+    targets = get_render_targets(render_config)
+    ndims = render_config["ndims"]
+    if ndims is None:
+        ndims = read_config(targets[0]["config_path"])["ndims"]
+    crop = render_config["crop"]
+
+    if render_config["autotune_memory_gb"] is not None:
+        memory_budget = render_config["autotune_memory_gb"] * 1024**3
+    else:
+        memory_budget = get_memory_budget(render_config)
+
+    # PyTorch models, to probe valid sizes and export the ONNX models to time from
+    models = get_models(
+        {**render_config, "backend": "torch", "precision": "fp32"}, targets
+    )
+    device = get_device(models)
+
+    best = None
+    smallest, largest, step = render_config["autotune_sizes"]
+    sizes = get_candidate_sizes(models, smallest, largest, step, ndims, device)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for side_length in sizes:
+            data = torch.zeros((1, 1) + (side_length,) * ndims, device=device)
+            try:
+                memory = estimate_memory(models, data, precision)
+            except (RuntimeError, AssertionError) as e:
+                if "out of memory" in str(e):
+                    break
+                continue  # not a valid input shape for this network
+
+            if memory > memory_budget:
+                logger.info(
+                    f"Input size {side_length} needs ~{memory / 1024**3:.2f} GB, over budget."
+                )
+                break
+
+            timed_models = get_timed_models(
+                render_config, models, side_length, ndims, temp_dir
+            )
+            data = data.to(get_device(timed_models))
+            run_models(timed_models, data, precision)  # warm up
+            start = time.perf_counter()
+            for _ in range(repeats):
+                outs = run_models(timed_models, data, precision)
+            elapsed = (time.perf_counter() - start) / repeats
+
+            output_shape = np.array(outs[0].shape[-ndims:])
+            if np.any((side_length - output_shape) % 2 != 0):
+                continue  # context would not be centered on whole voxels
+            output_shape = output_shape - 2 * crop
+            if np.any(output_shape <= 0):
+                continue
+            voxels_per_second = np.prod(output_shape) / elapsed
+            logger.info(
+                f"Input size {side_length} -> output {tuple(output_shape)}: {voxels_per_second:.3g} voxels/s ({precision}, {render_config['backend']})"
+            )
+            if best is None or voxels_per_second > best[0]:
+                best = (voxels_per_second, side_length, output_shape)
+
+    if best is None:
+        raise ValueError("No valid input size found within the memory budget.")
+
+    _, input_shape, output_shape = best
+    if np.all(output_shape == output_shape[0]):
+        output_shape = int(output_shape[0])
+    else:
+        input_shape = [1] * (3 - ndims) + [input_shape] * ndims
+        output_shape = [1] * (3 - ndims) + [int(s) for s in output_shape]
+
+    # Leave the render config itself (and its comments) untouched
+    autotune_path = get_autotune_path(render_config_path)
+    to_json({"input_shape": input_shape, "output_shape": output_shape}, autotune_path)
+    logger.info(
+        f"Wrote input_shape={input_shape}, output_shape={output_shape} to {autotune_path}, which overrides {render_config_path} (delete it to go back to the config's own shapes)."
+    )
+
+    return input_shape, output_shape
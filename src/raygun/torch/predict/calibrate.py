@@ -0,0 +1,91 @@
+import multiprocessing as mp
+import os
+import time
+import numpy as np
+import torch
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+from raygun import read_config
+from raygun.predict import get_render_targets
+from raygun.blockwise import get_available_cpus, get_thread_splits
+from raygun.torch.predict.worker import get_device, get_models, run_models
+
+
+def _time_forward(render_config, input_shape, threads, cpus, repeats, results):
+    # Runs in a spawned process, so that each measurement starts with fresh thread pools
+    os.sched_setaffinity(0, cpus)
+    torch.set_num_threads(threads)
+    torch.set_interop_threads(1)
+
+    models = get_models(render_config, get_render_targets(render_config))
+    data = torch.rand(*input_shape, device=get_device(models))
+    run_models(models, data)  # warm up
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        run_models(models, data)
+    results.put(time.perf_counter() - start)
+
+
+def calibrate_threads(
+    render_config_path, input_shape, output_voxels, max_workers=None, repeats=3
+):
+    """Measure rendering throughput at several (workers x threads) splits of this node's CPUs and return the fastest.
+
+    Each split runs its workers concurrently, each pinned to its own CPUs, so that memory bandwidth contention between workers is part of the measurement.
+
+    Args:
+        render_config_path (str): Path to the render configuration.
+        input_shape (tuple(int)): Shape of a network input, including batch and channel dimensions.
+        output_voxels (int): Number of output voxels written per forward pass.
+        max_workers (int, optional): Maximum number of workers to consider. Defaults to None.
+        repeats (int, optional): Number of timed forward passes per worker. Defaults to 3.
+
+    Returns:
+        tuple(int, int): Best number of workers and threads per worker.
+    """
+    render_config = {
+        "net_name": None,
+        "output_ds": None,
+        "ensemble": None,
+        "backend": "torch",
+    }
+    render_config.update(read_config(render_config_path))
+
+    cpus = get_available_cpus()
+    context = mp.get_context("spawn")
+    best = None
+    for workers, threads in get_thread_splits(cpus, max_workers):
+        results = context.Queue()
+        processes = [
+            context.Process(
+                target=_time_forward,
+                args=(
+                    render_config,
+                    input_shape,
+                    threads,
+                    cpus[i * threads : (i + 1) * threads],
+                    repeats,
+                    results,
+                ),
+            )
+            for i in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        elapsed = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+
+        voxels_per_second = workers * repeats * output_voxels / np.max(elapsed)
+        logger.info(
+            f"{workers} workers x {threads} threads: {voxels_per_second:.3g} voxels/s"
+        )
+        if best is None or voxels_per_second > best[0]:
+            best = (voxels_per_second, workers, threads)
+
+    logger.info(f"Best split: {best[1]} workers x {best[2]} threads.")
+    return best[1], best[2]
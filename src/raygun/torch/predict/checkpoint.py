@@ -0,0 +1,78 @@
+import os
+import sys
+import torch
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+from raygun import read_config
+from raygun.predict import get_render_targets
+from raygun.torch.predict.worker import (
+    get_checkpoint_path,
+    get_mmap_checkpoint_path,
+    get_model,
+)
+
+
+def convert_checkpoint(config_path, checkpoint, net_name=None, freeze=True):
+    """Write an inference-only checkpoint of a network that workers can map into memory.
+
+    Only the weights of the rendered network are kept (no optimizer state or other networks), already frozen for inference if `freeze` is set, in torch's zip format so that they can be loaded with `mmap=True`.
+
+    Args:
+        config_path (str): Path to the training configuration of the system.
+        checkpoint (int or str): Checkpoint iteration, or path to a checkpoint file.
+        net_name (str, optional): Name of the network in the system's model (e.g. "netG1"). Defaults to the whole model.
+        freeze (bool, optional): Whether to save the network frozen for inference (see `freeze_for_inference`). Defaults to True.
+
+    Returns:
+        str: Path of the inference-only checkpoint.
+    """
+    checkpoint_path = get_checkpoint_path(config_path, checkpoint)
+    if not os.path.exists(checkpoint_path):
+        raise FileNotFoundError(f"Checkpoint {checkpoint_path} not found.")
+
+    model = get_model(config_path, checkpoint, net_name, logger, freeze).to("cpu")
+    state_dict = {k: v.contiguous() for k, v in model.state_dict().items()}
+
+    mmap_path = get_mmap_checkpoint_path(config_path, checkpoint, net_name, freeze)
+    temp_path = mmap_path + ".tmp"
+    torch.save(state_dict, temp_path)
+    os.replace(temp_path, mmap_path)  # never leave a partial file for workers to map
+    logger.info(f"Wrote {mmap_path}.")
+
+    return mmap_path
+
+
+def convert_checkpoints(render_config_path=None, overwrite=False):
+    """Write inference-only checkpoints for the networks of a render configuration (available through CLI as raygun-convert-checkpoints).
+
+    Rendering maps them into memory with "mmap_checkpoints": true in the render config.
+
+    Args:
+        render_config_path (str, optional): Path to the render configuration. Defaults to command line argument.
+        overwrite (bool, optional): Whether to rewrite existing inference-only checkpoints. Defaults to False.
+    """
+    if render_config_path is None:
+        render_config_path = sys.argv[1]
+
+    render_config = {  # Defaults
+        "net_name": None,
+        "output_ds": None,
+        "ensemble": None,
+        "freeze_for_inference": True,
+    }
+    render_config.update(read_config(render_config_path))
+    freeze = render_config["freeze_for_inference"]
+
+    for target in get_render_targets(render_config):
+        mmap_path = get_mmap_checkpoint_path(
+            target["config_path"], target["checkpoint"], target["net_name"], freeze
+        )
+        if os.path.exists(mmap_path) and not overwrite:
+            continue
+
+        convert_checkpoint(
+            target["config_path"], target["checkpoint"], target["net_name"], freeze
+        )
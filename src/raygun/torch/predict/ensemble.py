@@ -0,0 +1,84 @@
+import copy
+import torch
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class EnsembleModel(torch.nn.Module):
+    def __init__(self, models, reduction="mean", num_outputs=1):
+        """Runs several models (e.g. the same network trained with different seeds) on the same input and reduces their outputs.
+
+        If all members share an architecture, they are run as a single vmapped forward pass over their stacked parameters; otherwise (or if that fails) one after the other.
+
+        Args:
+            models (list(torch.nn.Module)): Ensemble members.
+            reduction (str, optional): How to combine members' outputs: "mean" or "median". Defaults to "mean".
+            num_outputs (int, optional): Number of leading outputs of each member to keep. Defaults to 1.
+        """
+        super().__init__()
+        assert reduction in ["mean", "median"], f"Unknown reduction: {reduction}"
+        self.members = torch.nn.ModuleList(models)
+        self.reduction = reduction
+        self.num_outputs = num_outputs
+        self.stacked = self.stack_members()
+
+    def stack_members(self):
+        try:
+            from torch.func import functional_call, stack_module_state
+        except ImportError:  # torch < 2.0
+            return None
+
+        first = self.members[0]
+        if len(list(first.parameters())) == 0:  # e.g. ONNX Runtime members
+            return None
+
+        shapes = {k: v.shape for k, v in first.state_dict().items()}
+        for member in self.members[1:]:
+            if type(member) is not type(first) or shapes != {
+                k: v.shape for k, v in member.state_dict().items()
+            }:
+                logger.info("Ensemble members differ, running them one at a time.")
+                return None
+
+        params, buffers = stack_module_state(list(self.members))
+        base = copy.deepcopy(first).to("meta")
+
+        def member_forward(params, buffers, x):
+            outs = functional_call(base, (params, buffers), (x,))
+            if not isinstance(outs, tuple):
+                outs = tuple([outs])
+            return outs[: self.num_outputs]
+
+        def stacked(x):
+            return torch.vmap(member_forward, in_dims=(0, 0, None))(params, buffers, x)
+
+        return stacked
+
+    def run_members(self, x):
+        """Outputs of all members, stacked along a new leading dimension."""
+        if self.stacked is not None:
+            try:
+                return self.stacked(x)
+            except Exception as e:
+                logger.warning(
+                    f"Stacked ensemble forward failed ({e}), running members one at a time."
+                )
+                self.stacked = None
+
+        outs = []
+        for member in self.members:
+            member_outs = member(x)
+            if not isinstance(member_outs, tuple):
+                member_outs = tuple([member_outs])
+            outs.append(member_outs[: self.num_outputs])
+
+        return tuple(torch.stack(member_outs) for member_outs in zip(*outs))
+
+    def forward(self, x):
+        outs = self.run_members(x)
+        if self.reduction == "mean":
+            return tuple(out.mean(0) for out in outs)
+        else:
+            return tuple(out.median(0).values for out in outs)
@@ -0,0 +1,179 @@
+import os
+import sys
+import numpy as np
+import torch
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+from raygun import read_config
+from raygun.predict import get_render_targets
+from raygun.torch.predict.worker import (
+    forward,
+    get_checkpoint_path,
+    get_input_shape,
+    get_model,
+)
+
+
+def get_onnx_path(config_path, checkpoint, net_name=None, input_shape=None):
+    """Path of the ONNX export of a network for inputs of `input_shape` (spatial, in voxels), next to its checkpoint."""
+    checkpoint_path = str(get_checkpoint_path(config_path, checkpoint))
+    if net_name is not None:
+        checkpoint_path += f"_{net_name}"
+    if input_shape is not None:
+        checkpoint_path += "_" + "x".join(str(int(s)) for s in input_shape)
+    return f"{checkpoint_path}.onnx"
+
+
+def get_sample_shape(render_config, train_config, ndims):
+    """Shape of a network input (with batch and channel dimensions) to trace the export with, following predict's choice of input size."""
+    if "input_shape" in render_config.keys():
+        input_shape = render_config["input_shape"]
+    elif "input_shape" in train_config.keys():
+        input_shape = train_config["input_shape"]
+    elif render_config.get("read_size", None) is not None:
+        input_shape = render_config["read_size"]
+    else:
+        input_shape = train_config["side_length"]
+
+    if not isinstance(input_shape, list):
+        input_shape = [input_shape] * ndims
+
+    return (1, 1) + tuple(input_shape[-ndims:])
+
+
+def get_target_onnx_path(render_config, target):
+    """Path of the ONNX export of a render target's network, for the input shape of the render (see `get_sample_shape`)."""
+    return get_onnx_path(
+        target["config_path"],
+        target["checkpoint"],
+        target["net_name"],
+        get_input_shape(render_config, target),
+    )
+
+
+def export_onnx(model, onnx_path, sample, opset_version=17):
+    """Export a network to ONNX with a dynamic batch axis.
+
+    Spatial axes are fixed to the shape of `sample`, because the valid-padding crops of UNets are traced as constants.
+
+    Args:
+        model (torch.nn.Module): Network, in eval mode on the CPU.
+        onnx_path (str): Path to write the export to.
+        sample (torch.Tensor): Input to trace the network with.
+        opset_version (int, optional): ONNX opset. Defaults to 17.
+
+    Returns:
+        int: Number of outputs of the network.
+    """
+    num_outputs = len(forward(model, sample))
+    output_names = [f"output_{i}" for i in range(num_outputs)]
+    dynamic_axes = {"input": {0: "batch"}}
+    dynamic_axes.update({name: {0: "batch"} for name in output_names})
+
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            sample,
+            onnx_path,
+            input_names=["input"],
+            output_names=output_names,
+            dynamic_axes=dynamic_axes,
+            opset_version=opset_version,
+        )
+
+    return num_outputs
+
+
+def check_onnx(model, onnx_path, samples, atol=1e-4):
+    """Check that ONNX Runtime reproduces the PyTorch network's outputs.
+
+    Args:
+        model (torch.nn.Module): Network, in eval mode on the CPU.
+        onnx_path (str): Path of its ONNX export.
+        samples (list(torch.Tensor)): Inputs to compare outputs on.
+        atol (float, optional): Largest absolute difference allowed. Defaults to 1e-4.
+
+    Returns:
+        float: Largest absolute difference found.
+    """
+    from raygun.torch.predict.onnx_model import OnnxModel
+
+    onnx_model = OnnxModel(onnx_path)
+    max_diff = 0.0
+    for sample in samples:
+        for out, onnx_out in zip(forward(model, sample), onnx_model(sample)):
+            diff = np.abs(out.numpy() - onnx_out.numpy())
+            max_diff = max(max_diff, float(diff.max()))
+
+    if max_diff > atol:
+        raise ValueError(
+            f"ONNX Runtime outputs of {onnx_path} differ from PyTorch by up to {max_diff:.3g} (> {atol})."
+        )
+
+    return max_diff
+
+
+def export_target(render_config, target):
+    """Export the network of a render target (see `raygun.predict.get_render_targets`) and check it against PyTorch.
+
+    Args:
+        render_config (dict): Render configuration.
+        target (dict): Render target.
+
+    Returns:
+        str: Path of the export.
+    """
+    train_config = read_config(target["config_path"])
+    ndims = render_config["ndims"]
+    if ndims is None:
+        ndims = train_config["ndims"]
+
+    checkpoint_path = get_checkpoint_path(
+        target["config_path"], target["checkpoint"]
+    )
+    if not os.path.exists(checkpoint_path):
+        raise FileNotFoundError(f"Checkpoint {checkpoint_path} not found.")
+
+    model = get_model(
+        target["config_path"], target["checkpoint"], target["net_name"], logger
+    ).to("cpu")
+    sample = torch.rand(get_sample_shape(render_config, train_config, ndims))
+
+    onnx_path = get_target_onnx_path(render_config, target)
+    logger.info(f"Exporting to {onnx_path}...")
+    export_onnx(model, onnx_path, sample, render_config["onnx_opset"])
+
+    # Also compare a batch, to check the dynamic batch axis
+    samples = [sample, torch.cat([sample, torch.rand_like(sample)])]
+    max_diff = check_onnx(model, onnx_path, samples, render_config["onnx_atol"])
+    logger.info(f"Exported {onnx_path} (max. difference {max_diff:.3g}).")
+
+    return onnx_path
+
+
+def export(render_config_path=None):
+    """Export the networks of a render configuration to ONNX, next to their checkpoints, and check them against PyTorch.
+
+    Rendering then uses them with "backend": "onnx" in the render config.
+
+    Args:
+        render_config_path (str, optional): Path to the render configuration. Defaults to command line argument.
+    """
+    if render_config_path is None:
+        render_config_path = sys.argv[1]
+
+    render_config = {  # Defaults
+        "ndims": None,
+        "net_name": None,
+        "output_ds": None,
+        "ensemble": None,
+        "onnx_opset": 17,
+        "onnx_atol": 1e-4,
+    }
+    render_config.update(read_config(render_config_path))
+
+    for target in get_render_targets(render_config):
+        export_target(render_config, target)
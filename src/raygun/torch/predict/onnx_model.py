@@ -0,0 +1,36 @@
+import numpy as np
+import onnxruntime as ort
+import torch
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class OnnxModel(torch.nn.Module):
+    def __init__(self, onnx_path, num_threads=None, logger=logger):
+        """Runs a network exported with `raygun-export` on ONNX Runtime's CPU execution provider, as a drop-in replacement for the PyTorch network in the predict worker.
+
+        Args:
+            onnx_path (str): Path to the exported network.
+            num_threads (int, optional): Number of intra-op threads. Defaults to torch's current number of threads (as set by the worker's thread budget).
+            logger (logging.Logger, optional): Logger. Defaults to this module's logger.
+        """
+        super().__init__()
+        if num_threads is None:
+            num_threads = torch.get_num_threads()
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = num_threads
+        options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(
+            onnx_path, sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        self.input_name = self.session.get_inputs()[0].name
+        logger.info(f"Loaded {onnx_path} on ONNX Runtime with {num_threads} threads.")
+
+    def forward(self, x):
+        x = np.ascontiguousarray(x.detach().cpu().numpy(), dtype=np.float32)
+        outs = self.session.run(None, {self.input_name: x})
+        return tuple(torch.from_numpy(out) for out in outs)
@@ -0,0 +1,209 @@
+from collections import OrderedDict
+import multiprocessing as mp
+from multiprocessing.connection import Listener
+import itertools
+import os
+import sys
+import threading
+import time
+import traceback
+
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+from raygun.blockwise import DAISY_CONTEXT_ENV, check_pool_address, get_pool_authkey
+
+
+class ModelCache:
+    def __init__(self, max_models=4):
+        """Least-recently-used cache of loaded models, kept resident between jobs.
+
+        Args:
+            max_models (int, optional): Number of models to keep. Defaults to 4.
+        """
+        self.max_models = max_models
+        self.models = OrderedDict()
+
+    def get(self, key, load):
+        """Model for `key`, loading it with `load()` (and evicting the least recently used model if full) if it is not resident."""
+        if key in self.models:
+            self.models.move_to_end(key)
+            return self.models[key]
+
+        model = load()
+        self.models[key] = model
+        while len(self.models) > self.max_models:
+            evicted, _ = self.models.popitem(last=False)
+            logger.info(f"Evicted model {evicted}.")
+        return model
+
+
+def _pool_process(index, jobs, results, max_models):
+    # Long-lived: imports torch and keeps models loaded across jobs
+    from raygun.torch.predict.worker import worker
+
+    cache = ModelCache(max_models)
+    while True:
+        job = jobs.get()
+        if job is None:
+            break
+        job_id, job = job
+        results.put(("started", job_id, index))
+        os.environ[DAISY_CONTEXT_ENV] = job["daisy_context"]
+        try:
+            worker(job["render_config_path"], model_cache=cache)
+            results.put(("finished", job_id, ("done", None)))
+        except Exception:
+            logger.exception(f"Pool process {index} failed job {job_id}.")
+            results.put(("finished", job_id, ("failed", traceback.format_exc())))
+
+
+def serve(
+    address=None, num_workers=None, max_models=4, allow_remote=False, check_every=5
+):
+    """Run a long-lived local pool of warm prediction workers (available through CLI as raygun-worker-pool [address] [num_workers] [max_models] [--allow-remote]).
+
+    raygun-predict submits its daisy workers to the pool when "worker_pool" in the render config is set to the pool's address (or true, for the default address), so that imports and model loading are paid once rather than on every run.
+
+    Jobs are authenticated with RAYGUN_POOL_AUTHKEY, or else with a random key written to a file only this user can read (see `get_pool_authkey`), since the pool runs whatever workers it is sent. Jobs of pool processes that die are failed (so that daisy retries their blocks), and the processes replaced. So are the processes running jobs that their clients gave up on (see `submit_job`).
+
+    Args:
+        address (str, optional): Address to listen on: a Unix socket path or "host:port". Defaults to command line argument, or a Unix socket private to this user (see `get_pool_address`).
+        num_workers (int, optional): Number of pool processes, i.e. jobs run at once. Defaults to command line argument, or 16.
+        max_models (int, optional): Number of models each pool process keeps loaded. Defaults to command line argument, or 4.
+        allow_remote (bool, optional): Whether to listen for TCP connections on hosts other than localhost. Defaults to False (or --allow-remote on the command line).
+        check_every (float, optional): Seconds between checks that the pool processes are alive. Defaults to 5.
+    """
+    if address is None and len(sys.argv) > 1:
+        args = [arg for arg in sys.argv[1:] if arg != "--allow-remote"]
+        allow_remote = len(args) < len(sys.argv) - 1
+        address = args[0] if len(args) > 0 else None
+        num_workers = int(args[1]) if len(args) > 1 else None
+        max_models = int(args[2]) if len(args) > 2 else max_models
+    if num_workers is None:
+        num_workers = 16
+    address = check_pool_address(address, allow_remote)
+    authkey = get_pool_authkey(create=True)
+
+    context = mp.get_context("spawn")
+    jobs = context.Queue()
+    results = context.Queue()
+
+    def start_process(index):
+        process = context.Process(
+            target=_pool_process, args=(index, jobs, results, max_models), daemon=True
+        )
+        process.start()
+        return process
+
+    processes = [start_process(i) for i in range(num_workers)]
+
+    # Route results back to the connections waiting for them
+    waiting = {}
+    running = {}  # job ID of each busy pool process
+    cancelled = set()  # jobs given up on before a pool process took them
+    lock = threading.Lock()
+
+    def reply(job_id, result):
+        with lock:
+            connection = waiting.pop(job_id, None)
+        if connection is None:
+            return
+        try:
+            connection.send(result)
+        except (OSError, EOFError):
+            logger.warning(f"Could not return the result of job {job_id}.")
+        finally:
+            connection.close()
+
+    def cancel(job_id):
+        # Stop a job its client gave up on (e.g. timed out), as daisy hands its blocks to other workers
+        with lock:
+            connection = waiting.pop(job_id, None)
+            index = next((i for i, j in running.items() if j == job_id), None)
+            if index is None:
+                cancelled.add(job_id)
+            else:
+                running.pop(index)
+        if connection is not None:
+            connection.close()
+        if index is not None:
+            logger.warning(f"Job {job_id} cancelled, restarting pool process {index}.")
+            processes[index].kill()  # replaced by check_processes
+
+    def route_results():
+        while True:
+            kind, job_id, value = results.get()
+            if kind == "started":
+                with lock:
+                    if job_id in cancelled:
+                        cancelled.remove(job_id)
+                        logger.warning(
+                            f"Job {job_id} was cancelled, restarting pool process {value}."
+                        )
+                        processes[value].kill()
+                    else:
+                        running[value] = job_id
+            else:
+                with lock:
+                    for index in [i for i, j in running.items() if j == job_id]:
+                        running.pop(index)
+                reply(job_id, value)
+
+    def check_processes():
+        while True:
+            time.sleep(check_every)
+            # Clients send nothing after their job, unless cancelling it (or closing the connection)
+            with lock:
+                connections = list(waiting.items())
+            for job_id, connection in connections:
+                try:
+                    given_up = connection.poll()
+                except (OSError, EOFError):
+                    given_up = True
+                if given_up:
+                    cancel(job_id)
+
+            for index, process in enumerate(processes):
+                if process.is_alive():
+                    continue
+                with lock:
+                    job_id = running.pop(index, None)
+                logger.error(
+                    f"Pool process {index} died (exit code {process.exitcode}), restarting it."
+                )
+                if job_id is not None:
+                    reply(
+                        job_id,
+                        ("failed", f"Pool process {index} died while running the job."),
+                    )
+                processes[index] = start_process(index)
+
+    threading.Thread(target=route_results, daemon=True).start()
+    threading.Thread(target=check_processes, daemon=True).start()
+
+    listener = Listener(address, authkey=authkey)
+    if isinstance(address, str):
+        os.chmod(address, 0o600)
+    logger.info(f"Worker pool of {num_workers} processes listening on {address}...")
+    try:
+        for job_id in itertools.count():
+            try:
+                connection = listener.accept()
+                job = connection.recv()
+            except Exception:
+                logger.exception("Failed to receive job.")
+                continue
+            with lock:
+                waiting[job_id] = connection
+            jobs.put((job_id, job))
+    finally:
+        for _ in processes:
+            jobs.put(None)
+        listener.close()
+
+
+if __name__ == "__main__":
+    serve()
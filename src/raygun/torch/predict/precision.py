@@ -0,0 +1,77 @@
+import daisy
+import numpy as np
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+from raygun import read_config
+from raygun.predict import get_render_targets
+from raygun.blockwise import sample_blocks
+from raygun.torch.predict.worker import (
+    get_device,
+    get_models,
+    get_precision,
+    prepare_input,
+    run_models,
+)
+
+
+def check_precision(render_config_path, read_shape):
+    """Compare reduced-precision outputs (including storage as "float_output_dtype") with fp32 outputs on sampled source blocks, and abort if they differ by more than "precision_tolerance".
+
+    Args:
+        render_config_path (str): Path to the render configuration.
+        read_shape (tuple(int)): Shape of a source block to render, in voxels.
+
+    Returns:
+        float: Largest absolute difference found.
+    """
+    render_config = {  # Defaults
+        "ndims": None,
+        "net_name": None,
+        "output_ds": None,
+        "ensemble": None,
+        "scaleShift_input": None,
+        "precision": "fp32",
+        "float_output_dtype": None,
+        "precision_check_blocks": 4,
+        "precision_tolerance": 1e-2,
+    }
+    render_config.update(read_config(render_config_path))
+    precision = render_config["precision"]
+
+    targets = get_render_targets(render_config)
+    ndims = render_config["ndims"]
+    if ndims is None:
+        ndims = read_config(targets[0]["config_path"])["ndims"]
+
+    source = daisy.open_ds(
+        render_config["source_path"], render_config["source_dataset"]
+    )
+    models = get_models(render_config, targets)
+    device = get_device(models)
+    precision = get_precision(precision, device, logger)
+
+    max_diff = 0.0
+    datas = sample_blocks(source, read_shape, render_config["precision_check_blocks"])
+    for data in datas:
+        data = prepare_input(
+            data, source.dtype, ndims, render_config["scaleShift_input"]
+        ).to(device)
+        fp32_outs = run_models(models, data)
+        outs = run_models(models, data, precision)
+        for fp32_out, out in zip(fp32_outs, outs):
+            out = out.cpu().numpy()
+            if render_config["float_output_dtype"] is not None:
+                out = out.astype(render_config["float_output_dtype"]).astype(np.float32)
+            diff = np.abs(fp32_out.cpu().numpy() - out)
+            max_diff = max(max_diff, float(diff.max()))
+
+    logger.info(f"{precision} outputs differ from fp32 by up to {max_diff:.3g}.")
+    if max_diff > render_config["precision_tolerance"]:
+        raise ValueError(
+            f"{precision} outputs differ from fp32 by up to {max_diff:.3g} (> {render_config['precision_tolerance']}). Render in fp32 or raise precision_tolerance."
+        )
+
+    return max_diff
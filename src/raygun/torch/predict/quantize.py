@@ -0,0 +1,206 @@
+import os
+import daisy
+import numpy as np
+from onnxruntime.quantization import (
+    CalibrationDataReader,
+    QuantFormat,
+    QuantType,
+    quantize_static,
+)
+from skimage.metrics import peak_signal_noise_ratio, structural_similarity
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+from raygun import read_config
+from raygun.utils import load_json_file, to_json
+from raygun.blockwise import sample_blocks
+from raygun.predict import get_render_targets
+from raygun.torch.predict.export import (
+    export_target,
+    get_sample_shape,
+    get_target_onnx_path,
+)
+from raygun.torch.predict.onnx_model import OnnxModel
+from raygun.torch.predict.worker import prepare_input
+
+
+def get_quantized_path(onnx_path):
+    """Path of the int8 version of an ONNX export, cached next to it."""
+    return os.path.splitext(onnx_path)[0] + ".int8.onnx"
+
+
+class BlockReader(CalibrationDataReader):
+    def __init__(self, inputs, input_name="input"):
+        """Feeds network inputs to ONNX Runtime's calibration, one at a time."""
+        self.inputs = iter(inputs)
+        self.input_name = input_name
+
+    def get_next(self):
+        data = next(self.inputs, None)
+        if data is None:
+            return None
+        return {self.input_name: data}
+
+
+def get_ssim_win_size(shape, max_win_size=7):
+    """Side of the SSIM window for outputs of spatial `shape`: skimage's default of 7, narrowed to the thinnest axis (and kept odd), or None if an axis is thinner than 3 voxels."""
+    if len(shape) == 0:
+        return None
+    win_size = min(max_win_size, min(shape))
+    win_size -= 1 - win_size % 2
+    return win_size if win_size >= 3 else None
+
+
+def accuracy_report(onnx_path, quantized_path, inputs):
+    """Compare the outputs of an int8 network with those of the fp32 network it was quantized from.
+
+    Args:
+        onnx_path (str): Path of the fp32 network.
+        quantized_path (str): Path of the int8 network.
+        inputs (list(np.ndarray)): Network inputs to compare outputs on.
+
+    Returns:
+        dict: Mean and worst PSNR and SSIM of each output, over the inputs (SSIM is NaN for outputs thinner than 3 voxels).
+    """
+    fp32_model = OnnxModel(onnx_path)
+    int8_model = OnnxModel(quantized_path)
+    scores = {}
+    for data in inputs:
+        fp32_outs = fp32_model.session.run(None, {fp32_model.input_name: data})
+        int8_outs = int8_model.session.run(None, {int8_model.input_name: data})
+        for i, (fp32_out, int8_out) in enumerate(zip(fp32_outs, int8_outs)):
+            fp32_out, int8_out = fp32_out[0], int8_out[0]  # drop batch dimension
+            data_range = max(float(fp32_out.max() - fp32_out.min()), 1e-6)
+            score = scores.setdefault(f"output_{i}", {"psnr": [], "ssim": []})
+            score["psnr"].append(
+                peak_signal_noise_ratio(fp32_out, int8_out, data_range=data_range)
+            )
+            # Compare single sections (e.g. of 2D networks) as images, and narrow the window for thin blocks
+            shape = fp32_out.shape[:1] + tuple(s for s in fp32_out.shape[1:] if s > 1)
+            fp32_out, int8_out = fp32_out.reshape(shape), int8_out.reshape(shape)
+            win_size = get_ssim_win_size(shape[1:])
+            if win_size is None:
+                score["ssim"].append(np.nan)
+                continue
+            score["ssim"].append(
+                structural_similarity(
+                    fp32_out,
+                    int8_out,
+                    win_size=win_size,
+                    data_range=data_range,
+                    channel_axis=0,
+                )
+            )
+
+    return {
+        output: {
+            f"{stat}_{metric}": float(reduce(values))
+            for metric, values in score.items()
+            for stat, reduce in [("mean", np.mean), ("min", np.min)]
+        }
+        for output, score in scores.items()
+    }
+
+
+def quantize_onnx(onnx_path, quantized_path, inputs):
+    """Quantize an ONNX network to int8 (int8 weights per channel, uint8 activations), calibrated on `inputs`."""
+    quantize_static(
+        onnx_path,
+        quantized_path,
+        BlockReader(inputs),
+        quant_format=QuantFormat.QDQ,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+        per_channel=True,
+    )
+
+
+def quantize_target(render_config, target, source):
+    """Quantize the network of a render target to int8 with static post-training quantization, calibrated on blocks of the source.
+
+    The int8 network and its accuracy report are cached next to the checkpoint and reused on later runs.
+
+    Args:
+        render_config (dict): Render configuration.
+        target (dict): Render target (see `raygun.predict.get_render_targets`).
+        source (daisy.Array): Source dataset to calibrate on.
+
+    Returns:
+        dict: Accuracy report.
+    """
+    onnx_path = get_target_onnx_path(render_config, target)
+    quantized_path = get_quantized_path(onnx_path)
+    report_path = quantized_path + ".json"
+    if os.path.exists(quantized_path) and os.path.exists(report_path):
+        logger.info(f"Using cached {quantized_path}...")
+        return load_json_file(report_path)
+
+    if not os.path.exists(onnx_path):
+        export_target(render_config, target)
+
+    train_config = read_config(target["config_path"])
+    ndims = render_config["ndims"]
+    if ndims is None:
+        ndims = train_config["ndims"]
+    sample_shape = get_sample_shape(render_config, train_config, ndims)
+    read_shape = (1,) * (3 - ndims) + sample_shape[2:]
+
+    logger.info(f"Calibrating on {render_config['quantize_blocks']} source blocks...")
+    datas = sample_blocks(source, read_shape, render_config["quantize_blocks"])
+    inputs = [
+        prepare_input(data, source.dtype, ndims, render_config["scaleShift_input"])
+        .cpu()
+        .numpy()
+        for data in datas
+    ]
+
+    quantize_onnx(onnx_path, quantized_path, inputs)
+
+    report = accuracy_report(onnx_path, quantized_path, inputs)
+    to_json(report, report_path)
+    return report
+
+
+def quantize(render_config_path):
+    """Prepare int8 versions of the networks of a render configuration (for "precision": "int8"), and report their accuracy against fp32.
+
+    Args:
+        render_config_path (str): Path to the render configuration.
+
+    Returns:
+        list(dict): Accuracy report of each network.
+    """
+    render_config = {  # Defaults
+        "ndims": None,
+        "net_name": None,
+        "output_ds": None,
+        "ensemble": None,
+        "scaleShift_input": None,
+        "onnx_opset": 17,
+        "onnx_atol": 1e-4,
+        "quantize_blocks": 16,
+        "int8_min_psnr": 30.0,
+    }
+    render_config.update(read_config(render_config_path))
+
+    source = daisy.open_ds(
+        render_config["source_path"], render_config["source_dataset"]
+    )
+
+    reports = []
+    for target in get_render_targets(render_config):
+        report = quantize_target(render_config, target, source)
+        for output, scores in report.items():
+            logger.info(
+                f"int8 {target['net_name'] or 'model'} ({target['checkpoint']}) {output}: "
+                + ", ".join(f"{k}={v:.3g}" for k, v in scores.items())
+            )
+            if scores["min_psnr"] < render_config["int8_min_psnr"]:
+                logger.warning(
+                    f"int8 {output} falls to {scores['min_psnr']:.3g} dB PSNR against fp32, below {render_config['int8_min_psnr']} dB. Consider rendering in fp32."
+                )
+        reports.append(report)
+
+    return reports
@@ -0,0 +1,303 @@
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import os
+import sys
+import threading
+import daisy
+import numpy as np
+
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+from raygun import read_config
+from raygun.predict import get_block_rois, get_output_datasets, get_render_targets
+from raygun.blockwise import get_fingerprint
+from raygun.torch.predict.worker import (
+    get_checkpoint_path,
+    get_device,
+    get_models,
+    get_precision,
+    prepare_input,
+    run_models,
+    run_sections,
+    to_output_array,
+)
+
+
+class ChunkRenderer:
+    def __init__(self, render_config_path, cache_chunks=256):
+        """Renders the outputs of a render configuration lazily, one block at a time, on a chunk grid of predict's write size covering the whole source (reading past its edges as zeros).
+
+        Rendered chunks are kept in an in-memory LRU cache of `cache_chunks` chunks, and on disk under the destination's ".render_cache" (keyed by the render configuration, training configurations and checkpoints, so that changing any of them starts a fresh cache).
+
+        Args:
+            render_config_path (str): Path to the render configuration.
+            cache_chunks (int, optional): Number of chunks to keep in memory. Defaults to 256.
+        """
+        render_config = {  # Defaults
+            "crop": 0,
+            "read_size": None,
+            "ndims": None,
+            "net_name": None,
+            "scaleShift_input": None,
+            "output_ds": None,
+            "out_specs": None,
+            "ensemble": None,
+            "precision": "fp32",
+            "float_output_dtype": None,
+            "z_slab": 1,
+        }
+        render_config.update(read_config(render_config_path))
+        self.render_config = render_config
+
+        targets = get_render_targets(render_config)
+        config_path = targets[0]["config_path"]
+        train_config = read_config(config_path)
+        self.output_ds = get_output_datasets(targets)
+        self.ndims = render_config["ndims"]
+        if self.ndims is None:
+            self.ndims = train_config["ndims"]
+
+        self.source = daisy.open_ds(
+            render_config["source_path"], render_config["source_dataset"]
+        )
+        read_roi, write_roi = get_block_rois(
+            render_config, train_config, self.source, self.ndims
+        )
+        self.context = write_roi.get_begin() - read_roi.get_begin()
+        self.read_shape = read_roi.get_shape()
+        self.chunk_shape = write_roi.get_shape()
+        self.dtypes = {ds: self.get_dtype(ds) for ds in self.output_ds}
+
+        self.models = get_models(render_config, targets, logger)
+        self.device = get_device(self.models)
+        self.precision = get_precision(render_config["precision"], self.device, logger)
+
+        if "dest_path" in render_config.keys():
+            dest_path = render_config["dest_path"]
+        else:
+            dest_path = os.path.join(
+                os.path.dirname(config_path),
+                os.path.basename(render_config["source_path"]),
+            )
+        fingerprint = get_fingerprint(
+            render_config,
+            *[read_config(target["config_path"]) for target in targets],
+            files=[
+                get_checkpoint_path(target["config_path"], target["checkpoint"])
+                for target in targets
+            ],
+        )
+        self.cache_dir = os.path.join(dest_path, ".render_cache", fingerprint)
+
+        self.cache_chunks = cache_chunks
+        self.chunks = OrderedDict()
+        self.lock = threading.Lock()
+        self.in_flight = {}  # lock of each chunk being loaded or rendered
+        self.num_channels = {}
+
+    def get_dtype(self, dataset):
+        # Same as predict's output datasets
+        dtype = self.source.dtype
+        out_specs = self.render_config["out_specs"]
+        if out_specs is not None and "dtype" in out_specs.get(dataset, {}):
+            dtype = out_specs[dataset]["dtype"]
+        if (
+            self.render_config["float_output_dtype"] is not None
+            and np.dtype(dtype).kind == "f"
+        ):
+            dtype = self.render_config["float_output_dtype"]
+        return np.dtype(dtype)
+
+    def get_chunk_roi(self, index):
+        """World ROI written by the chunk at grid `index` (z, y, x)."""
+        offset = self.source.roi.get_begin() + self.chunk_shape * daisy.Coordinate(
+            index
+        )
+        return daisy.Roi(offset, self.chunk_shape)
+
+    def render(self, index):
+        """Render all outputs of the chunk at grid `index`."""
+        write_roi = self.get_chunk_roi(index)
+        read_roi = daisy.Roi(write_roi.get_begin() - self.context, self.read_shape)
+        data = self.source.to_ndarray(read_roi, fill_value=0)
+        data = prepare_input(
+            data, self.source.dtype, self.ndims, self.render_config["scaleShift_input"]
+        ).to(self.device)
+        run = lambda data: run_models(self.models, data, self.precision)
+        if self.ndims == 2 and self.render_config["z_slab"] > 1:
+            outs = run_sections(data, run)
+        else:
+            outs = run(data)
+
+        chunks = {}
+        for out, dataset in zip(outs, self.output_ds):
+            out = to_output_array(
+                out, self.dtypes[dataset], self.ndims, self.render_config["crop"]
+            )
+            if out.ndim == 3:  # add channel dimension
+                out = out[None, ...]
+            chunks[dataset] = np.ascontiguousarray(out)
+        return chunks
+
+    def get_cached_chunk(self, index):
+        """Outputs of the chunk at grid `index` from the memory cache, or None. Call with `self.lock` held."""
+        if index in self.chunks:
+            self.chunks.move_to_end(index)
+            return self.chunks[index]
+        return None
+
+    def get_chunk(self, index):
+        """Outputs of the chunk at grid `index`, from the memory cache, the disk cache, or rendered.
+
+        The server lock only guards the caches, so that different chunks are loaded or rendered concurrently, while requests for a chunk that is already being rendered wait for it instead of rendering it again.
+        """
+        index = tuple(int(i) for i in index)
+        with self.lock:
+            chunks = self.get_cached_chunk(index)
+            if chunks is not None:
+                return chunks
+            chunk_lock = self.in_flight.setdefault(index, threading.Lock())
+
+        with chunk_lock:
+            with self.lock:
+                chunks = self.get_cached_chunk(index)
+            if chunks is not None:  # rendered while waiting
+                return chunks
+
+            try:
+                paths = {
+                    dataset: os.path.join(
+                        self.cache_dir,
+                        dataset,
+                        "_".join(str(i) for i in index) + ".npy",
+                    )
+                    for dataset in self.output_ds
+                }
+                if all(os.path.exists(path) for path in paths.values()):
+                    chunks = {dataset: np.load(path) for dataset, path in paths.items()}
+                else:
+                    logger.info(f"Rendering chunk {index}...")
+                    chunks = self.render(index)
+                    for dataset, path in paths.items():
+                        os.makedirs(os.path.dirname(path), exist_ok=True)
+                        with open(path + ".tmp", "wb") as f:
+                            np.save(f, chunks[dataset])
+                        os.replace(path + ".tmp", path)
+
+                with self.lock:
+                    self.chunks[index] = chunks
+                    while len(self.chunks) > self.cache_chunks:
+                        self.chunks.popitem(last=False)
+            finally:
+                with self.lock:
+                    self.in_flight.pop(index, None)
+
+        return chunks
+
+    def info(self, dataset):
+        """Neuroglancer precomputed info of an output dataset."""
+        shape = self.source.roi.get_shape() / self.source.voxel_size
+        if dataset not in self.num_channels:  # render the central chunk to find out
+            center = (shape / 2) / (self.chunk_shape / self.source.voxel_size)
+            for ds, chunk in self.get_chunk(center).items():
+                self.num_channels[ds] = chunk.shape[0]
+
+        voxel_offset = self.source.roi.get_begin() / self.source.voxel_size
+        return {
+            "@type": "neuroglancer_multiscale_volume",
+            "type": "image",
+            "data_type": self.dtypes[dataset].name,
+            "num_channels": int(self.num_channels[dataset]),
+            "scales": [
+                {
+                    "key": "s0",
+                    "size": [int(s) for s in shape[::-1]],
+                    "resolution": [int(v) for v in self.source.voxel_size[::-1]],
+                    "voxel_offset": [int(o) for o in voxel_offset[::-1]],
+                    "chunk_sizes": [
+                        [
+                            int(c)
+                            for c in (self.chunk_shape / self.source.voxel_size)[::-1]
+                        ]
+                    ],
+                    "encoding": "raw",
+                }
+            ],
+        }
+
+    def read(self, dataset, key):
+        """Raw bytes of the neuroglancer chunk `key` ("x0-x1_y0-y1_z0-z1", in voxels) of an output dataset."""
+        ranges = [tuple(int(v) for v in r.split("-")) for r in key.split("_")][::-1]
+        voxel_offset = self.source.roi.get_begin() / self.source.voxel_size
+        chunk_shape = self.chunk_shape / self.source.voxel_size
+        index = [(r[0] - o) // c for r, o, c in zip(ranges, voxel_offset, chunk_shape)]
+        chunk = self.get_chunk(index)[dataset]
+
+        # Chunks at the end of the volume are clipped
+        slices = (slice(None),) + tuple(slice(0, r[1] - r[0]) for r in ranges)
+        return np.ascontiguousarray(chunk[slices]).tobytes()
+
+
+def get_handler(renderer):
+    class Handler(BaseHTTPRequestHandler):
+        def send(self, code, body=b"", content_type="application/octet-stream"):
+            self.send_response(code)
+            self.send_header("Access-Control-Allow-Origin", "*")
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            path = self.path.split("?")[0].strip("/")
+            try:
+                if path.endswith("/info") and path[:-5] in renderer.output_ds:
+                    body = json.dumps(renderer.info(path[:-5])).encode()
+                    self.send(200, body, "application/json")
+                elif "/s0/" in path and path.split("/s0/")[0] in renderer.output_ds:
+                    dataset, key = path.split("/s0/")
+                    self.send(200, renderer.read(dataset, key))
+                else:
+                    self.send(404)
+            except Exception:
+                logger.exception(f"Failed to serve {self.path}.")
+                self.send(500)
+
+        def log_message(self, format, *args):
+            logger.debug(format % args)
+
+    return Handler
+
+
+def serve(render_config_path=None, port=None, cache_chunks=256):
+    """Serve the outputs of a render configuration to neuroglancer as precomputed volumes, rendered on demand (available through CLI as raygun-render-server).
+
+    Each output dataset is available as precomputed://http://localhost:<port>/<output_ds>.
+
+    Args:
+        render_config_path (str, optional): Path to the render configuration. Defaults to command line argument.
+        port (int, optional): Port to listen on. Defaults to command line argument, or 8765.
+        cache_chunks (int, optional): Number of rendered chunks to keep in memory. Defaults to 256.
+    """
+    if render_config_path is None:
+        render_config_path = sys.argv[1]
+        port = int(sys.argv[2]) if len(sys.argv) > 2 else None
+    if port is None:
+        port = 8765
+
+    renderer = ChunkRenderer(render_config_path, cache_chunks)
+    server = ThreadingHTTPServer(("localhost", port), get_handler(renderer))
+    for dataset in renderer.output_ds:
+        logger.info(f"Serving precomputed://http://localhost:{port}/{dataset}")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    serve()
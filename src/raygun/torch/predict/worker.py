@@ -1,5 +1,8 @@
+from glob import glob
 import os
+import queue
 import sys
+import threading
 import daisy
 import torch
 import numpy as np
@@ -7,10 +10,714 @@ import logging
 
 logging.basicConfig(level=logging.INFO)
 
-from raygun import load_system, read_config
+from raygun import load_model, read_config
+from raygun.predict import (
+    get_block_order,
+    get_block_rois,
+    get_output_datasets,
+    get_render_targets,
+    get_task_rois,
+)
+from raygun.torch.networks.utils import freeze_for_inference
+from raygun.torch.predict.ensemble import EnsembleModel
+from raygun.blockwise import (
+    BlockLedger,
+    DEFAULT_CHUNK_CACHE_DIR,
+    extract_fragments,
+    get_edges_path,
+    get_fragments_config,
+    get_ledger_path,
+    get_pyramid_factor,
+    get_pyramid_mode,
+    is_empty,
+    open_cached_ds,
+    open_pyramid,
+    save_block_edges,
+    SharedChunkCache,
+    get_thread_budget,
+    get_worker_cpus,
+    THREADS_ENV,
+)
 
 
-def worker(render_config_path):
+def acquire_blocks(client, num_blocks=1, skip_block=None, map_block=None):
+    """Acquire up to `num_blocks` blocks from the daisy scheduler.
+
+    The block context managers are entered by hand so that each block can be released individually (see `release_block`), rather than all together when a batch is done.
+
+    Args:
+        client (daisy.Client): Client connected to the scheduler.
+        num_blocks (int, optional): Maximum number of blocks to acquire. Defaults to 1.
+        skip_block (callable, optional): Takes a block and returns True if it has been fully handled already (e.g. an empty block), in which case it is released right away and not returned. Defaults to None.
+        map_block (callable, optional): Takes a block handed out by the scheduler and returns the block to process instead (e.g. `BlockOrder.get_block`). Defaults to None.
+
+    Returns:
+        tuple(list, list): Entered block context managers and their blocks. Fewer than `num_blocks` are returned once the scheduler runs out of blocks.
+    """
+    managers = []
+    blocks = []
+    while len(blocks) < num_blocks:
+        manager = client.acquire_block()
+        block = manager.__enter__()
+        if block is None:
+            manager.__exit__(None, None, None)
+            break
+        if map_block is not None:
+            block = map_block(block)
+
+        if skip_block is not None:
+            try:
+                skipped = skip_block(block)
+            except Exception:
+                release_block(manager, sys.exc_info())
+                continue
+            if skipped:
+                release_block(manager)
+                continue
+
+        managers.append(manager)
+        blocks.append(block)
+
+    return managers, blocks
+
+
+def release_block(manager, exc_info=(None, None, None)):
+    """Release a block acquired with `acquire_blocks`, marking it as failed if `exc_info` holds an exception."""
+    manager.__exit__(*exc_info)
+
+
+def prepare_input(data, source_dtype, ndims, scaleShift_input=None):
+    """Convert a raw source block into a normalized network input with batch (and channel) dimensions."""
+    if torch.cuda.is_available():
+        data = torch.cuda.FloatTensor(data).unsqueeze(0)
+    else:
+        data = torch.FloatTensor(data).unsqueeze(0)
+
+    if ndims == 3:
+        data = data.unsqueeze(0)
+
+    data -= np.iinfo(source_dtype).min  # TODO: Assumes integer inputs
+    data /= np.iinfo(source_dtype).max
+
+    if scaleShift_input is not None:
+        data *= scaleShift_input[0]
+        data += scaleShift_input[1]
+
+    return data
+
+
+def get_input_lut(source_dtype, scaleShift_input=None):
+    """Build a lookup table that fuses input normalization (and optional scale/shift) for 8- and 16-bit integer sources.
+
+    The table is indexed by the raw values viewed as unsigned integers, so signed sources work as well.
+
+    Args:
+        source_dtype (np.dtype): Data type of the source.
+        scaleShift_input (tuple(float), optional): Scale and shift applied after normalization. Defaults to None.
+
+    Returns:
+        np.ndarray or None: float32 table with 256 or 65536 entries, or None if the source dtype is not supported.
+    """
+    dtype = np.dtype(source_dtype)
+    if dtype.kind not in "ui" or dtype.itemsize > 2:
+        return None
+
+    unsigned = np.dtype(f"u{dtype.itemsize}")
+    values = np.arange(2 ** (8 * dtype.itemsize)).astype(unsigned).view(dtype)
+    lut = values.astype(np.float32)
+    lut -= np.iinfo(dtype).min
+    lut /= np.iinfo(dtype).max
+    if scaleShift_input is not None:
+        lut *= scaleShift_input[0]
+        lut += scaleShift_input[1]
+
+    return lut
+
+
+class InputBuffers:
+    def __init__(self, num_buffers=2):
+        """Preallocated float32 input buffers, reused across blocks.
+
+        Buffers of each shape are handed out in rotation, so that a buffer is not overwritten while later pipeline stages may still be using it.
+
+        Args:
+            num_buffers (int, optional): Number of buffers of each shape to rotate through. Defaults to 2.
+        """
+        self.num_buffers = num_buffers
+        self.buffers = {}
+        self.next = {}
+
+    def get(self, shape):
+        shape = tuple(shape)
+        if shape not in self.buffers:
+            self.buffers[shape] = []
+            self.next[shape] = 0
+
+        i = self.next[shape]
+        if i == len(self.buffers[shape]):
+            self.buffers[shape].append(np.empty(shape, dtype=np.float32))
+        self.next[shape] = (i + 1) % self.num_buffers
+
+        return self.buffers[shape][i]
+
+
+def prepare_batch(datas, lut, buffers, ndims):
+    """Normalize raw source blocks of equal shape straight into a reused buffer with a single table lookup, and wrap it as a tensor without copying.
+
+    Args:
+        datas (list(np.ndarray)): Raw source blocks.
+        lut (np.ndarray): Table from `get_input_lut`.
+        buffers (InputBuffers): Buffers to write into.
+        ndims (int): Number of spatial dimensions of the network.
+
+    Returns:
+        torch.Tensor: Batch of network inputs.
+    """
+    channel = (1,) if ndims == 3 else ()
+    buffer = buffers.get((len(datas),) + channel + datas[0].shape)
+    unsigned = np.dtype(f"u{datas[0].dtype.itemsize}")
+    for i, data in enumerate(datas):
+        np.take(lut, data.view(unsigned), out=buffer[i].reshape(data.shape))
+
+    batch = torch.from_numpy(buffer)
+    if torch.cuda.is_available():
+        batch = batch.to("cuda", non_blocking=True)
+
+    return batch
+
+
+# Reduced precisions run under autocast, and their outputs are returned as float32
+AUTOCAST_DTYPES = {"bf16": torch.bfloat16, "fp16": torch.float16}
+
+
+def get_precision(precision, device, logger=None):
+    """Precision to render with on `device`: fp16 autocast needs CUDA, so it falls back to bf16 elsewhere (with a warning if `logger` is given)."""
+    if precision == "fp16" and torch.device(device).type != "cuda":
+        if logger is not None:
+            logger.warning("fp16 autocast needs CUDA, rendering in bf16 instead.")
+        return "bf16"
+    return precision
+
+
+def forward(model, data, precision="fp32"):
+    """Run the model on a batch, always returning a tuple of outputs.
+
+    Args:
+        model (torch.nn.Module): Network.
+        data (torch.Tensor): Batch of network inputs.
+        precision (str, optional): "fp32", or "bf16"/"fp16" to run under autocast (see `get_precision`). Defaults to "fp32".
+
+    Returns:
+        tuple(torch.Tensor): Outputs.
+    """
+    precision = get_precision(precision, data.device)
+    autocast = precision in AUTOCAST_DTYPES
+    with torch.no_grad(), torch.autocast(
+        data.device.type, dtype=AUTOCAST_DTYPES.get(precision), enabled=autocast
+    ):
+        outs = model(data)
+
+    if not isinstance(outs, tuple):
+        outs = tuple([outs])
+
+    if autocast:
+        outs = tuple(out.float() for out in outs)
+
+    return outs
+
+
+def run_sections(data, run):
+    """Render 2D blocks spanning several sections ("z_slab") with a single forward pass, each section being one entry of the batch.
+
+    Args:
+        data (torch.Tensor): Batch of 2D network inputs, with the sections in place of the channel dimension.
+        run (callable): Takes a batch of single-section inputs and returns a tuple of outputs (e.g. `run_models`).
+
+    Returns:
+        tuple(torch.Tensor): Outputs, with the sections restacked after the batch dimension.
+    """
+    batch, sections = data.shape[:2]
+    outs = run(data.reshape(batch * sections, 1, *data.shape[2:]))
+    return tuple(out.reshape(batch, sections, *out.shape[1:]) for out in outs)
+
+
+def to_output_array(out, dtype, ndims, crop=0, logger=None, name=None):
+    """Crop and rescale a network output of a single block (batch size of 1) into an array of the destination's dtype and layout."""
+    if ndims == 2 and out.dim() == 5:  # sections restacked by `run_sections`
+        out = out.detach()[0].transpose(0, 1)  # channels first
+        if crop and crop != 0:
+            out = out[..., crop:-crop, crop:-crop]
+        if out.shape[0] == 1:
+            out = out[0]
+        return to_output_array(out.contiguous(), dtype, 3, 0, logger, name)
+
+    out = out.detach().squeeze()
+    if crop and crop != 0:
+        if ndims == 2:
+            out = out[crop:-crop, crop:-crop]
+        elif ndims == 3:
+            out = out[crop:-crop, crop:-crop, crop:-crop]
+        else:
+            raise NotImplementedError()
+
+    try:
+        # Quantize in place
+        out *= np.iinfo(dtype).max
+        out.clamp_(
+            np.iinfo(dtype).min,
+            np.iinfo(dtype).max,
+        )
+    except:
+        if logger is not None:
+            logger.info(f"Assuming output data for {name} is float between 0 and 1...")
+        # out = torch.clamp(out, 0, 1) #TODO
+
+    if torch.cuda.is_available():
+        out = out.cpu().numpy().astype(dtype, copy=False)
+    else:
+        out = out.numpy().astype(dtype, copy=False)
+
+    if ndims == 2 and len(out.shape) < 3:  # Add Z dimension if necessary
+        out = out[None, ...]
+    elif ndims == 2 and len(out.shape) == 3:  # Add Z dimension if necessary
+        out = out[:, None, ...]
+
+    return out
+
+
+def write_outputs(
+    outs, block, destinations, output_ds, ndims, crop=0, logger=None, pyramids=None
+):
+    """Crop, rescale and write the outputs of a single block (batch size of 1) to their destinations (and the coarser levels in `pyramids`, by output dataset)."""
+    for out, dest_dataset in zip(outs, output_ds):
+        if dest_dataset not in destinations:  # e.g. affinities only kept for fragments
+            continue
+        destination = destinations[dest_dataset]
+        data = to_output_array(out, destination.dtype, ndims, crop, logger, dest_dataset)
+        destination[block.write_roi] = data
+        if pyramids is not None and dest_dataset in pyramids:
+            pyramids[dest_dataset].write(block.write_roi, data)
+        if logger is not None:
+            logger.info(f"Wrote chunk {block.block_id} to {dest_dataset}...")
+
+
+def compute_batch(blocks, inputs, run, logger):
+    """Outputs of a batch of blocks, from a single forward pass if possible, or else one block at a time (e.g. if the batch does not fit in memory).
+
+    Args:
+        blocks (list(daisy.Block)): Blocks of the batch.
+        inputs (torch.Tensor or list(torch.Tensor)): Their network inputs, as a single batch or one tensor per block (see `read_blocks` in `worker`).
+        run (callable): Takes blocks and their inputs and returns a tuple of batched outputs.
+        logger (logging.Logger): Logger.
+
+    Returns:
+        list(tuple): (outs, exc_info) of each block, with exc_info None unless rendering it failed.
+    """
+    # Run the whole batch through a single forward pass
+    batch_outs = None
+    if torch.is_tensor(inputs) and len(blocks) > 1:
+        try:
+            batch_outs = run(blocks, inputs)
+        except Exception as e:
+            logger.warning(
+                f"Batched forward of {len(blocks)} blocks failed ({e}), falling back to one block at a time..."
+            )
+
+    # Scatter outputs back to each block as (outs, exc_info)
+    results = []
+    for i, block in enumerate(blocks):
+        try:
+            if batch_outs is not None:
+                outs = tuple(out[i : i + 1] for out in batch_outs)
+            elif torch.is_tensor(inputs):
+                outs = run([block], inputs[i : i + 1])
+            else:
+                outs = run([block], inputs[i])
+            results.append((outs, None))
+        except Exception:
+            logger.exception(f"Failed to render block {block.block_id}.")
+            results.append((None, sys.exc_info()))
+
+    return results
+
+
+def run_pipelined(
+    client,
+    inference_batch_size,
+    queue_depth,
+    read_blocks,
+    compute_blocks,
+    write_block,
+    logger,
+    log_every=20,
+    skip_block=None,
+    map_block=None,
+):
+    """Process blocks with a reader thread prefetching inputs and a writer thread draining outputs, so that source I/O, inference and destination I/O overlap.
+
+    All communication with the daisy scheduler stays on the calling thread: blocks are acquired here before being handed to the reader, and released here once the writer reports them as done.
+
+    Args:
+        client (daisy.Client): Client connected to the scheduler.
+        inference_batch_size (int): Number of blocks per forward pass.
+        queue_depth (int): Maximum number of batches waiting between each pair of stages.
+        read_blocks (callable): Takes a list of blocks and returns their network inputs.
+        compute_blocks (callable): Takes blocks and inputs and returns a list of (outs, exc_info) per block.
+        write_block (callable): Takes a block, its outs and exc_info, and returns the exc_info to release the block with.
+        logger (logging.Logger): Logger for reporting queue depths.
+        log_every (int, optional): Number of batches between queue depth reports. Defaults to 20.
+        skip_block (callable, optional): Passed on to `acquire_blocks`. Defaults to None.
+        map_block (callable, optional): Passed on to `acquire_blocks`. Defaults to None.
+    """
+    read_queue = queue.Queue(maxsize=queue_depth)
+    loaded_queue = queue.Queue(maxsize=queue_depth)
+    write_queue = queue.Queue(maxsize=queue_depth)
+    done_queue = queue.Queue()
+
+    def reader():
+        while True:
+            item = read_queue.get()
+            if item is None:
+                break
+            managers, blocks = item
+            try:
+                loaded_queue.put((managers, blocks, read_blocks(blocks), None))
+            except Exception:
+                logger.exception(f"Failed to read batch of {len(blocks)} blocks.")
+                loaded_queue.put((managers, blocks, None, sys.exc_info()))
+
+    def writer():
+        while True:
+            item = write_queue.get()
+            if item is None:
+                break
+            for manager, block, (outs, exc_info) in zip(*item):
+                done_queue.put((manager, write_block(block, outs, exc_info)))
+
+    def release_done():
+        while True:
+            try:
+                manager, exc_info = done_queue.get_nowait()
+            except queue.Empty:
+                break
+            release_block(manager, exc_info)
+
+    reader_thread = threading.Thread(target=reader, daemon=True)
+    writer_thread = threading.Thread(target=writer, daemon=True)
+    reader_thread.start()
+    writer_thread.start()
+
+    exhausted = False
+    in_flight = 0
+
+    def prefetch():
+        nonlocal exhausted, in_flight
+        release_done()  # never hold finished blocks while waiting on the scheduler
+        managers, blocks = acquire_blocks(
+            client, inference_batch_size, skip_block, map_block
+        )
+        if len(blocks) > 0:
+            read_queue.put((managers, blocks))
+            in_flight += 1
+        if len(blocks) < inference_batch_size:
+            exhausted = True
+
+    while not exhausted and in_flight < queue_depth:
+        prefetch()
+
+    depths = {"read": [], "loaded": [], "write": []}
+    batches = 0
+    while in_flight > 0:
+        managers, blocks, inputs, exc_info = loaded_queue.get()
+        in_flight -= 1
+        if not exhausted:
+            prefetch()  # start reading the next batch before computing this one
+
+        depths["read"].append(read_queue.qsize())
+        depths["loaded"].append(loaded_queue.qsize())
+        depths["write"].append(write_queue.qsize())
+
+        if exc_info is not None:
+            results = [(None, exc_info)] * len(blocks)
+        else:
+            results = compute_blocks(blocks, inputs)
+        write_queue.put((managers, blocks, results))
+        release_done()
+
+        batches += 1
+        if batches % log_every == 0:
+            log_queue_depths(logger, depths, batches)
+
+    read_queue.put(None)
+    write_queue.put(None)
+    reader_thread.join()
+    writer_thread.join()
+    release_done()
+    log_queue_depths(logger, depths, batches)
+
+
+def log_queue_depths(logger, depths, batches):
+    """Report mean queue depths: an empty loaded queue points to reading, a full write queue to writing, as the bottleneck."""
+    summary = ", ".join(
+        f"{name}={np.mean(values):.2f}" for name, values in depths.items() if len(values) > 0
+    )
+    logger.info(f"Mean queue depths after {batches} batches: {summary}")
+
+
+def get_checkpoint_path(config_path, checkpoint):
+    """Path of a checkpoint given by iteration (relative to the training configuration's folder), or the checkpoint itself if it is already a path.
+
+    A checkpoint of None stands for the latest one saved by training (the path of a "None" iteration if there is none yet).
+    """
+    if os.path.exists(str(checkpoint)):
+        return checkpoint
+
+    checkpoint_basename = read_config(config_path).get(
+        "checkpoint_basename", "./models/model"
+    )
+    basename = os.path.join(
+        os.path.dirname(config_path),
+        checkpoint_basename.lstrip("./") + "_checkpoint_",
+    )
+    if checkpoint is None:
+        # Skips the inference-only checkpoints and exports saved next to them
+        iterations = [
+            int(path[len(basename) :])
+            for path in glob(basename + "*")
+            if path[len(basename) :].isdigit()
+        ]
+        if len(iterations) > 0:
+            checkpoint = max(iterations)
+    return basename + str(checkpoint)
+
+
+def get_checkpoint_mtime(checkpoint_path):
+    """Modification time of a checkpoint in nanoseconds, or None if it does not exist."""
+    try:
+        return os.stat(checkpoint_path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def get_mmap_checkpoint_path(config_path, checkpoint, net_name=None, freeze=True):
+    """Path of the inference-only checkpoint written by `raygun.torch.predict.checkpoint.convert_checkpoint`, next to the training checkpoint."""
+    checkpoint_path = str(get_checkpoint_path(config_path, checkpoint))
+    if net_name is not None:
+        checkpoint_path += f"_{net_name}"
+    return checkpoint_path + (".frozen" if freeze else "") + ".pt"
+
+
+def get_model(
+    config_path, checkpoint, net_name=None, logger=None, freeze=True, mmap=False
+):
+    """Load the network to render with, in eval mode (and on the GPU if available).
+
+    Args:
+        config_path (str): Path to the training configuration of the system.
+        checkpoint (int or str): Checkpoint iteration, or path to a checkpoint file.
+        net_name (str, optional): Name of the network in the system's model to render with (e.g. "netG1"). Defaults to the whole model.
+        logger (logging.Logger, optional): Logger. Defaults to None.
+        freeze (bool, optional): Whether to fold fixed normalizations into convolutions and drop no-op layers (see `freeze_for_inference`). Defaults to True.
+        mmap (bool, optional): Whether to map the weights read-only from an inference-only checkpoint (see `get_mmap_checkpoint_path`) if there is one, so that workers on a node share them through the page cache. Defaults to False.
+
+    Returns:
+        torch.nn.Module: The network.
+    """
+    mmap_path = get_mmap_checkpoint_path(config_path, checkpoint, net_name, freeze)
+    if mmap and os.path.exists(mmap_path):
+        if logger is not None:
+            logger.info(f"Mapping weights from {mmap_path}...")
+        model = load_model(
+            config_path, mmap_path, net_name, frozen=freeze, weights_only=True
+        )
+
+    else:
+        checkpoint_path = get_checkpoint_path(config_path, checkpoint)
+        if not os.path.exists(checkpoint_path):
+            if logger is not None:
+                logger.warning(f"Checkpoint {checkpoint_path} not found.")
+            checkpoint_path = None  # latest checkpoint
+
+        model = load_model(config_path, checkpoint_path, net_name)
+        if freeze:
+            freeze_for_inference(model)
+
+    if torch.cuda.is_available():
+        if logger is not None:
+            logger.info("Moving model to CUDA...")
+        model.to("cuda")  # TODO pick best GPU
+
+    return model
+
+
+def get_input_shape(render_config, target):
+    """Spatial shape of the network inputs of a render target, in voxels (see `raygun.torch.predict.export.get_sample_shape`)."""
+    from raygun.torch.predict.export import get_sample_shape
+
+    train_config = read_config(target["config_path"])
+    ndims = render_config.get("ndims", None)
+    if ndims is None:
+        ndims = train_config["ndims"]
+    return get_sample_shape(render_config, train_config, ndims)[2:]
+
+
+def get_models(render_config, targets, logger=None, cache=None):
+    """Load the models of all render targets (see `raygun.predict.get_render_targets`), combining ensemble members into a single model writing the reduced outputs.
+
+    Args:
+        render_config (dict): Render configuration.
+        targets (list(dict)): Render targets.
+        logger (logging.Logger, optional): Logger. Defaults to None.
+        cache (ModelCache, optional): Cache of resident models to take them from (see `raygun.torch.predict.pool`). Defaults to None.
+
+    Returns:
+        list(tuple(torch.nn.Module, int)): Each model with the number of its outputs to write.
+    """
+    int8 = render_config.get("precision", "fp32") == "int8"
+    onnx = render_config.get("backend", "torch") == "onnx" or int8
+    freeze = render_config.get("freeze_for_inference", True)
+    mmap = render_config.get("mmap_checkpoints", False)
+
+    def load(target):
+        if onnx:
+            from raygun.torch.predict.export import get_target_onnx_path
+            from raygun.torch.predict.onnx_model import OnnxModel
+
+            onnx_path = get_target_onnx_path(render_config, target)
+            if int8:  # prepared by predict()
+                from raygun.torch.predict.quantize import get_quantized_path
+
+                onnx_path = get_quantized_path(onnx_path)
+            return OnnxModel(onnx_path, logger=logger)
+
+        return get_model(
+            target["config_path"],
+            target["checkpoint"],
+            target["net_name"],
+            logger,
+            freeze,
+            mmap,
+        )
+
+    models = []
+    for target in targets:
+        if cache is None:
+            models.append(load(target))
+        else:
+            # Resident models go stale once their checkpoint is retrained or rewritten, and exports only take one input shape
+            checkpoint_path = str(
+                get_checkpoint_path(target["config_path"], target["checkpoint"])
+            )
+            key = (
+                target["config_path"],
+                checkpoint_path,
+                get_checkpoint_mtime(checkpoint_path),
+                target["net_name"],
+                get_input_shape(render_config, target),
+                onnx,
+                int8,
+                freeze,
+                mmap,
+            )
+            models.append(cache.get(key, lambda: load(target)))
+
+    if render_config.get("ensemble", None) in ["mean", "median"]:
+        num_outputs = len(get_output_datasets(targets))
+        ensemble = EnsembleModel(models, render_config["ensemble"], num_outputs)
+        return [(ensemble, num_outputs)]
+
+    return [
+        (model, len(target["output_ds"])) for model, target in zip(models, targets)
+    ]
+
+
+def get_device(models):
+    """Device to put inputs for the models from `get_models` on."""
+    for parameter in models[0][0].parameters():
+        return parameter.device
+    return torch.device("cpu")  # e.g. ONNX Runtime models
+
+
+def run_models(models, data, precision="fp32"):
+    """Outputs of all models from `get_models` on a batch, in the order of their output datasets."""
+    outs = ()
+    for model, num_outputs in models:
+        outs += forward(model, data, precision)[:num_outputs]
+    return outs
+
+
+def run_models_halo(models, data, num_blocks, dim, stride, size, precision="fp32"):
+    """Outputs of all models on a row of `num_blocks` network blocks along `dim`, whose overlapping contexts were read once as a single input (see "halo_blocks").
+
+    Args:
+        models (list): Models from `get_models`.
+        data (torch.Tensor): Batch of inputs spanning the whole row.
+        num_blocks (int): Number of network blocks in the row (the last rows of a volume may be shorter than "halo_blocks").
+        dim (int): Dimension of `data` along the row.
+        stride (int): Write size of a network block along `dim`, in voxels.
+        size (int): Read size of a network block along `dim`, in voxels.
+        precision (str, optional): See `forward`. Defaults to "fp32".
+
+    Returns:
+        tuple(torch.Tensor): Outputs for the whole row, as if rendered in one pass.
+    """
+    if num_blocks == 1:
+        return run_models(models, data, precision)
+
+    row_outs = [
+        run_models(models, data.narrow(dim, i * stride, size), precision)
+        for i in range(num_blocks)
+    ]
+
+    # Stitch the blocks' write regions, keeping the margins of the first and last block for later cropping
+    outs = []
+    for pieces in zip(*row_outs):
+        length = pieces[0].shape[dim]
+        margin = (length - stride) // 2
+        stitched = [pieces[0].narrow(dim, 0, margin + stride)]
+        stitched += [piece.narrow(dim, margin, stride) for piece in pieces[1:-1]]
+        stitched += [pieces[-1].narrow(dim, margin, length - margin)]
+        outs.append(torch.cat(stitched, dim))
+
+    return tuple(outs)
+
+
+def set_threads(render_config, worker_index, logger=None):
+    """Set torch's intra- and inter-op thread counts for this worker from the render config, and optionally pin it to its own CPUs.
+
+    Args:
+        render_config (dict): Render configuration, using "threads_per_worker", "interop_threads", "pin_workers", "num_workers" and "launch_command".
+        worker_index (int): Index of this worker, used to pick its CPUs.
+        logger (logging.Logger, optional): Logger. Defaults to None.
+    """
+    if render_config["threads_per_worker"] is None and THREADS_ENV not in os.environ:
+        return
+
+    # Workers started with a launch command get their own allocation
+    workers_per_node = (
+        1 if "launch_command" in render_config.keys() else render_config["num_workers"]
+    )
+    workers_per_node, threads = get_thread_budget(
+        render_config["threads_per_worker"], workers_per_node
+    )
+    torch.set_num_threads(threads)
+    try:
+        torch.set_interop_threads(render_config["interop_threads"])
+    except RuntimeError:  # can only be set once, before any inter-op parallel work
+        if logger is not None:
+            logger.warning("Inter-op threads already set.")
+
+    if render_config["pin_workers"]:
+        cpus = get_worker_cpus(worker_index, threads, workers_per_node)
+        os.sched_setaffinity(0, cpus)
+        if logger is not None:
+            logger.info(f"Pinned to CPUs {cpus}.")
+
+    if logger is not None:
+        logger.info(f"Using {threads} threads ({workers_per_node} workers per node).")
+
+
+def worker(render_config_path, model_cache=None):
     client = daisy.Client()
     worker_id = client.worker_id
     logger = logging.getLogger(f"crop_worker_{worker_id}")
@@ -27,52 +734,74 @@ def worker(render_config_path):
         "scaleShift_input": None,
         "output_ds": None,
         "out_specs": None,
+        "inference_batch_size": 1,
+        "pipeline": False,
+        "queue_depth": 2,
+        "min_coefvar": None,
+        "occupancy_ds": None,
+        "empty_fill_value": None,
+        "resume": False,
+        "threads_per_worker": "auto",
+        "interop_threads": 1,
+        "pin_workers": False,
+        "ensemble": None,
+        "backend": "torch",
+        "precision": "fp32",
+        "freeze_for_inference": True,
+        "mmap_checkpoints": False,
+        "halo_blocks": 1,
+        "halo_axis": -1,
+        "chunk_cache_gb": None,
+        "chunk_cache_dir": DEFAULT_CHUNK_CACHE_DIR,
+        "block_order": None,
+        "center_out": False,
+        "z_slab": 1,
+        "rois": None,
+        "roi_mask": None,
+        "fragments": None,
+        "pyramid_levels": 0,
+        "pyramid_factor": 2,
+        "pyramid_mode": "mean",
     }
 
     temp = read_config(render_config_path)
     render_config.update(temp)
 
-    config_path = render_config["config_path"]
+    targets = get_render_targets(render_config)
+    config_path = targets[0]["config_path"]
     train_config = read_config(config_path)
     source_path = render_config["source_path"]
     source_dataset = render_config["source_dataset"]
-    net_name = render_config["net_name"]
-    checkpoint = render_config["checkpoint"]
-    output_ds = render_config["output_ds"]
+    output_ds = get_output_datasets(targets)
     scaleShift_input = render_config["scaleShift_input"]
     crop = render_config["crop"]
+    inference_batch_size = max(1, int(render_config["inference_batch_size"]))
+    pipeline = render_config["pipeline"]
+    queue_depth = max(1, int(render_config["queue_depth"]))
+    precision = render_config["precision"]
+    halo_blocks = max(1, int(render_config["halo_blocks"]))
+    halo_axis = render_config["halo_axis"] % 3
+    z_slab = max(1, int(render_config["z_slab"]))
     ndims = render_config["ndims"]
     if ndims is None:
         ndims = train_config["ndims"]
 
-    system = load_system(config_path)
+    # Split the node's CPUs between workers before torch starts its thread pools
+    set_threads(render_config, worker_id, logger)
 
-    if not os.path.exists(str(checkpoint)):
-        checkpoint_path = os.path.join(
-            os.path.dirname(config_path),
-            system.checkpoint_basename.lstrip("./") + f"_checkpoint_{checkpoint}",
-        )
-
-        if not os.path.exists(checkpoint_path):
-            checkpoint_path = None
+    models = get_models(render_config, targets, logger, model_cache)
+    precision = get_precision(precision, get_device(models), logger)
 
+    # Share decompressed source chunks with the other workers on this node
+    if render_config["chunk_cache_gb"] is not None:
+        chunk_cache = SharedChunkCache(
+            render_config["chunk_cache_gb"],
+            render_config["chunk_cache_dir"],
+            worker_name=f"worker_{worker_id}",
+        )
     else:
-        checkpoint_path = None
-
-    system.load_saved_model(checkpoint_path)
-    if net_name is not None:
-        model = getattr(system.model, net_name)
-    else:
-        model = system.model
-
-    model.eval()
-    if torch.cuda.is_available():
-        logger.info("Moving model to CUDA...")
-        model.to("cuda")  # TODO pick best GPU
-
-    del system
-
-    source = daisy.open_ds(source_path, source_dataset)
+        chunk_cache = None
+    source = open_cached_ds(source_path, source_dataset, chunk_cache)
 
     # Load output datsets
     if "dest_path" in render_config.keys():
@@ -82,84 +811,203 @@ def worker(render_config_path):
             os.path.dirname(config_path), os.path.basename(source_path)
         )
 
-    if output_ds is None:
-        if net_name is not None:
-            output_ds = [f"{source_dataset}_{net_name}_{checkpoint}"]
-        else:
-            output_ds = [f"{source_dataset}_{checkpoint}"]
+    # Network blocks, and the daisy blocks made of rows of them (see predict())
+    net_read_roi, net_write_roi = get_block_rois(
+        render_config, train_config, source, ndims
+    )
+    task_write_roi = get_task_rois(render_config, net_read_roi, net_write_roi, ndims)[1]
+
+    # Blocks may be handed out as positions in a list of selected blocks (see predict())
+    block_order = get_block_order(render_config, train_config, source, ndims, dest_path)
+    map_block = None if block_order is None else block_order.get_block
+
+    # Extract watershed fragments (and their edges) from the affinities of each block
+    fragments_config = get_fragments_config(render_config)
+    written_ds = list(output_ds)
+    if fragments_config is not None:
+        aff_index = output_ds.index(fragments_config["aff_ds"] or output_ds[0])
+        if not fragments_config["write_affs"]:
+            written_ds.remove(output_ds[aff_index])
+        fragments_ds = fragments_config["fragments_ds"]
+        fragments_dest = daisy.open_ds(dest_path, fragments_ds, "a")
+        edges_path = get_edges_path(dest_path, fragments_ds)
+
     destinations = {}
-    for dest_dataset in output_ds:
+    for dest_dataset in written_ds:
         destinations[dest_dataset] = daisy.open_ds(dest_path, dest_dataset, "a")
 
-    while True:
-        with client.acquire_block() as block:
-            if block is None:
+    # Downsampled scales prepared by predict()
+    pyramids = None
+    if render_config["pyramid_levels"] > 0:
+        factor = get_pyramid_factor(render_config["pyramid_factor"], ndims)
+        pyramids = {
+            dest_dataset: open_pyramid(
+                dest_path,
+                dest_dataset,
+                render_config["pyramid_levels"],
+                factor,
+                get_pyramid_mode(render_config, dest_dataset),
+            )
+            for dest_dataset in written_ds
+        }
+
+    # Record finished blocks so an interrupted render can be resumed
+    if render_config["resume"]:
+        ledger = BlockLedger(
+            get_ledger_path(dest_path, output_ds), worker_name=f"worker_{worker_id}"
+        )
+    else:
+        ledger = None
+
+    # Skip blocks marked empty in the occupancy map precomputed by predict()
+    min_coefvar = render_config["min_coefvar"]
+    empty_fill_value = render_config["empty_fill_value"]
+    if min_coefvar is not None:
+        occupancy_ds = render_config["occupancy_ds"]
+        if occupancy_ds is None:
+            occupancy_ds = f"{source_dataset}_coefvar"
+        occupancy = daisy.open_ds(dest_path, occupancy_ds)
+
+        def skip_block(block):
+            # The whole context counts: signal near a block changes its output at the border
+            if not is_empty(occupancy, block.read_roi, min_coefvar):
+                return False
+
+            if empty_fill_value is not None:
+                for dest_dataset, destination in destinations.items():
+                    shape = destination.data.shape[
+                        : destination.n_channel_dims
+                    ] + tuple(block.write_roi.get_shape() / destination.voxel_size)
+                    filled = np.full(shape, empty_fill_value, dtype=destination.dtype)
+                    destination[block.write_roi] = filled
+                    if pyramids is not None:
+                        pyramids[dest_dataset].write(block.write_roi, filled)
+            logger.info(f"Skipped empty chunk {block.block_id}...")
+            if ledger is not None:
+                ledger.record(block)
+            return True
+
+    else:
+        skip_block = None
+
+    # Normalize integer sources with a lookup table into reused buffers (enough for every batch in flight)
+    lut = get_input_lut(source.dtype, scaleShift_input)
+    buffers = InputBuffers(queue_depth + 2 if pipeline else 2)
+
+    def read_blocks(blocks):
+        # Returns a single batch tensor if all blocks have the same shape, or a list of per-block tensors
+        datas = [source.to_ndarray(block.read_roi) for block in blocks]
+        same_shape = all(data.shape == datas[0].shape for data in datas[1:])
+        if lut is not None and same_shape:
+            return prepare_batch(datas, lut, buffers, ndims)
+
+        inputs = [
+            prepare_input(data, source.dtype, ndims, scaleShift_input)
+            for data in datas
+        ]
+        if same_shape:
+            return torch.cat(inputs, 0)
+        return inputs
+
+    def run(blocks, data):
+        if ndims == 2 and z_slab > 1:
+            return run_sections(data, lambda sections: run_rows(blocks, sections))
+        return run_rows(blocks, data)
+
+    def run_rows(blocks, data):
+        if halo_blocks <= 1:
+            return run_models(models, data, precision)
+
+        # Each daisy block is a row of network blocks along the halo axis (fewer at the end of the volume)
+        voxels = source.voxel_size[halo_axis]
+        stride = net_write_roi.get_shape()[halo_axis]
+        num_blocks = blocks[0].write_roi.get_shape()[halo_axis] // stride
+        size = net_read_roi.get_shape()[halo_axis] // voxels
+        dim = data.dim() - 3 + halo_axis
+        return run_models_halo(
+            models, data, num_blocks, dim, stride // voxels, size, precision
+        )
+
+    def compute_blocks(blocks, inputs):
+        return compute_batch(blocks, inputs, run, logger)
+
+    def write_block(block, outs, exc_info=None):
+        # Returns exc_info describing any failure, so the block can be released accordingly
+        if exc_info is not None:
+            return exc_info
+        try:
+            if fragments_config is not None:  # before quantizing outputs in place
+                affs = to_output_array(outs[aff_index], np.float32, ndims, crop)
+                fragments = extract_fragments(
+                    affs,
+                    block.write_roi,
+                    source.data_roi,
+                    source.voxel_size,
+                    fragments_config,
+                    task_write_roi.get_shape(),
+                )
+                fragments_dest[block.write_roi] = fragments
+                save_block_edges(edges_path, block.write_roi, fragments, affs)
+            write_outputs(
+                outs,
+                block,
+                destinations,
+                output_ds,
+                ndims,
+                crop,
+                logger,
+                pyramids,
+            )
+            if ledger is not None:
+                ledger.record(block)
+        except Exception:
+            logger.exception(f"Failed to write block {block.block_id}.")
+            return sys.exc_info()
+
+        return (None, None, None)
+
+    def fail_batch(managers, blocks):
+        logger.exception(f"Failed to read batch of {len(blocks)} blocks.")
+        exc_info = sys.exc_info()
+        for manager in managers:
+            release_block(manager, exc_info)
+
+    if pipeline:
+        run_pipelined(
+            client,
+            inference_batch_size,
+            queue_depth,
+            read_blocks,
+            compute_blocks,
+            write_block,
+            logger,
+            skip_block=skip_block,
+            map_block=map_block,
+        )
+
+    else:
+        while True:
+            managers, blocks = acquire_blocks(
+                client, inference_batch_size, skip_block, map_block
+            )
+            if len(blocks) == 0:
                 break
 
+            try:
+                inputs = read_blocks(blocks)
+            except Exception:
+                fail_batch(managers, blocks)
             else:
-                data = source.to_ndarray(block.read_roi)
-                if torch.cuda.is_available():
-                    data = torch.cuda.FloatTensor(data).unsqueeze(0)
-                else:
-                    data = torch.FloatTensor(data).unsqueeze(0)
-
-                if ndims == 3:
-                    data = data.unsqueeze(0)
-
-                data -= np.iinfo(source.dtype).min  # TODO: Assumes integer inputs
-                data /= np.iinfo(source.dtype).max
-
-                if scaleShift_input is not None:
-                    data *= scaleShift_input[0]
-                    data += scaleShift_input[1]
-
-                outs = model(data)
-                # del data
-
-                if not isinstance(outs, tuple):
-                    outs = tuple([outs])
-
-                for out, dest_dataset in zip(outs, output_ds):
-                    destination = destinations[dest_dataset]
-                    out = out.detach().squeeze()
-                    if crop and crop != 0:
-                        if ndims == 2:
-                            out = out[crop:-crop, crop:-crop]
-                        elif ndims == 3:
-                            out = out[crop:-crop, crop:-crop, crop:-crop]
-                        else:
-                            raise NotImplementedError()
-
-                    try:
-                        out *= np.iinfo(destination.dtype).max
-                        out = torch.clamp(
-                            out,
-                            np.iinfo(destination.dtype).min,
-                            np.iinfo(destination.dtype).max,
-                        )
-                    except:
-                        logger.info(
-                            f"Assuming output data for {dest_dataset} is float between 0 and 1..."
-                        )
-                        # out = torch.clamp(out, 0, 1) #TODO
-
-                    if torch.cuda.is_available():
-                        out = out.cpu().numpy().astype(destination.dtype)
-                    else:
-                        out = out.numpy().astype(destination.dtype)
-
-                    if (
-                        ndims == 2 and len(out.shape) < 3
-                    ):  # Add Z dimension if necessary
-                        out = out[None, ...]
-                    elif (
-                        ndims == 2 and len(out.shape) == 3
-                    ):  # Add Z dimension if necessary
-                        out = out[:, None, ...]
-
-                    destination[block.write_roi] = out
-                    logger.info(f"Wrote chunk {block.block_id} to {dest_dataset}...")
-                    # del out
+                results = compute_blocks(blocks, inputs)
+                # Release each block as soon as it is written
+                for manager, block, (outs, exc_info) in zip(managers, blocks, results):
+                    release_block(manager, write_block(block, outs, exc_info))
+
+            if len(blocks) < inference_batch_size:  # scheduler has no more blocks
+                break
+
+    if chunk_cache is not None:
+        chunk_cache.close()
 
 
 if __name__ == "__main__":
@@ -11,7 +11,7 @@ import torch
 
 from raygun.torch.utils import read_config
 from raygun.torch import networks
-from raygun.torch.networks.utils import init_weights
+from raygun.torch.networks.utils import freeze_for_inference, init_weights
 from raygun.torch import train
 
 parent_dir = os.path.dirname(os.path.dirname(__file__))
@@ -39,7 +39,10 @@ class BaseSystem:
             except:
                 self.checkpoint_basename = "./models/model"
 
-        if not hasattr(self, "checkpoint") or self.checkpoint is None:
+        inference_only = getattr(self, "inference_only", False)
+        if not inference_only and (
+            not hasattr(self, "checkpoint") or self.checkpoint is None
+        ):
             try:
                 self.checkpoint, self.iteration = self._get_latest_checkpoint()
             except:
@@ -97,6 +100,66 @@ class BaseSystem:
         os.environ["CUDA_VISIBLE_DEVICES"] = str(id)
         # torch.cuda.set_device(id) # breaks spawning subprocesses
 
+    @classmethod
+    def load_model(
+        cls, config, checkpoint=None, net_name=None, frozen=False, weights_only=False
+    ):
+        """Build only the model (or one of its networks) from a configuration and load its weights.
+
+        Skips everything else the system sets up for training: no datasets opened if avoidable, and no weight initialization (networks are built on the meta device and their weights assigned straight from the memory-mapped checkpoint).
+
+        Args:
+            config (str): Path to the training configuration.
+            checkpoint (str, optional): Path to a checkpoint file. Defaults to None (the latest checkpoint of the system).
+            net_name (str, optional): Name of the network in the model to load (e.g. "netG1"). Defaults to the whole model.
+            frozen (bool, optional): Whether the checkpoint holds the weights after `freeze_for_inference` (see `raygun.torch.predict.checkpoint`). Defaults to False.
+            weights_only (bool, optional): Whether to refuse to unpickle anything but tensors and plain containers, e.g. for the inference-only checkpoints of `raygun.torch.predict.checkpoint`. Defaults to False.
+
+        Returns:
+            torch.nn.Module: The model or network, in eval mode on the CPU.
+        """
+        system = cls.__new__(cls)
+        system.inference_only = True
+        system.__init__(config)
+
+        if checkpoint is None:  # as when training systems resume
+            try:
+                checkpoint, _ = system._get_latest_checkpoint()
+            except AttributeError:
+                checkpoint = None
+            if checkpoint is None:
+                raise FileNotFoundError(f"No saved checkpoint found for {config}.")
+            logging.getLogger(__name__).warning(
+                f"No checkpoint given, using the latest one: {checkpoint}"
+            )
+
+        with torch.device("meta"):
+            system.setup_model()
+        model = system.model if net_name is None else getattr(system.model, net_name)
+        model.eval()
+
+        if frozen:  # match the layers of the saved network
+            freeze_for_inference(model)
+
+        load_kwargs = {"map_location": "cpu", "weights_only": weights_only}
+        try:
+            state_dict = torch.load(checkpoint, mmap=True, **load_kwargs)
+        except RuntimeError:  # legacy (non-zip) checkpoints cannot be mapped
+            state_dict = torch.load(checkpoint, **load_kwargs)
+
+        if "model_state_dict" in state_dict:
+            state_dict = state_dict["model_state_dict"]
+        prefix = f"{net_name}."
+        if net_name is not None and any(k.startswith(prefix) for k in state_dict):
+            state_dict = {
+                k[len(prefix) :]: v
+                for k, v in state_dict.items()
+                if k.startswith(prefix)
+            }
+        model.load_state_dict(state_dict, assign=True)
+
+        return model
+
     def load_saved_model(self, checkpoint=None, cuda_available=None):
         if not hasattr(self, "model"):
             self.setup_model()
@@ -131,7 +194,12 @@ class BaseSystem:
         def natural_keys(text):
             return [atoi(c) for c in re.split(r"(\d+)", text)]
 
-        checkpoints = glob(basename + "_checkpoint_*")
+        # Skip the inference-only checkpoints and exports saved next to training checkpoints
+        checkpoints = [
+            checkpoint
+            for checkpoint in glob(basename + "_checkpoint_*")
+            if checkpoint.split("_")[-1].isdigit()
+        ]
         checkpoints.sort(key=natural_keys)
 
         if len(checkpoints) > 0:
@@ -223,6 +291,9 @@ class BaseSystem:
 
             net = torch.nn.Sequential(*layers)
 
+        if getattr(self, "inference_only", False):  # weights come from a checkpoint
+            return net
+
         activation = (
             net_kwargs["activation"] if "activation" in net_kwargs else torch.nn.ReLU
         )
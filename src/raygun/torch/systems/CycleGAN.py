@@ -24,13 +24,15 @@ class CycleGAN(BaseSystem):
         )
         self.logger = logging.Logger(__name__, "INFO")
 
-        if self.common_voxel_size is None:
+        if self.common_voxel_size is None and not (
+            getattr(self, "inference_only", False) and self.ndims is not None
+        ):  # only ndims is needed to build the networks
             self.common_voxel_size = gp.Coordinate(
                 daisy.open_ds(
                     self.sources["B"]["path"], self.sources["B"]["name"]
                 ).voxel_size
             )
-        else:
+        elif self.common_voxel_size is not None:
             self.common_voxel_size = gp.Coordinate(self.common_voxel_size)
         if self.ndims is None:
             self.ndims = sum(
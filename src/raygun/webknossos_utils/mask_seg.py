@@ -2,6 +2,17 @@
 import sys
 import daisy
 
+from raygun.blockwise import (
+    CachedArray,
+    check_write_alignment,
+    get_cache_stats,
+    get_chunk_shape,
+    open_cached_ds,
+    plan_write_size,
+    reset_cache_stats,
+    SharedChunkCache,
+)
+
 
 def mask_seg(
     seg_file,
@@ -11,6 +22,7 @@ def mask_seg(
     mask_file=None,
     out_file=None,
     mask_out=False,
+    chunk_cache_gb=None,
 ):
     if mask_file is None:
         mask_file = seg_file
@@ -22,8 +34,14 @@ def mask_seg(
         out_ds = f"{seg_ds}_masked"
 
     print("Loading...")
-    seg = daisy.open_ds(seg_file, seg_ds)
-    mask = daisy.open_ds(mask_file, mask_ds)
+    if chunk_cache_gb is not None:
+        # Share decompressed chunks between the workers on this node
+        chunk_cache = SharedChunkCache(float(chunk_cache_gb))
+        reset_cache_stats(chunk_cache.cache_dir)
+    else:
+        chunk_cache = None
+    seg = open_cached_ds(seg_file, seg_ds, chunk_cache)
+    mask = open_cached_ds(mask_file, mask_ds, chunk_cache)
 
     print("Saving...")
     target_roi = mask.roi
@@ -36,7 +54,12 @@ def mask_seg(
         "blocksize": chunk_size,
     }
     num_workers = 30
-    write_size = seg.voxel_size * chunk_size
+    # Whole chunks of the segmentation per block, at least chunk_size voxels along each axis
+    seg_chunk_shape = get_chunk_shape(seg)
+    min_size = seg.voxel_size * chunk_size
+    write_size = plan_write_size(
+        seg_chunk_shape if seg_chunk_shape is not None else min_size, min_size
+    )
     chunk_roi = daisy.Roi(
         [
             0,
@@ -55,6 +78,7 @@ def mask_seg(
         write_roi=chunk_roi,
         compressor=compressor,
     )
+    check_write_alignment(out, chunk_roi, target_roi, out_ds)
 
     # Prepare saving function/variables
     def save_chunk(block: daisy.Roi):
@@ -65,6 +89,8 @@ def mask_seg(
             out_data = seg_data * (mask.to_ndarray(block.read_roi) > 0)
 
         out.__setitem__(block.write_roi, out_data)
+        if chunk_cache is not None:
+            chunk_cache.write_stats()
 
     # Write data to new dataset
     task = daisy.Task(
@@ -79,6 +105,14 @@ def mask_seg(
         max_retries=2,
     )
     success = daisy.run_blockwise([task])
+    if chunk_cache is not None:
+        hits, misses, hit_rate = get_cache_stats(chunk_cache.cache_dir)
+        print(
+            f"Chunk cache: {hits} hits, {misses} misses ({100 * hit_rate:.1f}% hit rate)"
+        )
+        for array in [seg, mask]:
+            if isinstance(array, CachedArray):
+                chunk_cache.clear(array.key)
 
     if success:
         print(
@@ -100,6 +134,7 @@ if __name__ == "__main__":
         "mask_file",
         "out_file",
         "mask_out",
+        "chunk_cache_gb",
     ]
     for i, arg in enumerate(sys.argv[1:]):
         kwargs[keys[i]] = arg
@@ -14,6 +14,8 @@ from funlib.geometry import Roi, Coordinate
 import numpy as np
 from skimage.draw import line_nd
 
+from raygun.blockwise import check_write_alignment, get_chunk_shape, plan_write_size
+
 
 logger = logging.getLogger(__name__)
 
@@ -220,7 +222,8 @@ def get_wk_mask(
             "blocksize": chunk_size,
         }
         num_workers = 30
-        write_size = mask_array.voxel_size * chunk_size
+        # Write whole chunks of the raw dataset, whose chunks the mask inherits
+        write_size = plan_write_size(get_chunk_shape(ds))
         chunk_roi = daisy.Roi(
             [
                 0,
@@ -240,6 +243,7 @@ def get_wk_mask(
             # num_channels=num_channels,
             compressor=compressor,
         )
+        check_write_alignment(destination, chunk_roi, target_roi, save_name)
 
         # Prepare saving function/variables
         def save_chunk(block: daisy.Roi):
@@ -365,7 +369,8 @@ def wkw_seg_to_zarr(
         "blocksize": chunk_size,
     }
     num_workers = 30
-    write_size = gt_array.voxel_size * chunk_size
+    # Write whole chunks of the raw dataset, whose chunks the annotations inherit
+    write_size = plan_write_size(get_chunk_shape(ds))
     chunk_roi = daisy.Roi(
         [
             0,
@@ -385,6 +390,7 @@ def wkw_seg_to_zarr(
         # num_channels=num_channels,
         # compressor=compressor,
     )
+    check_write_alignment(destination, chunk_roi, target_roi, gt_name)
 
     # Prepare saving function/variables
     def save_chunk(block: daisy.Roi):
@@ -0,0 +1,62 @@
+import unittest
+import numpy as np
+from raygun.blockwise.fragments import *
+
+
+class TestAggregateEdges(unittest.TestCase):
+    def test_duplicates(self):
+        edges = np.array([[1, 2], [2, 1], [3, 1]], dtype=np.uint64)
+        edges, sums, counts = aggregate_edges(
+            edges, np.array([0.5, 0.25, 1.0]), np.array([1, 1, 2])
+        )
+        self.assertEqual(edges.tolist(), [[1, 2], [1, 3]])
+        self.assertEqual(sums.tolist(), [0.75, 1.0])
+        self.assertEqual(counts.tolist(), [2, 2])
+
+    def test_empty(self):
+        edges, sums, counts = aggregate_edges(
+            np.zeros((0, 2), dtype=np.uint64), np.zeros(0), np.zeros(0)
+        )
+        self.assertEqual(edges.shape, (0, 2))
+        self.assertEqual(len(sums), 0)
+        self.assertEqual(len(counts), 0)
+
+
+class TestFragmentEdges(unittest.TestCase):
+    def test_edges(self):
+        fragments = np.zeros((2, 2, 2), dtype=np.uint64)
+        fragments[..., 0] = 1
+        fragments[..., 1] = 2
+        fragments[1, 1, 1] = 0  # background voxels make no edges
+        affs = np.zeros((3, 2, 2, 2))
+        affs[2] = 0.5
+
+        edges, sums, counts = get_fragment_edges(fragments, affs)
+        self.assertEqual(edges.tolist(), [[1, 2]])
+        self.assertEqual(counts.tolist(), [3])
+        self.assertEqual(sums.tolist(), [1.5])
+
+    def test_single_fragment(self):
+        fragments = np.ones((2, 3, 4), dtype=np.uint64)
+        edges, _, _ = get_fragment_edges(fragments, np.ones((3, 2, 3, 4)))
+        self.assertEqual(len(edges), 0)
+
+
+class TestRelabel(unittest.TestCase):
+    def test_relabel(self):
+        fragments = np.array([[0, 1], [2, 5]], dtype=np.uint64)
+        ids = np.array([1, 2, 3], dtype=np.uint64)
+        segment_ids = np.array([10, 10, 20], dtype=np.uint64)
+        out = relabel(fragments, ids, segment_ids, np.zeros_like(fragments))
+        # Fragments without edges (and the background) keep their ID
+        self.assertEqual(out.tolist(), [[0, 10], [10, 5]])
+
+    def test_no_ids(self):
+        fragments = np.array([[0, 1], [2, 5]], dtype=np.uint64)
+        out = relabel(
+            fragments,
+            np.zeros(0, dtype=np.uint64),
+            np.zeros(0, dtype=np.uint64),
+            np.zeros_like(fragments),
+        )
+        self.assertEqual(out.tolist(), fragments.tolist())
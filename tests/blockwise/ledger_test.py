@@ -0,0 +1,65 @@
+import os
+import tempfile
+import unittest
+import daisy
+from raygun.blockwise.ledger import *
+
+
+def make_block(begin):
+    write_roi = daisy.Roi(begin, (10, 10, 10))
+    return daisy.Block(daisy.Roi((0, 0, 0), (100, 100, 100)), write_roi, write_roi)
+
+
+class TestBlockLedger(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tempdir.name, "ledger")
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_block_key(self):
+        self.assertEqual(get_block_key(make_block((0, 10, 20))), "0_10_20")
+
+    def test_ledger_path(self):
+        path = get_ledger_path("out.zarr", ["volumes/pred_affs", "volumes/pred_lsds"])
+        self.assertEqual(
+            path, os.path.join("out.zarr", ".ledgers", "volumes-pred_affs+volumes-pred_lsds")
+        )
+
+    def test_record_and_resume(self):
+        ledger = BlockLedger(self.path, worker_name="a")
+        ledger.reset("fingerprint")
+        ledger.record(make_block((0, 0, 0)))
+        BlockLedger(self.path, worker_name="b").record(make_block((10, 0, 0)))
+
+        resumed = BlockLedger(self.path)
+        self.assertTrue(resumed.check_fingerprint("fingerprint"))
+        self.assertTrue(resumed.is_done(make_block((0, 0, 0))))
+        self.assertTrue(resumed.is_done(make_block((10, 0, 0))))
+        self.assertFalse(resumed.is_done(make_block((20, 0, 0))))
+
+    def test_reset(self):
+        ledger = BlockLedger(self.path, worker_name="a")
+        ledger.reset("old")
+        ledger.record(make_block((0, 0, 0)))
+        self.assertFalse(ledger.check_fingerprint("new"))
+
+        ledger.reset("new")
+        self.assertTrue(ledger.check_fingerprint("new"))
+        self.assertFalse(BlockLedger(self.path).is_done(make_block((0, 0, 0))))
+
+    def test_missing_fingerprint(self):
+        self.assertFalse(BlockLedger(self.path).check_fingerprint("fingerprint"))
+
+    def test_fingerprint(self):
+        file = os.path.join(self.tempdir.name, "checkpoint")
+        with open(file, "w") as f:
+            f.write("weights")
+        fingerprint = get_fingerprint({"a": 1}, files=[file])
+
+        self.assertEqual(fingerprint, get_fingerprint({"a": 1}, files=[file]))
+        self.assertNotEqual(fingerprint, get_fingerprint({"a": 2}, files=[file]))
+        with open(file, "a") as f:
+            f.write(" changed")
+        self.assertNotEqual(fingerprint, get_fingerprint({"a": 1}, files=[file]))
@@ -0,0 +1,71 @@
+import os
+import tempfile
+import unittest
+import daisy
+import numpy as np
+from raygun.blockwise.occupancy import *
+
+
+class TestCoefvar(unittest.TestCase):
+    def test_coefvar(self):
+        data = np.ones((4, 8), dtype=np.uint8)
+        data[:2, 4:] = [0, 2, 0, 2]
+        coefvar = get_coefvar(data, (2, 4))
+        self.assertEqual(coefvar.shape, (2, 2))
+        self.assertEqual(coefvar.tolist(), [[0, 1], [0, 0]])
+
+    def test_zero_mean(self):
+        coefvar = get_coefvar(np.zeros((4, 4)), (2, 2))
+        self.assertTrue(np.all(coefvar == 0))
+
+
+class TestOccupancy(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tempdir.name, "test.zarr")
+        self.source = daisy.prepare_ds(
+            self.path,
+            "raw",
+            daisy.Roi((0, 0, 0), (16, 16, 16)),
+            daisy.Coordinate((1, 1, 1)),
+            np.uint8,
+        )
+        # Constant background, with signal in a single corner
+        data = np.full((16, 16, 16), 128, dtype=np.uint8)
+        data[:4, :4, :4] = np.random.RandomState(0).randint(1, 256, (4, 4, 4))
+        self.source[self.source.roi] = data
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_compute_occupancy(self):
+        occupancy = compute_occupancy(
+            self.source, self.path, "raw_coefvar", 4, num_workers=1, block_shape=2
+        )
+        self.assertEqual(occupancy.voxel_size, daisy.Coordinate((4, 4, 4)))
+        data = occupancy.to_ndarray(occupancy.roi)
+        self.assertEqual(data.shape, (4, 4, 4))
+        self.assertGreater(data[0, 0, 0], 0)
+        data[0, 0, 0] = 0
+        self.assertTrue(np.all(data == 0))
+
+    def test_check_occupancy(self):
+        self.assertFalse(check_occupancy(self.path, "raw_coefvar", self.source, 4))
+        compute_occupancy(
+            self.source, self.path, "raw_coefvar", 4, num_workers=1, block_shape=2
+        )
+        self.assertTrue(check_occupancy(self.path, "raw_coefvar", self.source, 4))
+        self.assertTrue(
+            check_occupancy(self.path, "raw_coefvar", self.source, (4, 4, 4))
+        )
+        self.assertFalse(check_occupancy(self.path, "raw_coefvar", self.source, 2))
+
+    def test_is_empty(self):
+        occupancy = compute_occupancy(
+            self.source, self.path, "raw_coefvar", 4, num_workers=1, block_shape=2
+        )
+        self.assertFalse(is_empty(occupancy, daisy.Roi((0, 0, 0), (4, 4, 4)), 0.1))
+        self.assertTrue(is_empty(occupancy, daisy.Roi((8, 8, 8), (8, 8, 8)), 0.1))
+        # Partially covered coarse voxels count, as do regions past the map's end
+        self.assertFalse(is_empty(occupancy, daisy.Roi((3, 3, 3), (2, 2, 2)), 0.1))
+        self.assertTrue(is_empty(occupancy, daisy.Roi((12, 12, 12), (8, 8, 8)), 0.1))
@@ -0,0 +1,134 @@
+import itertools
+import os
+import tempfile
+import unittest
+import daisy
+import numpy as np
+from raygun.blockwise.ordering import *
+
+
+class TestCurves(unittest.TestCase):
+    def test_morton_key(self):
+        self.assertEqual(
+            [morton_key(index, 1) for index in [(0, 0), (0, 1), (1, 0), (1, 1)]],
+            [0, 1, 2, 3],
+        )
+
+    def test_hilbert_key(self):
+        for ndims, bits in [(2, 3), (3, 2)]:
+            grid = list(itertools.product(range(2**bits), repeat=ndims))
+            keys = [hilbert_key(index, bits) for index in grid]
+            self.assertEqual(sorted(keys), list(range(len(grid))))
+
+            # Consecutive positions along the curve are neighbouring blocks
+            curve = [index for _, index in sorted(zip(keys, grid))]
+            for a, b in zip(curve, curve[1:]):
+                self.assertEqual(np.abs(np.subtract(a, b)).sum(), 1)
+
+
+class TestBlockGrid(unittest.TestCase):
+    def setUp(self):
+        self.total_roi = daisy.Roi((0, 0, 0), (10, 25, 40))
+        self.read_roi = daisy.Roi((0, 0, 0), (10, 10, 10))
+        self.write_roi = daisy.Roi((0, 2, 2), (10, 6, 6))
+
+    def test_valid(self):
+        grid = get_block_grid(self.total_roi, self.read_roi, self.write_roi)
+        self.assertEqual(grid.shape, (1 * 3 * 6, 3))
+        self.assertEqual(tuple(grid.max(axis=0)), (0, 2, 5))
+
+    def test_shrink(self):
+        grid = get_block_grid(self.total_roi, self.read_roi, self.write_roi, "shrink")
+        self.assertEqual(tuple(grid.max(axis=0)), (0, 3, 5))
+
+    def test_too_small(self):
+        grid = get_block_grid(
+            daisy.Roi((0, 0, 0), (5, 5, 5)), self.read_roi, self.write_roi
+        )
+        self.assertEqual(len(grid), 0)
+
+
+class TestBlockOrder(unittest.TestCase):
+    def setUp(self):
+        self.total_roi = daisy.Roi((0, 0, 0), (40, 40, 40))
+        self.read_roi = daisy.Roi((0, 0, 0), (10, 10, 10))
+        self.write_roi = daisy.Roi((0, 0, 0), (10, 10, 10))
+
+    def test_orders(self):
+        for order in BLOCK_ORDERS:
+            block_order = BlockOrder(
+                self.total_roi, self.read_roi, self.write_roi, order
+            )
+            self.assertEqual(len(block_order), 64)
+            self.assertEqual(len({tuple(i) for i in block_order.grid}), 64)
+
+        raster = BlockOrder(self.total_roi, self.read_roi, self.write_roi, "raster")
+        self.assertEqual(tuple(raster.grid[1]), (0, 0, 1))
+
+    def test_unknown_order(self):
+        with self.assertRaises(ValueError):
+            BlockOrder(self.total_roi, self.read_roi, self.write_roi, "spiral")
+
+    def test_select(self):
+        keep = daisy.Roi((0, 0, 0), (20, 10, 10))
+        block_order = BlockOrder(
+            self.total_roi,
+            self.read_roi,
+            self.write_roi,
+            select=lambda write_roi: keep.contains(write_roi),
+        )
+        self.assertEqual(len(block_order), 2)
+
+    def test_center_out(self):
+        block_order = BlockOrder(
+            self.total_roi, self.read_roi, self.write_roi, center_out=True
+        )
+        first = {tuple(i) for i in block_order.grid[:8]}
+        self.assertEqual(first, set(itertools.product([1, 2], repeat=3)))
+
+    def test_get_block(self):
+        block_order = BlockOrder(self.total_roi, self.read_roi, self.write_roi)
+        total_roi, read_roi, write_roi = block_order.get_task_rois()
+        self.assertEqual(total_roi, daisy.Roi((0,), (64,)))
+
+        task_block = daisy.Block(total_roi, daisy.Roi((5,), (1,)), daisy.Roi((5,), (1,)))
+        block = block_order.get_block(task_block)
+        expected = daisy.Coordinate(tuple(int(i) * 10 for i in block_order.grid[5]))
+        self.assertEqual(block.write_roi, daisy.Roi(expected, (10, 10, 10)))
+
+    def test_shrink(self):
+        block_order = BlockOrder(
+            daisy.Roi((0, 0, 0), (10, 10, 25)),
+            self.read_roi,
+            self.write_roi,
+            "raster",
+            fit="shrink",
+        )
+        self.assertEqual(len(block_order), 3)
+        read_roi, write_roi = block_order.get_rois(block_order.grid[-1])
+        self.assertEqual(write_roi, daisy.Roi((0, 0, 20), (10, 10, 5)))
+        self.assertEqual(read_roi, write_roi)
+
+        # Shrunk blocks are numbered like full-size ones
+        total_roi = block_order.get_task_rois()[0]
+        blocks = [
+            block_order.get_block(
+                daisy.Block(total_roi, daisy.Roi((i,), (1,)), daisy.Roi((i,), (1,)))
+            )
+            for i in range(len(block_order))
+        ]
+        self.assertEqual(len({block.block_id for block in blocks}), 3)
+        full = daisy.Block(
+            block_order.total_roi, self.read_roi, self.write_roi.shift(daisy.Coordinate((0, 0, 10)))
+        )
+        self.assertEqual(blocks[1].block_id[1], full.block_id[1])
+
+    def test_save(self):
+        block_order = BlockOrder(self.total_roi, self.read_roi, self.write_roi)
+        with tempfile.TemporaryDirectory() as tempdir:
+            path = os.path.join(tempdir, "orders", "order.npy")
+            block_order.save(path)
+            loaded = BlockOrder(
+                self.total_roi, self.read_roi, self.write_roi, grid=np.load(path)
+            )
+        self.assertTrue(np.array_equal(loaded.grid, block_order.grid))
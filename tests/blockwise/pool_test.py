@@ -0,0 +1,128 @@
+import multiprocessing.connection
+import os
+import stat
+import tempfile
+import threading
+import unittest
+from unittest import mock
+from raygun.blockwise.pool import *
+
+
+class TestPoolAddress(unittest.TestCase):
+    def test_parse(self):
+        self.assertEqual(get_pool_address(), DEFAULT_POOL_ADDRESS)
+        self.assertEqual(get_pool_address(True), DEFAULT_POOL_ADDRESS)
+        self.assertEqual(get_pool_address("localhost:6000"), ("localhost", 6000))
+        self.assertEqual(get_pool_address(["localhost", 6000]), ("localhost", 6000))
+        self.assertEqual(get_pool_address("/tmp/pool.sock"), "/tmp/pool.sock")
+
+    def test_local(self):
+        self.assertEqual(check_pool_address(None), DEFAULT_POOL_ADDRESS)
+        self.assertEqual(
+            check_pool_address("127.0.0.1:6000"), ("127.0.0.1", 6000)
+        )
+
+    def test_remote(self):
+        with self.assertRaises(ValueError):
+            check_pool_address("0.0.0.0:6000")
+        with self.assertLogs("raygun.blockwise.pool", "WARNING"):
+            self.assertEqual(
+                check_pool_address("0.0.0.0:6000", allow_remote=True),
+                ("0.0.0.0", 6000),
+            )
+
+
+class TestPoolAuthkey(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.authkey_file = os.path.join(self.tempdir.name, "raygun", "pool_authkey")
+        self.environ = mock.patch.dict(os.environ)
+        self.environ.start()
+        os.environ.pop(POOL_AUTHKEY_ENV, None)
+
+    def tearDown(self):
+        self.environ.stop()
+        self.tempdir.cleanup()
+
+    def test_missing(self):
+        with self.assertRaises(RuntimeError):
+            get_pool_authkey(authkey_file=self.authkey_file)
+
+    def test_create(self):
+        authkey = get_pool_authkey(create=True, authkey_file=self.authkey_file)
+        self.assertEqual(len(authkey), 64)
+        self.assertEqual(stat.S_IMODE(os.stat(self.authkey_file).st_mode), 0o600)
+        self.assertEqual(
+            stat.S_IMODE(os.stat(os.path.dirname(self.authkey_file)).st_mode), 0o700
+        )
+        # Reused by later pools and clients
+        self.assertEqual(get_pool_authkey(authkey_file=self.authkey_file), authkey)
+        self.assertEqual(
+            get_pool_authkey(create=True, authkey_file=self.authkey_file), authkey
+        )
+
+    def test_readable_by_others(self):
+        get_pool_authkey(create=True, authkey_file=self.authkey_file)
+        for mode in [0o640, 0o604]:
+            os.chmod(self.authkey_file, mode)
+            with self.assertRaises(RuntimeError):
+                get_pool_authkey(authkey_file=self.authkey_file)
+
+    def test_environment(self):
+        os.environ[POOL_AUTHKEY_ENV] = "secret"
+        self.assertEqual(get_pool_authkey(authkey_file=self.authkey_file), b"secret")
+        self.assertFalse(os.path.exists(self.authkey_file))
+
+
+class TestSubmitJob(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.address = os.path.join(self.tempdir.name, "pool.sock")
+        self.environ = mock.patch.dict(
+            os.environ, {POOL_AUTHKEY_ENV: "secret", DAISY_CONTEXT_ENV: "context"}
+        )
+        self.environ.start()
+        self.listener = multiprocessing.connection.Listener(
+            self.address, authkey=b"secret"
+        )
+        self.received = []
+
+    def tearDown(self):
+        self.listener.close()
+        self.environ.stop()
+        self.tempdir.cleanup()
+
+    def serve(self, reply=None):
+        connection = self.listener.accept()
+        self.received.append(connection.recv())
+        if reply is not None:
+            connection.send(reply)
+        try:
+            self.received.append(connection.recv())
+        except EOFError:
+            pass
+        connection.close()
+
+    def submit(self, reply=None, timeout=None):
+        thread = threading.Thread(target=self.serve, args=(reply,))
+        thread.start()
+        try:
+            submit_job(self.address, "render.json", timeout)
+        finally:
+            thread.join()
+
+    def test_done(self):
+        self.submit(("done", None))
+        self.assertEqual(
+            self.received,
+            [{"render_config_path": "render.json", "daisy_context": "context"}],
+        )
+
+    def test_failed(self):
+        with self.assertRaises(RuntimeError):
+            self.submit(("failed", "Traceback"))
+
+    def test_timeout(self):
+        with self.assertRaises(TimeoutError):
+            self.submit(timeout=0.1)
+        self.assertEqual(self.received[-1], "cancel")
@@ -0,0 +1,66 @@
+import unittest
+import daisy
+import numpy as np
+from raygun.blockwise.pyramid import *
+
+
+class TestDownsample(unittest.TestCase):
+    def test_mean(self):
+        data = np.arange(16, dtype=np.float32).reshape(4, 4)
+        out = downsample(data, (2, 2))
+        self.assertEqual(out.dtype, np.float32)
+        self.assertEqual(out.tolist(), [[2.5, 4.5], [10.5, 12.5]])
+
+    def test_integer_rounding(self):
+        data = np.array([[1, 2], [2, 2]], dtype=np.uint8)
+        out = downsample(data, (2, 2))
+        self.assertEqual(out.dtype, np.uint8)
+        self.assertEqual(out.tolist(), [[2]])  # 1.75
+
+    def test_mode(self):
+        data = np.array([[3, 3, 1, 2], [5, 3, 2, 2]], dtype=np.uint64)
+        out = downsample(data, (2, 2), "mode")
+        self.assertEqual(out.dtype, np.uint64)
+        self.assertEqual(out.tolist(), [[3, 2]])
+
+    def test_channels(self):
+        data = np.zeros((3, 2, 4, 4), dtype=np.float32)
+        data[1] = 1
+        out = downsample(data, (1, 2, 2), n_channel_dims=1)
+        self.assertEqual(out.shape, (3, 2, 2, 2))
+        self.assertTrue(np.all(out[1] == 1))
+        self.assertTrue(np.all(out[[0, 2]] == 0))
+
+    def test_unknown_mode(self):
+        with self.assertRaises(ValueError):
+            downsample(np.zeros((2, 2)), (2, 2), "max")
+
+
+class TestCheckPyramid(unittest.TestCase):
+    def setUp(self):
+        self.total_roi = daisy.Roi((0, 0, 0), (64, 64, 64))
+        self.voxel_size = daisy.Coordinate((1, 1, 1))
+        self.factor = daisy.Coordinate((1, 2, 2))
+
+    def test_aligned(self):
+        write_roi = daisy.Roi((0, 8, 8), (4, 16, 16))
+        check_pyramid(write_roi, self.total_roi, self.voxel_size, self.factor, 2)
+
+    def test_write_size(self):
+        write_roi = daisy.Roi((0, 0, 0), (4, 16, 6))
+        with self.assertRaises(ValueError):
+            check_pyramid(write_roi, self.total_roi, self.voxel_size, self.factor, 2)
+
+    def test_begin(self):
+        write_roi = daisy.Roi((0, 2, 0), (4, 16, 16))
+        with self.assertRaises(ValueError):
+            check_pyramid(write_roi, self.total_roi, self.voxel_size, self.factor, 2)
+
+
+class TestPyramidFactor(unittest.TestCase):
+    def test_factor(self):
+        self.assertEqual(get_pyramid_factor(2, 2), daisy.Coordinate((1, 2, 2)))
+        self.assertEqual(get_pyramid_factor(2, 3), daisy.Coordinate((2, 2, 2)))
+        self.assertEqual(
+            get_pyramid_factor((1, 2, 4), 3), daisy.Coordinate((1, 2, 4))
+        )
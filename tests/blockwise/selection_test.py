@@ -0,0 +1,95 @@
+import os
+import tempfile
+import unittest
+import daisy
+import numpy as np
+from raygun.blockwise.ordering import BlockOrder
+from raygun.blockwise.selection import *
+
+
+class TestRois(unittest.TestCase):
+    def test_parse_rois(self):
+        rois = parse_rois([[[0, 0, 0], [10, 20, 30]], [[5, 5, 5], [1, 1, 1]]])
+        self.assertEqual(rois[0], daisy.Roi((0, 0, 0), (10, 20, 30)))
+        self.assertEqual(rois[1], daisy.Roi((5, 5, 5), (1, 1, 1)))
+
+    def test_select_rois(self):
+        selection = BlockSelection(rois=[daisy.Roi((15, 15, 15), (10, 10, 10))])
+        self.assertTrue(selection(daisy.Roi((10, 10, 10), (10, 10, 10))))
+        self.assertTrue(selection(daisy.Roi((20, 20, 20), (10, 10, 10))))
+        self.assertFalse(selection(daisy.Roi((0, 0, 0), (10, 10, 10))))
+        self.assertFalse(selection(daisy.Roi((25, 15, 15), (10, 10, 10))))
+
+    def test_nothing_to_select(self):
+        with self.assertRaises(ValueError):
+            BlockSelection()
+
+    def test_no_selection(self):
+        self.assertIsNone(get_block_selection({}))
+        self.assertIsNone(get_block_selection({"rois": None, "roi_mask": None}))
+
+
+class TestMask(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tempdir.name, "test.zarr")
+        # Coarser than the blocks, with a single voxel set
+        mask = daisy.prepare_ds(
+            self.path,
+            "mask",
+            daisy.Roi((0, 0, 0), (40, 40, 40)),
+            daisy.Coordinate((20, 20, 20)),
+            np.uint8,
+        )
+        data = np.zeros((2, 2, 2), dtype=np.uint8)
+        data[1, 1, 1] = 1
+        mask[mask.roi] = data
+        self.total_roi = daisy.Roi((0, 0, 0), (40, 40, 40))
+        self.block_roi = daisy.Roi((0, 0, 0), (10, 10, 10))
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_select_mask(self):
+        selection = get_block_selection(
+            {"roi_mask": {"path": self.path, "dataset": "mask"}}
+        )
+        self.assertTrue(selection(daisy.Roi((20, 20, 20), (10, 10, 10))))
+        self.assertTrue(selection(daisy.Roi((15, 15, 15), (10, 10, 10))))
+        self.assertFalse(selection(daisy.Roi((0, 0, 0), (10, 10, 10))))
+        self.assertFalse(selection(daisy.Roi((40, 40, 40), (10, 10, 10))))
+
+    def test_mask_in_source(self):
+        render_config = {"source_path": self.path, "roi_mask": "mask"}
+        self.assertEqual(get_roi_mask_source(render_config), (self.path, "mask"))
+        self.assertIsNotNone(get_block_selection(render_config).mask)
+
+    def test_rois_or_mask(self):
+        selection = get_block_selection(
+            {
+                "rois": [[[0, 0, 0], [5, 5, 5]]],
+                "roi_mask": {"path": self.path, "dataset": "mask"},
+            }
+        )
+        self.assertTrue(selection(daisy.Roi((0, 0, 0), (10, 10, 10))))
+        self.assertTrue(selection(daisy.Roi((30, 30, 30), (10, 10, 10))))
+        self.assertFalse(selection(daisy.Roi((0, 30, 0), (10, 10, 10))))
+
+    def test_saved_selection(self):
+        selection = get_block_selection(
+            {"roi_mask": {"path": self.path, "dataset": "mask"}}
+        )
+        block_order = BlockOrder(
+            self.total_roi, self.block_roi, self.block_roi, select=selection
+        )
+        self.assertEqual(len(block_order), 8)
+        for index in block_order.grid:
+            self.assertTrue(np.all(np.array(index) >= 2))
+
+        path = os.path.join(self.tempdir.name, "orders", "order.npy")
+        block_order.save(path)
+        loaded = BlockOrder(
+            self.total_roi, self.block_roi, self.block_roi, grid=np.load(path)
+        )
+        self.assertEqual(len(loaded), 8)
+        self.assertTrue(np.array_equal(loaded.grid, block_order.grid))
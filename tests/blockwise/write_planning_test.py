@@ -0,0 +1,76 @@
+import unittest
+import daisy
+from raygun.blockwise.write_planning import *
+
+
+class TestPlanOutputRoi(unittest.TestCase):
+    def test_valid_blocks(self):
+        total_roi = daisy.Roi((0, 0, 0), (10, 25, 40))
+        read_roi = daisy.Roi((0, 0, 0), (10, 10, 10))
+        write_roi = daisy.Roi((0, 2, 2), (10, 6, 6))
+        output_roi = plan_output_roi(total_roi, read_roi, write_roi)
+        self.assertEqual(output_roi, daisy.Roi((0, 2, 2), (10, 18, 36)))
+
+    def test_offset(self):
+        total_roi = daisy.Roi((100, 100, 100), (20, 20, 20))
+        read_roi = daisy.Roi((0, 0, 0), (10, 10, 10))
+        output_roi = plan_output_roi(total_roi, read_roi, read_roi)
+        self.assertEqual(output_roi, total_roi)
+
+    def test_too_small(self):
+        with self.assertRaises(ValueError):
+            plan_output_roi(
+                daisy.Roi((0, 0, 0), (5, 5, 5)),
+                daisy.Roi((0, 0, 0), (10, 10, 10)),
+                daisy.Roi((0, 0, 0), (10, 10, 10)),
+            )
+
+
+class TestPlanChunkShape(unittest.TestCase):
+    def setUp(self):
+        self.write_shape = daisy.Coordinate((8, 48, 48))
+        self.voxel_size = daisy.Coordinate((2, 4, 4))
+
+    def test_default(self):
+        self.assertEqual(
+            plan_chunk_shape(self.write_shape, self.voxel_size), self.write_shape
+        )
+
+    def test_tiling(self):
+        chunk_shape = daisy.Coordinate((4, 16, 16))
+        self.assertEqual(
+            plan_chunk_shape(self.write_shape, self.voxel_size, chunk_shape),
+            chunk_shape,
+        )
+
+    def test_gcd(self):
+        with self.assertLogs("raygun.blockwise.write_planning", "WARNING"):
+            planned = plan_chunk_shape(
+                self.write_shape, self.voxel_size, (8, 32, 32), name="pred_affs"
+            )
+        self.assertEqual(planned, daisy.Coordinate((8, 16, 16)))
+        self.assertTrue(all(w % p == 0 for w, p in zip(self.write_shape, planned)))
+
+    def test_offset(self):
+        # Blocks starting 8 voxels into the output, past their context
+        offset = daisy.Coordinate((0, 32, 32))
+        self.assertEqual(
+            plan_chunk_shape(self.write_shape, self.voxel_size, offset=offset),
+            daisy.Coordinate((8, 16, 16)),
+        )
+        self.assertEqual(
+            plan_chunk_shape(
+                self.write_shape, self.voxel_size, (4, 16, 16), offset=offset
+            ),
+            daisy.Coordinate((4, 16, 16)),
+        )
+
+
+class TestPlanWriteSize(unittest.TestCase):
+    def test_default(self):
+        self.assertEqual(plan_write_size((4, 16, 16)), daisy.Coordinate((4, 16, 16)))
+
+    def test_min_shape(self):
+        self.assertEqual(
+            plan_write_size((4, 16, 16), (10, 16, 1)), daisy.Coordinate((12, 16, 16))
+        )
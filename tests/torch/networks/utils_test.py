@@ -0,0 +1,76 @@
+import torch
+import unittest
+from raygun.torch.networks.utils import *
+from raygun.torch.networks.UNet import ConvPass
+from raygun.torch.networks.ResNet import ResnetGenerator2D
+
+
+def randomize_norm_stats(net):
+    for norm in get_norm_layers(net):
+        if norm.running_mean is not None:
+            norm.running_mean.normal_()
+            norm.running_var.uniform_(0.5, 2)
+        if norm.affine:
+            norm.weight.data.normal_()
+            norm.bias.data.normal_()
+
+
+class TestFreezeForInference(unittest.TestCase):
+    def test_fold_batchnorm(self):
+        conv_pass = ConvPass(
+            2, 4, [[3, 3, 3], [3, 3, 3]], "ReLU", norm_layer=torch.nn.BatchNorm3d
+        )
+        randomize_norm_stats(conv_pass)
+        conv_pass.eval()
+        input = torch.randn((2, 2, 12, 12, 12))
+        expected = conv_pass(input)
+
+        freeze_for_inference(conv_pass)
+
+        self.assertEqual(len(get_norm_layers(conv_pass)), 0)
+        self.assertEqual(len(conv_pass.conv_pass), 4)
+        self.assertTrue(torch.allclose(conv_pass(input), expected, atol=1e-5))
+
+    def test_fold_transposed_batchnorm(self):
+        gen = ResnetGenerator2D(norm_layer=torch.nn.BatchNorm2d, n_blocks=2)
+        randomize_norm_stats(gen)
+        gen.eval()
+        input = torch.randn((1, 1, 64, 64))
+        expected = gen(input)
+
+        freeze_for_inference(gen)
+
+        self.assertTrue(torch.allclose(gen(input), expected, atol=1e-4))
+
+    def test_keep_instance_norm(self):
+        # Without running stats, instance norms depend on the input and cannot be folded
+        conv_pass = ConvPass(
+            1, 4, [[3, 3], [3, 3]], "ReLU", norm_layer=torch.nn.InstanceNorm2d
+        )
+        conv_pass.eval()
+        input = torch.randn((1, 1, 16, 16))
+        expected = conv_pass(input)
+
+        freeze_for_inference(conv_pass)
+
+        self.assertEqual(len(get_norm_layers(conv_pass)), 2)
+        self.assertTrue(torch.allclose(conv_pass(input), expected, atol=1e-5))
+
+    def test_fold_frozen_instance_norm(self):
+        norm_layer = lambda nc: torch.nn.InstanceNorm2d(
+            nc, affine=True, track_running_stats=True
+        )
+        conv_pass = ConvPass(1, 4, [[3, 3]], "ReLU", norm_layer=norm_layer)
+        randomize_norm_stats(conv_pass)
+        set_norm_mode(conv_pass, "eval")
+        input = torch.randn((1, 1, 16, 16))
+        expected = conv_pass(input)
+
+        freeze_for_inference(conv_pass)
+
+        self.assertEqual(len(get_norm_layers(conv_pass)), 0)
+        self.assertTrue(torch.allclose(conv_pass(input), expected, atol=1e-5))
+
+
+if __name__ == "__main__":
+    unittest.main()
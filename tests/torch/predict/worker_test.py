@@ -0,0 +1,225 @@
+import logging
+import sys
+import types
+import unittest
+import numpy as np
+import torch
+from raygun.torch.predict.worker import *
+
+
+class TestInputLut(unittest.TestCase):
+    def test_unsigned(self):
+        lut = get_input_lut(np.uint8)
+        self.assertEqual(lut.shape, (256,))
+        self.assertEqual(lut.dtype, np.float32)
+        self.assertEqual(lut[0], 0)
+        self.assertEqual(lut[255], 1)
+
+    def test_signed(self):
+        lut = get_input_lut(np.int16)
+        self.assertEqual(lut.shape, (65536,))
+        values = np.array([-32768, -1, 0, 32767], dtype=np.int16)
+        expected = (values.astype(np.float32) + 32768) / 32767
+        self.assertTrue(np.allclose(lut[values.view(np.uint16)], expected))
+
+    def test_scale_shift(self):
+        lut = get_input_lut(np.uint8, scaleShift_input=(2, -1))
+        self.assertEqual(lut[0], -1)
+        self.assertEqual(lut[255], 1)
+
+    def test_unsupported(self):
+        self.assertIsNone(get_input_lut(np.uint32))
+        self.assertIsNone(get_input_lut(np.float32))
+
+
+class TestPrepareBatch(unittest.TestCase):
+    def test_matches_prepare_input(self):
+        datas = [
+            np.random.randint(0, 256, (4, 6, 8)).astype(np.uint8) for _ in range(2)
+        ]
+        lut = get_input_lut(np.uint8, scaleShift_input=(2, -1))
+        batch = prepare_batch(datas, lut, InputBuffers(), ndims=3)
+
+        self.assertEqual(tuple(batch.shape), (2, 1, 4, 6, 8))
+        for i, data in enumerate(datas):
+            expected = prepare_input(data, np.uint8, 3, scaleShift_input=(2, -1))
+            self.assertTrue(torch.allclose(batch[i : i + 1].cpu(), expected.cpu()))
+
+    def test_2d_sections(self):
+        datas = [np.random.randint(0, 256, (3, 6, 8)).astype(np.uint8)]
+        batch = prepare_batch(datas, get_input_lut(np.uint8), InputBuffers(), ndims=2)
+        self.assertEqual(tuple(batch.shape), (1, 3, 6, 8))
+
+    def test_buffer_rotation(self):
+        buffers = InputBuffers(num_buffers=2)
+        first = buffers.get((1, 4))
+        second = buffers.get((1, 4))
+        self.assertIsNot(first, second)
+        self.assertIs(buffers.get((1, 4)), first)
+        self.assertIsNot(buffers.get((2, 4)), first)
+
+
+class FakeManager:
+    def __init__(self, client, block):
+        self.client = client
+        self.block = block
+
+    def __enter__(self):
+        return self.block
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.block is not None:
+            self.client.released.append((self.block.block_id, exc_type))
+
+
+class FakeClient:
+    def __init__(self, num_blocks):
+        """Hands out `num_blocks` blocks, recording each release with its exception type."""
+        self.blocks = [types.SimpleNamespace(block_id=i) for i in range(num_blocks)]
+        self.released = []
+
+    def acquire_block(self):
+        return FakeManager(self, self.blocks.pop(0) if len(self.blocks) > 0 else None)
+
+
+class TestAcquireBlocks(unittest.TestCase):
+    def test_batch(self):
+        client = FakeClient(5)
+        managers, blocks = acquire_blocks(client, 3)
+        self.assertEqual([block.block_id for block in blocks], [0, 1, 2])
+        self.assertEqual(len(managers), 3)
+        self.assertEqual(client.released, [])
+
+        managers, blocks = acquire_blocks(client, 3)
+        self.assertEqual([block.block_id for block in blocks], [3, 4])
+
+    def test_skip_and_map(self):
+        client = FakeClient(6)
+        map_block = lambda block: types.SimpleNamespace(block_id=block.block_id * 10)
+        skip_block = lambda block: block.block_id % 20 == 0
+        managers, blocks = acquire_blocks(client, 2, skip_block, map_block)
+        self.assertEqual([block.block_id for block in blocks], [10, 30])
+        # Skipped blocks are released right away, as done
+        self.assertEqual(client.released, [(0, None), (2, None)])
+
+
+class TestComputeBatch(unittest.TestCase):
+    def setUp(self):
+        self.logger = logging.getLogger(__name__)
+        self.blocks = [types.SimpleNamespace(block_id=i) for i in range(3)]
+        self.calls = []
+
+    def forward_blocks(self, blocks, data):
+        self.calls.append(len(blocks))
+        if len(blocks) > 1 or blocks[0].block_id == 1:
+            raise RuntimeError("Out of memory.")
+        return (data * 2,)
+
+    def test_batch(self):
+        results = compute_batch(
+            self.blocks, torch.ones(3, 1), lambda blocks, data: (data * 2,), self.logger
+        )
+        self.assertEqual([float(outs[0]) for outs, _ in results], [2.0] * 3)
+        self.assertTrue(all(exc_info is None for _, exc_info in results))
+
+    def test_retry(self):
+        with self.assertLogs(self.logger, "WARNING"):
+            results = compute_batch(
+                self.blocks, torch.ones(3, 1), self.forward_blocks, self.logger
+            )
+        # One batched attempt, then each block on its own
+        self.assertEqual(self.calls, [3, 1, 1, 1])
+        self.assertIsNone(results[1][0])
+        self.assertIs(results[1][1][0], RuntimeError)
+        self.assertEqual(float(results[2][0][0]), 2.0)
+
+    def test_blocks_of_different_shapes(self):
+        inputs = [torch.ones(1, 2), torch.ones(1, 3)]
+        results = compute_batch(
+            self.blocks[:1] + self.blocks[2:], inputs, self.forward_blocks, self.logger
+        )
+        self.assertEqual(self.calls, [1, 1])
+        self.assertEqual([tuple(outs[0].shape) for outs, _ in results], [(1, 2), (1, 3)])
+
+
+class TestRunPipelined(unittest.TestCase):
+    def setUp(self):
+        self.logger = logging.getLogger(__name__)
+        self.written = {}
+        self.fail_forward = set()
+        self.fail_write = set()
+        self.fail_read = set()
+
+    def read_blocks(self, blocks):
+        if any(block.block_id in self.fail_read for block in blocks):
+            raise IOError("Unreadable block.")
+        return torch.tensor([[float(block.block_id)] for block in blocks])
+
+    def forward_blocks(self, blocks, data):
+        if any(block.block_id in self.fail_forward for block in blocks):
+            raise RuntimeError("Forward failed.")
+        return (data * 2,)
+
+    def compute_blocks(self, blocks, inputs):
+        return compute_batch(blocks, inputs, self.forward_blocks, self.logger)
+
+    def write_block(self, block, outs, exc_info=None):
+        if exc_info is not None:
+            return exc_info
+        try:
+            if block.block_id in self.fail_write:
+                raise IOError("Unwritable block.")
+            self.written[block.block_id] = float(outs[0][0, 0])
+        except Exception:
+            return sys.exc_info()
+        return (None, None, None)
+
+    def render(self, num_blocks=10, inference_batch_size=3, queue_depth=2):
+        client = FakeClient(num_blocks)
+        with self.assertLogs(self.logger, "INFO"):
+            run_pipelined(
+                client,
+                inference_batch_size,
+                queue_depth,
+                self.read_blocks,
+                self.compute_blocks,
+                self.write_block,
+                self.logger,
+                log_every=1,
+            )
+        # Every block is released exactly once
+        self.assertEqual(
+            sorted(block_id for block_id, _ in client.released), list(range(num_blocks))
+        )
+        return dict(client.released)
+
+    def test_success(self):
+        released = self.render()
+        self.assertTrue(all(exc_type is None for exc_type in released.values()))
+        self.assertEqual(self.written, {i: 2.0 * i for i in range(10)})
+
+    def test_failed_write(self):
+        self.fail_write = {4}
+        released = self.render()
+        self.assertIs(released.pop(4), OSError)
+        self.assertTrue(all(exc_type is None for exc_type in released.values()))
+        self.assertNotIn(4, self.written)
+        self.assertEqual(len(self.written), 9)
+
+    def test_failed_forward(self):
+        # The batch of blocks 3-5 is retried one block at a time
+        self.fail_forward = {4}
+        released = self.render()
+        self.assertIs(released.pop(4), RuntimeError)
+        self.assertTrue(all(exc_type is None for exc_type in released.values()))
+        self.assertEqual(self.written[3], 6.0)
+        self.assertEqual(self.written[5], 10.0)
+        self.assertNotIn(4, self.written)
+
+    def test_failed_read(self):
+        self.fail_read = {4}
+        released = self.render()
+        for block_id in [3, 4, 5]:
+            self.assertIs(released.pop(block_id), OSError)
+        self.assertTrue(all(exc_type is None for exc_type in released.values()))
+        self.assertEqual(sorted(self.written), [0, 1, 2, 6, 7, 8, 9])